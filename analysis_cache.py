@@ -0,0 +1,121 @@
+import os
+import time
+import hashlib
+import database as db
+
+# Кэш результатов анализа кандидатов (в той же базе hr_assistant.db).
+# Ключ — хэш модели, версии промпта, текста вакансии и текста резюме.
+# Функции синхронные: из async-кода вызывать через db.run(...).
+CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "1") != "0"
+CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(30 * 24 * 3600)))        # секунды
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Счетчики попаданий за время работы процесса
+hits = 0
+misses = 0
+
+def init_cache():
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT,
+            analysis TEXT,
+            size INTEGER,
+            created_at REAL,
+            last_access REAL,
+            hit_count INTEGER DEFAULT 0
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_analysis_cache_access ON analysis_cache (last_access)')
+    conn.commit()
+
+def make_key(model, prompt_version, job_text, resume_text):
+    """Хэш от всех входов анализа. Длины полей входят в хэш, чтобы границы не 'склеивались'."""
+    h = hashlib.sha256()
+    for part in (model, str(prompt_version), job_text or "", resume_text or ""):
+        data = part.encode('utf-8')
+        h.update(str(len(data)).encode() + b':')
+        h.update(data)
+    return h.hexdigest()
+
+def get_analysis(key):
+    """Возвращает сохраненный анализ или None (нет записи, истек TTL или кэш выключен)."""
+    global hits, misses
+    if not CACHE_ENABLED:
+        return None
+
+    now = time.time()
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT analysis, created_at FROM analysis_cache WHERE key = ?', (key,))
+    row = cursor.fetchone()
+
+    if row and now - row[1] > CACHE_TTL:
+        cursor.execute('DELETE FROM analysis_cache WHERE key = ?', (key,))
+        row = None
+    if row:
+        # Обновляем время доступа для LRU
+        cursor.execute('UPDATE analysis_cache SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?', (now, key))
+        hits += 1
+    else:
+        misses += 1
+
+    conn.commit()
+    return row[0] if row else None
+
+def put_analysis(key, model, analysis):
+    """Сохраняет анализ и вытесняет устаревшие и самые давно использованные записи."""
+    if not CACHE_ENABLED or not analysis:
+        return
+
+    now = time.time()
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT OR REPLACE INTO analysis_cache (key, model, analysis, size, created_at, last_access, hit_count)
+        VALUES (?, ?, ?, ?, ?, ?, 0)
+    ''', (key, model, analysis, len(analysis.encode('utf-8')), now, now))
+    _evict(cursor, now)
+    conn.commit()
+
+def _evict(cursor, now):
+    # 1. Истекшие по TTL
+    cursor.execute('DELETE FROM analysis_cache WHERE created_at < ?', (now - CACHE_TTL,))
+    # 2. Лишние по количеству (оставляем самые свежие по last_access)
+    cursor.execute('''
+        DELETE FROM analysis_cache WHERE key IN (
+            SELECT key FROM analysis_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+        )
+    ''', (CACHE_MAX_ENTRIES,))
+    # 3. Лишние по суммарному размеру
+    cursor.execute('''
+        DELETE FROM analysis_cache WHERE key IN (
+            SELECT key FROM (
+                SELECT key, SUM(size) OVER (ORDER BY last_access DESC) AS total
+                FROM analysis_cache
+            ) WHERE total > ?
+        )
+    ''', (CACHE_MAX_BYTES,))
+
+def clear_cache():
+    conn = db.get_connection()
+    conn.execute('DELETE FROM analysis_cache')
+    conn.commit()
+
+def cache_stats():
+    """Счетчики попаданий и текущий размер кэша."""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analysis_cache')
+    entries, size = cursor.fetchone()
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 3) if total else 0.0,
+        "entries": entries,
+        "bytes": size,
+    }
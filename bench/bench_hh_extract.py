@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+# Сравнение адресного извлечения (hh_extract, lxml) с прежним разбором через BeautifulSoup
+# на сохраненных страницах HH: CPU-время и прирост пикового RSS на одну страницу,
+# плюс проверка, что оба способа дают одинаковые поля.
+#   python bench/bench_hh_extract.py [--repeat 20] [--json out.json]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import parse_hh  # noqa: E402
+import hh_fixtures  # noqa: E402
+
+METHODS = {
+    "vacancy": {"lxml": parse_hh._vacancy_fields, "bs4": parse_hh._vacancy_fields_bs4},
+    "resume": {"lxml": parse_hh._resume_fields, "bs4": parse_hh._resume_fields_bs4},
+}
+
+def _kind(name):
+    return "vacancy" if name.startswith("vacancy") else "resume"
+
+def cpu_ms(func, html, repeat):
+    func(html)  # прогрев
+    start = time.process_time()
+    for _ in range(repeat):
+        func(html)
+    return (time.process_time() - start) / repeat * 1000
+
+def _vm_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+
+def _rss_worker(kind, method, html, queue):
+    func = METHODS[kind][method]
+    # Сбрасываем пик RSS (Linux), чтобы не учитывать запуск процесса и передачу страницы
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    before = _vm_kb("VmRSS")
+    func(html)
+    queue.put(_vm_kb("VmHWM") - before)
+
+def peak_rss_kb(kind, method, html):
+    """Прирост пикового RSS за один разбор — в свежем процессе, чтобы замеры не влияли друг на друга."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_rss_worker, args=(kind, method, html, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+def check_parity(kind, html):
+    fast = METHODS[kind]["lxml"](html)
+    slow = METHODS[kind]["bs4"](html)
+    if kind == "resume" and "resume-main-content" not in html:
+        # Без основного блока lxml берет только видимый текст <body>, сравниваем ФИО и телефон
+        return fast[:2] == slow[:2]
+    return fast == slow
+
+def run(repeat):
+    if not parse_hh.hh_extract.available():
+        sys.exit("lxml не установлен")
+    if not os.path.isdir(hh_fixtures.FIXTURES_DIR):
+        hh_fixtures.write_fixtures()
+
+    results = []
+    for name, html in hh_fixtures.load_fixtures():
+        kind = _kind(name)
+        row = {"page": name, "size_kb": round(len(html.encode("utf-8")) / 1024), "parity": check_parity(kind, html)}
+        for method in ("bs4", "lxml"):
+            row[f"{method}_ms"] = round(cpu_ms(METHODS[kind][method], html, repeat), 2)
+            row[f"{method}_rss_kb"] = peak_rss_kb(kind, method, html)
+        row["speedup"] = round(row["bs4_ms"] / row["lxml_ms"], 1) if row["lxml_ms"] else None
+        results.append(row)
+    return results
+
+def print_table(results):
+    header = f"{'страница':<32}{'KB':>6}{'bs4 ms':>9}{'lxml ms':>9}{'x':>6}{'bs4 RSS':>10}{'lxml RSS':>10}  совпадение"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['page']:<32}{r['size_kb']:>6}{r['bs4_ms']:>9}{r['lxml_ms']:>9}{r['speedup']:>6}"
+              f"{r['bs4_rss_kb']:>10}{r['lxml_rss_kb']:>10}  {'да' if r['parity'] else 'НЕТ'}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if not all(r["parity"] for r in results):
+        sys.exit(1)
@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+
+# Офлайн-бенчмарк этапов разбора и оценки на сгенерированном корпусе (bench/corpus.py):
+# PDF с текстовым слоем и сканы, DOCX с таблицами, страницы HH. LLM заменен детерминированным
+# клиентом без сети (fake_openai.FakeClient) за настоящим шлюзом llm.LLMGateway.
+# Каждый этап идет в отдельном процессе: пропускная способность, перцентили задержки одного
+# документа и прирост пикового RSS. Результаты сохраняются в JSON и сравниваются между версиями.
+#   python bench/bench_pipeline.py [--stage pdf_text docx ...] [--repeat 3] [--scale 1] [--json out.json]
+#   python bench/bench_pipeline.py --compare base.json [new.json] [--threshold 0.1]
+#       без new.json сравнивается с прогоном текущей версии; код выхода 1 — есть регрессия
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import corpus  # noqa: E402
+
+# Этап -> (вид документов корпуса, описание)
+STAGES = {
+    "pdf_text": ("text_pdf", "extract_pdf_text: PDF с текстовым слоем"),
+    "pdf_ocr": ("scan_pdf", "extract_pdf_text: сканы, OCR"),
+    "resume_pdf": ("text_pdf", "extract_resume_data_from_pdf: текст + сжатие + LLM"),
+    "docx": ("docx", "extract_resume_data_from_docx"),
+    "hh_vacancy": ("vacancy_html", "extract_vacancy_data"),
+    "hh_resume": ("resume_html", "parse_resume_html"),
+    "analysis_parse": ("analysis", "extract_analysis_data"),
+    "analyze": ("pairs", "analyze_candidate: сжатие + LLM + SQLite"),
+    "rank": ("batches", "rank_resumes: пачки по 8 резюме"),
+}
+
+# Метрики для сравнения: True — чем больше, тем лучше
+COMPARED = {"items_per_s": True, "p50_ms": False, "p95_ms": False, "peak_rss_kb": False}
+# Разница меньше этой по модулю считается шумом
+NOISE = {"items_per_s": 0, "p50_ms": 0.05, "p95_ms": 0.1, "peak_rss_kb": 1024}
+
+
+def _vm_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+
+def _reset_peak():
+    # Сбрасываем пик RSS (Linux), чтобы не учитывать запуск процесса, импорт и загрузку корпуса
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return None
+    return _vm_kb("VmRSS")
+
+def skip_reason(stage):
+    import shutil
+    if stage == "pdf_ocr":
+        missing = [tool for tool in ("tesseract", "pdftoppm") if not shutil.which(tool)]
+        if missing:
+            return f"нет {', '.join(missing)}"
+    return None
+
+def _import_bot(gateway):
+    # Бот импортируется с фиктивными ключами и временной базой; LLM подменяется заглушкой
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:bench")
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="hrbot-bench-"), "bench.db"))
+    import bot
+    bot.llm = gateway
+    return bot
+
+def _texts(seeds):
+    return ["\n".join(corpus.resume_lines(seed, 2 + seed % 6)) for seed in seeds]
+
+def prepare(stage, data, latency):
+    """Возвращает (элементы, функция одного элемента); функция может быть async."""
+    import llm
+    from fake_openai import FakeClient, make_reply
+    gateway = llm.LLMGateway(FakeClient(latency), max_concurrency=16)
+
+    if stage in ("pdf_text", "pdf_ocr"):
+        from pdf_resume_parser import extract_pdf_text
+        return data[STAGES[stage][0]], extract_pdf_text
+    if stage == "resume_pdf":
+        from pdf_resume_parser import extract_resume_data_from_pdf
+        bot = _import_bot(gateway)
+        return data["text_pdf"], lambda pdf: extract_resume_data_from_pdf(pdf, gateway, bot.OCR_SYSTEM_PROMPT)
+    if stage == "docx":
+        from docx_resume_parser import extract_resume_data_from_docx
+        return data["docx"], extract_resume_data_from_docx
+    if stage == "hh_vacancy":
+        from parse_hh import extract_vacancy_data
+        return [(n, html.decode("utf-8")) for n, html in data["vacancy_html"]], extract_vacancy_data
+    if stage == "hh_resume":
+        from parse_hh import parse_resume_html
+        return [(n, html.decode("utf-8")) for n, html in data["resume_html"]], parse_resume_html
+
+    bot = _import_bot(gateway)
+    job = bot.extract_vacancy_data(data["vacancy_html"][0][1].decode("utf-8"))
+    if stage == "analysis_parse":
+        import ranking
+        replies = [make_reply({"messages": [{"role": "user", "content": text}]}) for text in _texts(range(50))]
+        replies += [ranking.to_analysis_text({"quality": i % 10, "fit": i % 7, "experience_years": i, "analysis": text[:500]})
+                    for i, text in enumerate(_texts(range(50)))]
+        return [(f"reply_{i + 1}", r) for i, r in enumerate(replies)], bot.extract_analysis_data
+    if stage == "analyze":
+        bot.db.init_db()
+        bot.analysis_cache.init_cache()
+        pairs = [(f"resume_{i + 1}", text) for i, text in enumerate(_texts(range(8)))]
+        return pairs, lambda resume: bot.analyze_candidate(job, resume, use_cache=False)
+    if stage == "rank":
+        import ranking
+        batches = [(f"batch_{i + 1}", _texts(range(i * 8, i * 8 + 8))) for i in range(4)]
+        return batches, lambda resumes: ranking.rank_resumes(gateway, job, resumes)
+    raise ValueError(stage)
+
+def _measure(stage, scale, repeat, latency, queue):
+    import logging
+    import llm
+    logging.basicConfig(level=logging.ERROR)
+    items, func = prepare(stage, corpus.load_corpus(scale=scale), latency)
+    loop = asyncio.new_event_loop()
+
+    def call(item):
+        result = func(item)
+        return loop.run_until_complete(result) if asyncio.iscoroutine(result) else result
+
+    before = _reset_peak()
+    call(items[0][1])   # прогрев: ленивые импорты, токенизатор, соединения SQLite
+    latencies = []
+    started, cpu_started = time.perf_counter(), time.process_time()
+    for _ in range(repeat):
+        for _, item in items:
+            t = time.perf_counter()
+            call(item)
+            latencies.append(time.perf_counter() - t)
+    seconds, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+    loop.close()
+    queue.put({
+        "n": len(latencies),
+        "seconds": round(seconds, 3),
+        "items_per_s": round(len(latencies) / seconds, 2),
+        "cpu_ms": round(cpu / len(latencies) * 1000, 3),
+        "p50_ms": round(llm.percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(llm.percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(llm.percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+        "peak_rss_kb": _vm_kb("VmHWM") - before if before is not None else None,
+    })
+
+def measure(stage, scale, repeat, latency):
+    """Замер этапа в свежем процессе, чтобы этапы не влияли друг на друга (кэши, пик памяти)."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(stage, scale, repeat, latency, queue))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        return {"error": f"код выхода {proc.exitcode}"}
+    return queue.get()
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run(args):
+    corpus.write_corpus(scale=args.scale)
+    results = {}
+    for stage in args.stage:
+        reason = skip_reason(stage)
+        if reason:
+            results[stage] = {"skipped": reason}
+        else:
+            results[stage] = measure(stage, args.scale, args.repeat, args.llm_latency)
+        print_row(stage, results[stage])
+    return {
+        "meta": {
+            "rev": _git_rev(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "scale": args.scale,
+            "repeat": args.repeat,
+            "llm_latency": args.llm_latency,
+        },
+        "stages": results,
+    }
+
+def print_header():
+    header = f"{'этап':<16}{'n':>6}{'шт/с':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'CPU ms':>10}{'RSS KB':>10}"
+    print(header)
+    print("-" * len(header))
+
+def print_row(stage, r):
+    if "skipped" in r or "error" in r:
+        print(f"{stage:<16}  пропущен: {r.get('skipped') or r.get('error')}")
+        return
+    print(f"{stage:<16}{r['n']:>6}{r['items_per_s']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+          f"{r['cpu_ms']:>10}{str(r['peak_rss_kb']):>10}", flush=True)
+
+def compare(base, new, threshold):
+    """Печатает изменения по этапам; возвращает список регрессий сильнее threshold (доля)."""
+    regressions = []
+    print(f"{'этап':<16}{'метрика':<14}{'было':>12}{'стало':>12}{'изм.':>9}")
+    for stage, old in base["stages"].items():
+        current = new["stages"].get(stage)
+        if not current or "n" not in old or "n" not in current:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            a, b = old.get(metric), current.get(metric)
+            if a is None or b is None:
+                continue
+            change = (b - a) / a if a else 0.0
+            worse = change < -threshold if higher_is_better else change > threshold
+            worse = worse and abs(b - a) > NOISE[metric]
+            if worse:
+                regressions.append((stage, metric, a, b))
+            print(f"{stage:<16}{metric:<14}{a:>12}{b:>12}{change:>+9.1%}{'  регрессия' if worse else ''}")
+    return regressions
+
+def _load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stage", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3, help="проходов по документам этапа")
+    parser.add_argument("--scale", type=int, default=1, help="множитель размера корпуса")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="задержка ответа заглушки LLM, секунды")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    parser.add_argument("--compare", nargs="+", metavar="JSON", help="base.json [new.json]")
+    parser.add_argument("--threshold", type=float, default=0.1, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare принимает один или два файла")
+    if args.compare and len(args.compare) == 2:
+        results = _load(args.compare[1])
+    else:
+        print_header()
+        results = run(args)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        print()
+        regressions = compare(_load(args.compare[0]), results, args.threshold)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,201 @@
+import os
+import io
+import random
+
+import hh_fixtures
+from hh_fixtures import WORDS, CITIES, POSITIONS, NAMES
+
+# Генератор корпуса для офлайн-бенчмарка (bench/bench_pipeline.py): PDF с текстовым слоем,
+# сканы (PDF из картинок), DOCX с таблицами и страницы HH. Содержимое детерминировано (seed),
+# файлы пишутся в bench/fixtures/corpus и в репозиторий не входят.
+#   python bench/corpus.py [--scale 1]
+# PDF собирается вручную: PDF-библиотек в зависимостях нет, а для pdfplumber достаточно
+# текстового слоя. Кириллица кодируется через /Differences с именами глифов (afii100xx):
+# pdfplumber извлекает ее как обычный текст, хотя Helvetica кириллицу не рисует.
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "corpus")
+
+_LETTERS = "АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯабвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+_EXTRA = {"№": "numero", "—": "emdash", "«": "guillemotleft", "»": "guillemotright"}
+
+
+def _glyph(ch):
+    if ch in "Ёё":
+        return "afii10023" if ch == "Ё" else "afii10071"
+    code = ord(ch)
+    base, first = (10017, 0x410) if code < 0x430 else (10065, 0x430)
+    # В нумерации afii буква Ё стоит после Е
+    return f"afii{base + code - first + (1 if code - first >= 6 else 0)}"
+
+_CODES = {ch: 128 + i for i, ch in enumerate(list(_LETTERS) + list(_EXTRA))}
+_GLYPHS = [_glyph(ch) for ch in _LETTERS] + list(_EXTRA.values())
+
+def _pdf_string(text):
+    out = bytearray()
+    for ch in text:
+        if ch in _CODES:
+            out.append(_CODES[ch])
+        elif ch in "()\\":
+            out += b"\\" + ch.encode()
+        elif ord(ch) < 128:
+            out += ch.encode()
+        else:
+            out += b"?"
+    return b"(" + bytes(out) + b")"
+
+def _wrap(text, width=90):
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    return lines + ([line] if line else [])
+
+def text_pdf(pages):
+    """PDF с текстовым слоем: pages — список страниц, каждая — список строк."""
+    font = (
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding << /Type /Encoding "
+        b"/BaseEncoding /WinAnsiEncoding /Differences [128 " + " ".join("/" + g for g in _GLYPHS).encode()
+        + b"] >> /FirstChar 32 /LastChar 255 /Widths [" + b" ".join([b"556"] * 224) + b"] >>"
+    )
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, font]
+    kids = []
+    for lines in pages:
+        content = b"BT /F1 10 Tf 40 800 Td 13 TL " + b" ".join(_pdf_string(line) + b" '" for line in lines) + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+                       b"/Contents %d 0 R >>" % (len(objects)))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids) + b"] /Count %d >>" % len(kids)
+
+    pdf, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1) + b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+def scanned_pdf(pages, dpi=150):
+    """PDF из картинок страниц — как скан без текстового слоя."""
+    from PIL import Image, ImageDraw, ImageFont
+    font = ImageFont.load_default(size=dpi // 8)
+    images = []
+    for lines in pages:
+        image = Image.new("L", (dpi * 827 // 100, dpi * 1169 // 100), 255)
+        draw = ImageDraw.Draw(image)
+        for i, line in enumerate(lines):
+            # Встроенный шрифт Pillow без кириллицы: на скане транслит, важны объем и размер страницы
+            draw.text((dpi // 2, dpi // 2 + i * dpi // 5), _translit(line), fill=0, font=font)
+        images.append(image)
+    out = io.BytesIO()
+    images[0].save(out, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+    return out.getvalue()
+
+_TRANSLIT = dict(zip("абвгдеёжзийклмнопрстуфхцчшщъыьэюя",
+                     ["a", "b", "v", "g", "d", "e", "e", "zh", "z", "i", "y", "k", "l", "m", "n", "o", "p", "r", "s", "t",
+                      "u", "f", "kh", "ts", "ch", "sh", "sch", "", "y", "", "e", "yu", "ya"]))
+
+def _translit(text):
+    return "".join(_TRANSLIT.get(ch.lower(), ch).capitalize() if ch.isupper() and ch.lower() in _TRANSLIT
+                   else _TRANSLIT.get(ch, ch) for ch in text)
+
+def _sentence(rnd, words):
+    return hh_fixtures._text(rnd, words)
+
+def resume_lines(seed, jobs=4):
+    """Резюме в виде строк: шапка, опыт по местам работы, навыки, образование."""
+    rnd = random.Random(seed)
+    lines = [f"ФИО: {rnd.choice(NAMES)}", f"Телефон: +7 9{rnd.randrange(10, 99)} {rnd.randrange(100, 999)}-"
+             f"{rnd.randrange(10, 99)}-{rnd.randrange(10, 99)}", f"Город: {rnd.choice(CITIES)}",
+             f"Желаемая должность: {rnd.choice(POSITIONS)}", "", "Опыт работы"]
+    year = 2025
+    for _ in range(jobs):
+        start = year - rnd.randrange(1, 5)
+        lines += ["", f"{start} — {year}: ООО «{rnd.choice(WORDS).capitalize()} {rnd.choice(WORDS).capitalize()}»",
+                  rnd.choice(POSITIONS)]
+        lines += _wrap(_sentence(rnd, rnd.randrange(60, 140)))
+        year = start
+    lines += ["", "Навыки", ", ".join(rnd.sample(WORDS, 12)), "", "Образование",
+              f"{year - 5} — {year}: Университет, {rnd.choice(WORDS)}", "", "О себе"] + _wrap(_sentence(rnd, 80))
+    return lines
+
+def paginate(lines, per_page=55):
+    return [lines[i:i + per_page] for i in range(0, len(lines), per_page)] or [[]]
+
+def docx_with_tables(seed, jobs=4):
+    """DOCX-резюме: абзацы и таблицы (опыт работы, навыки) — как выгрузки из кадровых систем."""
+    from docx import Document
+    rnd = random.Random(seed)
+    doc = Document()
+    doc.add_heading(rnd.choice(NAMES), 0)
+    doc.add_paragraph(f"Телефон: +7 9{rnd.randrange(10, 99)} {rnd.randrange(100, 999)}-{rnd.randrange(10, 99)}-"
+                      f"{rnd.randrange(10, 99)}  Город: {rnd.choice(CITIES)}")
+    doc.add_heading("Опыт работы", 1)
+    table = doc.add_table(rows=1, cols=4)
+    for cell, title in zip(table.rows[0].cells, ("Период", "Компания", "Должность", "Обязанности")):
+        cell.text = title
+    year = 2025
+    for _ in range(jobs):
+        start = year - rnd.randrange(1, 5)
+        row = table.add_row().cells
+        row[0].text = f"{start} — {year}"
+        row[1].text = f"ООО «{rnd.choice(WORDS).capitalize()}»"
+        row[2].text = rnd.choice(POSITIONS)
+        row[3].text = _sentence(rnd, rnd.randrange(40, 100))
+        year = start
+    doc.add_heading("Навыки", 1)
+    skills = doc.add_table(rows=0, cols=2)
+    for skill in rnd.sample(WORDS, 8):
+        row = skills.add_row().cells
+        row[0].text = skill
+        row[1].text = rnd.choice(("базовый", "уверенный", "эксперт"))
+    doc.add_heading("О себе", 1)
+    doc.add_paragraph(_sentence(rnd, 80))
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+def corpus_spec(scale=1):
+    """Имя файла -> функция, создающая содержимое. scale умножает число документов каждого вида."""
+    spec = {}
+    for i in range(4 * scale):
+        jobs = (2, 4, 8, 16)[i % 4]     # от одной до нескольких страниц
+        spec[f"text_{i + 1}.pdf"] = lambda i=i, jobs=jobs: text_pdf(paginate(resume_lines(i, jobs)))
+    for i in range(2 * scale):
+        spec[f"scan_{i + 1}.pdf"] = lambda i=i: scanned_pdf(paginate(resume_lines(100 + i, 2 + 2 * (i % 2)))[:2])
+    for i in range(4 * scale):
+        spec[f"tables_{i + 1}.docx"] = lambda i=i: docx_with_tables(200 + i, (2, 4, 8, 12)[i % 4])
+    for i in range(2 * scale):
+        spec[f"vacancy_{i + 1}.html"] = lambda i=i: hh_fixtures.vacancy_page(300 + i).encode("utf-8")
+        spec[f"resume_{i + 1}.html"] = lambda i=i: hh_fixtures.resume_page(400 + i).encode("utf-8")
+    return spec
+
+def write_corpus(directory=CORPUS_DIR, scale=1):
+    os.makedirs(directory, exist_ok=True)
+    for name, make in corpus_spec(scale).items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(make())
+    return directory
+
+def load_corpus(directory=CORPUS_DIR, scale=1):
+    """Вид документа ("text_pdf", "scan_pdf", "docx", "vacancy_html", "resume_html") -> [(имя, байты)]."""
+    write_corpus(directory, scale)
+    kinds = {"text": "text_pdf", "scan": "scan_pdf", "tables": "docx", "vacancy": "vacancy_html", "resume": "resume_html"}
+    corpus = {kind: [] for kind in kinds.values()}
+    for name in sorted(corpus_spec(scale)):
+        with open(os.path.join(directory, name), "rb") as f:
+            corpus[kinds[name.split("_")[0]]].append((name, f.read()))
+    return corpus
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=1)
+    print(write_corpus(scale=parser.parse_args().scale))
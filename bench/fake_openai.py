@@ -0,0 +1,211 @@
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+from types import SimpleNamespace
+from collections import Counter
+from aiohttp import web
+
+# Заглушка OpenAI-совместимого API (chat completions, в том числе потоковый ответ) с внедрением
+# задержек и ошибок — для проверки таймаутов, повторов, предохранителя и дублирования (llm.py).
+# Бот направляется сюда через OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+#   python bench/fake_openai.py [--port 8082] [--latency 0.3] [--slow-rate 0.05 --slow-latency 20]
+#                               [--error-rate 0.1] [--rate-limit-rate 0.05]
+#       POST /config — изменить параметры на ходу (JSON с теми же именами, что у аргументов)
+#       GET  /stats  — число запросов по исходам
+#       POST /reset  — обнулить счетчики
+# Ответ правдоподобен для бота: анализ кандидата с оценками, JSON пакетной оценки
+# (ranking.py) или резюме в markdown для распознавания PDF.
+# FakeClient — те же ответы без HTTP, для офлайн-бенчмарков (bench/bench_pipeline.py).
+
+DEFAULTS = {
+    "latency": 0.3,           # секунды до ответа (до первого фрагмента для потока)
+    "jitter": 0.2,            # доля случайного разброса задержки
+    "slow_rate": 0.0,         # доля медленных ответов (хвост распределения)
+    "slow_latency": 20.0,
+    "error_rate": 0.0,        # доля ответов 500
+    "rate_limit_rate": 0.0,   # доля ответов 429
+    "retry_after": 1.0,       # заголовок Retry-After для 429
+    "outage": False,          # все запросы — 503
+    "chunk_delay": 0.02,      # пауза между фрагментами потокового ответа
+    "chunks": 20,
+}
+
+ANALYSIS_REPLY = (
+    "АНАЛИЗ: Кандидат соответствует основным требованиям вакансии, опыт за последние годы релевантен.\n"
+    "КАЧЕСТВО_Р: {quality}\nОБЩЕЕ_С: {fit}\nОБЩИЙ_СТАЖ: {years}"
+)
+RESUME_REPLY = (
+    "# ФИО: Тестов Тест Тестович\n**Телефон:** +7 900 000-00-00\n\n## Опыт работы\n"
+    "Ведущий специалист, 2019 — настоящее время. Сопровождение расчетов, отчетность, автоматизация процессов."
+)
+VACANCY_REPLY = (
+    "Вакансия: Ведущий специалист\n\nОбязанности:\n- сопровождение расчетов;\n- подготовка отчетности;\n"
+    "- автоматизация процессов.\n\nТребования:\n- опыт работы от 3 лет."
+)
+
+
+def make_reply(body):
+    """Текст ответа по виду запроса."""
+    messages = body.get("messages") or []
+    text = " ".join(m["content"] if isinstance(m.get("content"), str) else json.dumps(m.get("content"), ensure_ascii=False)
+                    for m in messages)
+    rnd = random.Random(len(text))
+    candidates = sorted({int(n) for n in re.findall(r"### Кандидат (\d+)", text)})
+    if candidates and (body.get("response_format") or {}).get("type") == "json_object":
+        return json.dumps({"candidates": [
+            {"id": n, "quality": rnd.randint(3, 9), "fit": rnd.randint(2, 10), "experience_years": rnd.randint(1, 15),
+             "analysis": "Опыт частично совпадает с требованиями вакансии."}
+            for n in candidates
+        ]}, ensure_ascii=False)
+    if "Текст резюме:" in text:
+        # Структурированное резюме зависит от исходного текста, иначе разные файлы дали бы общий кэш анализа
+        return f"{RESUME_REPLY}\n\n## Данные резюме\n{text.split('Текст резюме:', 1)[1].strip()[:1500]}"
+    if "image_url" in text:
+        return RESUME_REPLY
+    if "Сформируй вакансию" in text or "Вот резюме для анализа" in text:
+        return VACANCY_REPLY
+    return ANALYSIS_REPLY.format(quality=rnd.randint(3, 9), fit=rnd.randint(2, 10), years=rnd.randint(1, 15))
+
+def usage(body, reply):
+    prompt = sum(len(str(m.get("content", ""))) for m in body.get("messages") or []) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": len(reply) // 4, "total_tokens": prompt + len(reply) // 4}
+
+class _Stream:
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self):
+        pass
+
+class FakeClient:
+    """
+    Детерминированный клиент в духе openai.AsyncOpenAI: client.chat.completions.create(...)
+    отвечает make_reply без сети. latency — фиксированная задержка ответа, секунды.
+    """
+
+    def __init__(self, latency=0.0, chunks=DEFAULTS["chunks"]):
+        self.latency = latency
+        self.chunks = chunks
+        self.requests = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **body):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        reply = make_reply(body)
+        tokens = SimpleNamespace(**usage(body, reply))
+        if not body.get("stream"):
+            message = SimpleNamespace(role="assistant", content=reply)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=tokens)
+        size = max(1, -(-len(reply) // self.chunks))
+        chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=reply[i:i + size]))], usage=None)
+                  for i in range(0, len(reply), size)]
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunks.append(SimpleNamespace(choices=[], usage=tokens))
+        return _Stream(chunks)
+
+def make_app(**config):
+    app = web.Application()
+    app["config"] = {**DEFAULTS, **config}
+    app["calls"] = Counter()
+
+    def error(status, message, headers=None):
+        return web.json_response({"error": {"message": message, "type": "fake_error", "code": status}},
+                                 status=status, headers=headers)
+
+    async def completions(request):
+        cfg = app["config"]
+        body = await request.json()
+        app["calls"]["requests"] += 1
+        if cfg["outage"]:
+            app["calls"]["503"] += 1
+            return error(503, "service unavailable")
+        roll = random.random()
+        if roll < cfg["error_rate"]:
+            app["calls"]["500"] += 1
+            await asyncio.sleep(cfg["latency"] * random.random())
+            return error(500, "internal error")
+        if roll < cfg["error_rate"] + cfg["rate_limit_rate"]:
+            app["calls"]["429"] += 1
+            return error(429, "rate limit exceeded", {"Retry-After": str(cfg["retry_after"])})
+
+        slow = random.random() < cfg["slow_rate"]
+        delay = cfg["slow_latency"] if slow else cfg["latency"] * (1 + cfg["jitter"] * (2 * random.random() - 1))
+        app["calls"]["slow" if slow else "ok"] += 1
+        await asyncio.sleep(delay)
+
+        reply = make_reply(body)
+        model = body.get("model", "gpt-4o-mini")
+        completion_id = f"chatcmpl-{app['calls']['requests']}"
+        if not body.get("stream"):
+            return web.json_response({
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage(body, reply),
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        size = max(1, -(-len(reply) // cfg["chunks"]))
+        try:
+            await response.prepare(request)
+            for i in range(0, len(reply), size):
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                         "choices": [{"index": 0, "delta": {"content": reply[i:i + size]}, "finish_reason": None}]}
+                await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+                await asyncio.sleep(cfg["chunk_delay"])
+            done = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            await response.write(f"data: {json.dumps(done)}\n\n".encode())
+            if (body.get("stream_options") or {}).get("include_usage"):
+                final = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                         "choices": [], "usage": usage(body, reply)}
+                await response.write(f"data: {json.dumps(final)}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except ConnectionResetError:
+            # Клиент закрыл соединение (таймаут или проигравший дубль)
+            app["calls"]["aborted"] += 1
+        return response
+
+    async def configure(request):
+        app["config"].update(await request.json())
+        return web.json_response(app["config"])
+
+    async def stats(request):
+        return web.json_response(dict(app["calls"]))
+
+    async def reset(request):
+        app["calls"].clear()
+        return web.json_response({})
+
+    app.router.add_post("/v1/chat/completions", completions)
+    app.router.add_post("/config", configure)
+    app.router.add_get("/stats", stats)
+    app.router.add_post("/reset", reset)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8082)
+    for name, value in DEFAULTS.items():
+        if isinstance(value, bool):
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name, action="store_true")
+        else:
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=type(value), default=value)
+    args = vars(parser.parse_args())
+    port = args.pop("port")
+    web.run_app(make_app(**args), host="127.0.0.1", port=port, print=None)
@@ -0,0 +1,74 @@
+import os
+import time
+import argparse
+from collections import Counter
+from aiohttp import web
+
+# Заглушка Telegram Bot API для нагрузочных тестов: отвечает на методы бота правдоподобными
+# объектами и считает вызовы. Бот направляется сюда через TELEGRAM_API_URL=http://127.0.0.1:<port>
+#   python bench/fake_telegram.py [--port 8081] [--files DIR]
+#       GET  /stats — число вызовов по методам
+#       POST /reset — обнулить счетчики
+# Файлы для скачивания ботом (getFile) берутся из каталога --files: file_id — имя файла.
+
+def make_app(files_dir=None):
+    app = web.Application()
+    app["calls"] = Counter()
+    app["message_id"] = [0]
+
+    def message(params):
+        app["message_id"][0] += 1
+        return {
+            "message_id": int(params.get("message_id") or app["message_id"][0]),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id") or 0), "type": "private"},
+            "text": params.get("text", ""),
+        }
+
+    async def method(request):
+        name = request.match_info["method"]
+        params = dict(await request.post())
+        app["calls"][name] += 1
+        lowered = name.lower()
+        if lowered.startswith(("send", "edit", "copy", "forward")):
+            result = message(params)
+        elif lowered == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "HR bot", "username": "hr_test_bot"}
+        elif lowered == "getfile":
+            path = os.path.join(files_dir or "", os.path.basename(params.get("file_id", "")))
+            if not files_dir or not os.path.isfile(path):
+                return web.json_response({"ok": False, "error_code": 400, "description": "Bad Request: invalid file_id"},
+                                         status=400)
+            result = {"file_id": params["file_id"], "file_unique_id": params["file_id"],
+                      "file_size": os.path.getsize(path), "file_path": f"documents/{os.path.basename(path)}"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def download(request):
+        app["calls"]["download"] += 1
+        path = os.path.join(files_dir or "", os.path.basename(request.match_info["path"]))
+        if not files_dir or not os.path.isfile(path):
+            raise web.HTTPNotFound()
+        return web.FileResponse(path)
+
+    async def stats(request):
+        return web.json_response(dict(app["calls"]))
+
+    async def reset(request):
+        app["calls"].clear()
+        return web.json_response({})
+
+    app.router.add_post("/bot{token}/{method}", method)
+    app.router.add_get("/file/bot{token}/{path:.+}", download)
+    app.router.add_get("/stats", stats)
+    app.router.add_post("/reset", reset)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--files", help="каталог файлов для getFile")
+    args = parser.parse_args()
+    web.run_app(make_app(args.files), host="127.0.0.1", port=args.port, print=None)
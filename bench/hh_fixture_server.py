@@ -0,0 +1,133 @@
+import os
+import sys
+import time
+import asyncio
+import hashlib
+import argparse
+import tempfile
+from aiohttp import web
+
+# Локальный HTTP-сервер со страницами в формате HH — для проверки обхода выдачи (crawler.py) без сети.
+#   python bench/hh_fixture_server.py [--port 8089] [--pages 5] [--per-page 20] [--latency 50]
+#       /search/resume?page=N                         — поиск резюме
+#       /employer/vacancyresponses?vacancyId=1&page=N — отклики на вакансию
+#       /resume/<id>                                  — страница резюме
+#       /vacancy/<n>                                  — страница вакансии
+#   python bench/hh_fixture_server.py --check
+#       обход на временной БД: прерывание посередине, продолжение с контрольной точки
+#       и проверка, что каждое резюме сохранено ровно один раз (GPT заменен детерминированной оценкой)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import hh_fixtures  # noqa: E402
+
+OVERLAP = 3  # как на HH: при сдвиге выдачи часть резюме повторяется на следующей странице
+
+def page_ids(page, per_page):
+    start = max(0, page * per_page - OVERLAP)
+    return [hashlib.md5(str(i).encode()).hexdigest() for i in range(start, (page + 1) * per_page)]
+
+def make_app(pages=5, per_page=20, latency=0.05):
+    app = web.Application()
+    app["stats"] = {"resume_hits": 0, "vacancy_hits": 0}
+
+    def listing(responses):
+        async def handler(request):
+            page = int(request.query.get("page", "0"))
+            if page >= pages:
+                raise web.HTTPNotFound()
+            query = dict(request.query)
+            query["page"] = str(page + 1)
+            next_href = str(request.rel_url.with_query(query)) if page + 1 < pages else None
+            html = hh_fixtures.search_page(page_ids(page, per_page), next_href, seed=page, responses=responses)
+            return web.Response(text=html, content_type="text/html")
+        return handler
+
+    async def resume(request):
+        app["stats"]["resume_hits"] += 1
+        await asyncio.sleep(latency)
+        html = hh_fixtures.resume_page(seed=int(request.match_info["rid"][:8], 16))
+        return web.Response(text=html, content_type="text/html")
+
+    app.router.add_get("/search/resume", listing(False))
+    app.router.add_get("/employer/vacancyresponses", listing(True))
+    async def vacancy(request):
+        app["stats"]["vacancy_hits"] += 1
+        await asyncio.sleep(latency)
+        return web.Response(text=hh_fixtures.vacancy_page(seed=int(request.match_info["vid"])), content_type="text/html")
+
+    app.router.add_get("/resume/{rid}", resume)
+    app.router.add_get("/vacancy/{vid:\\d+}", vacancy)
+    return app
+
+async def check(args):
+    tmp = tempfile.mkdtemp(prefix="hh_crawl_")
+    # Модули проекта читают настройки при импорте
+    os.environ["DB_PATH"] = os.path.join(tmp, "crawl.db")
+    os.environ["HH_CACHE_DIR"] = os.path.join(tmp, "cache")
+    os.environ.setdefault("HH_RATE", "200")
+    os.environ.setdefault("HH_BURST", "20")
+    import database as db
+    import crawler
+    import hh_client
+    from parse_hh import resume_id
+
+    app = make_app(args.pages, args.per_page, args.latency / 1000)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    url = f"http://127.0.0.1:{args.port}/employer/vacancyresponses?vacancyId=1&page=0"
+    expected = {rid for page in range(args.pages) for rid in page_ids(page, args.per_page)}
+
+    async def evaluate(job, resume):
+        await asyncio.sleep(0.01)
+        name = resume.splitlines()[0].replace("# ФИО: ", "")
+        return name, "+7", "7/10", "6/10", "5", "Оценка для проверки"
+
+    db.init_db()
+    db.save_vacancy("Проверка обхода", "Описание")
+    job_id = db.create_crawl_job(url, "Проверка обхода", "Описание")
+    started = time.perf_counter()
+    try:
+        # 1. Прерываем обход, когда сохранена примерно треть резюме
+        task = asyncio.create_task(crawler.run_crawl(job_id, evaluate))
+        while db.crawl_job_counts(job_id)["done"] < len(expected) // 3:
+            await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        interrupted = db.crawl_job_counts(job_id)
+        pages_before = db.get_crawl_job(job_id)[7]
+
+        # 2. Продолжаем с контрольной точки
+        state, counts = await crawler.run_crawl(job_id, evaluate)
+    finally:
+        await hh_client.close_client()
+        await runner.cleanup()
+    elapsed = time.perf_counter() - started
+
+    rows = db.get_connection().execute("SELECT resume_url FROM candidates").fetchall()
+    saved = [resume_id(row[0]) for row in rows]
+    print(f"страниц: {args.pages}, уникальных резюме: {len(expected)}")
+    print(f"прервано на: {interrupted} (страниц пройдено: {pages_before})")
+    print(f"после продолжения: {counts}, статус задания: {db.get_crawl_job(job_id)[6]}")
+    print(f"кандидатов: {len(saved)}, без повторов: {len(set(saved))}, "
+          f"запросов резюме к серверу: {app['stats']['resume_hits']}, время: {elapsed:.2f} с")
+    db.close_all()
+    ok = sorted(saved) == sorted(expected) and counts["done"] == len(expected)
+    print("OK" if ok else "ОШИБКА")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--per-page", type=int, default=20)
+    parser.add_argument("--latency", type=int, default=50, help="задержка ответа страниц резюме и вакансий, мс")
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if asyncio.run(check(args)) else 1)
+    web.run_app(make_app(args.pages, args.per_page, args.latency / 1000), host="127.0.0.1", port=args.port)
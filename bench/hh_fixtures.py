@@ -0,0 +1,201 @@
+import os
+import sys
+import gzip
+import json
+import random
+import html as html_lib
+
+# Генератор HTML-фикстур, повторяющих структуру страниц hh.ru: большой <head> со стилями
+# и скриптами, JSON состояния приложения, навигация, нужные data-qa блоки и «похожие» карточки.
+# Результат детерминирован (seed), файлы сохраняются сжатыми в bench/fixtures/hh.
+#   python bench/hh_fixtures.py
+# Сохраненные из браузера реальные страницы HH можно положить туда же (vacancy_*.html, resume_*.html).
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "hh")
+
+WORDS = (
+    "опыт разработка команда проект клиент продажи аналитика отчетность сервис "
+    "бизнес процесс задача решение поддержка внедрение управление качество данные "
+    "система интеграция требования документация заказчик рынок стратегия бюджет "
+    "развитие обучение коммуникация переговоры планирование контроль результат "
+    "Python SQL Excel CRM 1С Jira Confluence Docker Linux API REST PostgreSQL"
+).split()
+CITIES = ["Москва", "Санкт-Петербург", "Казань", "Новосибирск", "Екатеринбург", "Удаленно"]
+POSITIONS = ["Менеджер по продажам", "Python-разработчик", "Аналитик данных", "HR-менеджер",
+             "Бухгалтер", "Руководитель проекта", "Инженер поддержки", "Маркетолог"]
+NAMES = ["Иванов Иван Иванович", "Петрова Анна Сергеевна", "Смирнов Алексей Петрович",
+         "Кузнецова Мария Олеговна", "Попов Дмитрий Андреевич"]
+
+
+def _text(rnd, words):
+    return " ".join(rnd.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def _head(rnd, title):
+    parts = [f"<title>{html_lib.escape(title)} — работа на hh.ru</title>", '<meta charset="utf-8">']
+    for i in range(40):
+        parts.append(f'<meta name="meta-{i}" content="{_text(rnd, 6)}">')
+        parts.append(f'<link rel="preload" href="https://i.hh.ru/styles/chunk-{i}.css" as="style">')
+    for i in range(6):
+        rules = "".join(f".magritte-{i}-{j}{{margin:{j}px;padding:{j % 7}px;color:#{j:06x}}}" for j in range(400))
+        parts.append(f"<style>{rules}</style>")
+    for i in range(8):
+        body = ";".join(f"window.__chunk{i}_{j}=function(a,b){{return a+b*{j}}}" for j in range(150))
+        parts.append(f"<script>{body}</script>")
+    return "<head>" + "".join(parts) + "</head>"
+
+def _initial_state(rnd, size):
+    # Как у HH: состояние приложения целиком лежит в странице JSON-ом
+    state = {"items": [], "config": {"lang": "RU", "area": rnd.choice(CITIES)}}
+    total = 0
+    while total < size:
+        item = {
+            "id": rnd.randrange(10 ** 8),
+            "name": rnd.choice(POSITIONS),
+            "snippet": _text(rnd, 25),
+            "tags": [rnd.choice(WORDS) for _ in range(8)],
+        }
+        state["items"].append(item)
+        total += len(json.dumps(item, ensure_ascii=False))
+    return ('<template id="HH-Lux-InitialState">'
+            f'{html_lib.escape(json.dumps(state, ensure_ascii=False))}</template>')
+
+def _navigation(rnd):
+    links = "".join(
+        f'<li class="supernova-nav-item"><a data-qa="nav-link-{i}" href="/catalog/{i}">'
+        f'{rnd.choice(WORDS)}</a></li>' for i in range(200)
+    )
+    return f'<header class="supernova"><nav><ul>{links}</ul></nav></header>'
+
+def _cards(rnd, count, prefix):
+    cards = []
+    for i in range(count):
+        cards.append(
+            f'<div class="serp-item" data-qa="{prefix}-item">'
+            f'<a data-qa="{prefix}-title" href="/{prefix}/{rnd.randrange(10 ** 8)}">{rnd.choice(POSITIONS)}</a>'
+            f'<span data-qa="{prefix}-compensation">от {rnd.randrange(50, 400)} 000 ₽</span>'
+            f'<div class="snippet"><p>{_text(rnd, 30)}</p><p>{_text(rnd, 30)}</p></div></div>'
+        )
+    return "".join(cards)
+
+def _footer(rnd):
+    columns = "".join(f'<div class="footer-col"><p>{_text(rnd, 40)}</p></div>' for _ in range(12))
+    scripts = "".join(f'<script src="https://i.hh.ru/js/bundle-{i}.js"></script>' for i in range(20))
+    return f"<footer>{columns}</footer>{scripts}"
+
+def vacancy_page(seed=1):
+    rnd = random.Random(seed)
+    title = rnd.choice(POSITIONS)
+    duties = "".join(f"<li>{_text(rnd, 14)}</li>" for _ in range(10))
+    needs = "".join(f"<li>{_text(rnd, 12)}</li>" for _ in range(8))
+    description = (
+        f'<div class="g-user-content" data-qa="vacancy-description">'
+        f"<p><strong>О компании</strong></p><p>{_text(rnd, 60)}</p>"
+        f"<p><strong>Обязанности:</strong></p><ul>{duties}</ul>"
+        f"<p><strong>Требования:</strong></p><ul>{needs}</ul>"
+        f"<p>Условия: {_text(rnd, 40)}<br>График: полный день<br>Город: {rnd.choice(CITIES)}</p>"
+        f"<!-- blocked: {_text(rnd, 5)} --></div>"
+    )
+    main = (
+        f'<div class="vacancy-title"><h1 data-qa="vacancy-title"><span>{title}</span></h1>'
+        f'<span data-qa="vacancy-salary">от {rnd.randrange(60, 300)} 000 ₽ на руки</span></div>'
+        f'<div class="vacancy-company"><a data-qa="vacancy-company-name" href="/employer/{rnd.randrange(10 ** 6)}">'
+        f'<span>ООО «{rnd.choice(WORDS).capitalize()}»</span></a></div>'
+        f"{description}"
+        f'<div data-qa="skills-element">{"".join(f"<span>{w}</span>" for w in rnd.sample(WORDS, 10))}</div>'
+    )
+    body = (
+        _navigation(rnd)
+        + f'<main><div class="bloko-column">{main}</div>'
+        + f'<aside><h2>Похожие вакансии</h2>{_cards(rnd, 40, "vacancy-serp")}</aside></main>'
+        + _initial_state(rnd, 250 * 1024)
+        + _footer(rnd)
+    )
+    return f"<!DOCTYPE html><html lang=\"ru\">{_head(rnd, title)}<body>{body}</body></html>"
+
+def resume_page(seed=1, with_main=True, with_contacts=True):
+    rnd = random.Random(seed)
+    name = rnd.choice(NAMES)
+    position = rnd.choice(POSITIONS)
+    contacts = ""
+    if with_contacts:
+        contacts = (
+            f'<div data-qa="resume-block-contacts">'
+            f'<span data-qa="resume-contacts-phone"><a href="tel:+7999{rnd.randrange(10 ** 7):07d}">'
+            f'+7 (999) {rnd.randrange(100, 999)}-{rnd.randrange(10, 99)}-{rnd.randrange(10, 99)}</a></span>'
+            f'<a data-qa="resume-contact-email" href="mailto:user@example.com">user@example.com</a></div>'
+        )
+    experience = "".join(
+        f'<div class="resume-block-item-gap" data-qa="resume-block-experience-item">'
+        f'<div data-qa="resume-block-experience-position">{rnd.choice(POSITIONS)}</div>'
+        f"<div>{rnd.randrange(2010, 2024)} — настоящее время</div>"
+        f'<div data-qa="resume-block-experience-description">{_text(rnd, 50)}<br>{_text(rnd, 30)}</div></div>'
+        for _ in range(6)
+    )
+    skills = "".join(f'<span data-qa="bloko-tag__text">{w}</span>' for w in rnd.sample(WORDS, 15))
+    resume = (
+        f'<div data-qa="resume-block-title-position"><span>{position}</span></div>'
+        f'<div data-qa="resume-block-experience"><h2>Опыт работы</h2>{experience}</div>'
+        f'<div data-qa="skills-table"><h2>Навыки</h2>{skills}</div>'
+        f'<div data-qa="resume-block-education"><h2>Образование</h2><p>{_text(rnd, 20)}</p></div>'
+        f'<div data-qa="resume-block-skills"><h2>Обо мне</h2><p>{_text(rnd, 80)}</p></div>'
+    )
+    if with_main:
+        resume = f'<div id="resume-main-content">{resume}</div>'
+    header = (
+        f'<div class="resume-header"><h2 data-qa="resume-personal-name"><span>{name}</span></h2>'
+        f'<span data-qa="resume-personal-age">{rnd.randrange(20, 60)} лет</span>{contacts}</div>'
+    )
+    body = (
+        _navigation(rnd)
+        + f'<main>{header}{resume}<aside>{_cards(rnd, 25, "resume-serp")}</aside></main>'
+        + _initial_state(rnd, 200 * 1024)
+        + _footer(rnd)
+    )
+    return f"<!DOCTYPE html><html lang=\"ru\">{_head(rnd, position)}<body>{body}</body></html>"
+
+def search_page(resume_ids, next_href=None, seed=1, responses=False):
+    """Страница поиска резюме (или откликов на вакансию) со ссылками на resume_ids и пейджером."""
+    rnd = random.Random(seed)
+    title_qa = "resume-serp__resume-title" if responses else "serp-item__title"
+    items = "".join(
+        f'<div class="resume-serp-item" data-qa="resume-serp__resume">'
+        f'<a data-qa="{title_qa}" href="/resume/{rid}?query=python&amp;hhtmFrom=resume_search_result">'
+        f"{rnd.choice(POSITIONS)}</a>"
+        f'<div data-qa="resume-serp__resume-excpirience-sum">{_text(rnd, 20)}</div></div>'
+        for rid in resume_ids
+    )
+    pager = f'<div data-qa="pager-block"><a data-qa="pager-next" href="{next_href}">дальше</a></div>' if next_href else ""
+    body = _navigation(rnd) + f"<main><div data-qa=\"resume-serp__results-search\">{items}</div>{pager}</main>" + _footer(rnd)
+    return f"<!DOCTYPE html><html lang=\"ru\">{_head(rnd, 'Поиск резюме')}<body>{body}</body></html>"
+
+FIXTURES = {
+    "vacancy_1.html.gz": lambda: vacancy_page(1),
+    "vacancy_2.html.gz": lambda: vacancy_page(2),
+    "resume_1.html.gz": lambda: resume_page(1),
+    "resume_hidden_contacts.html.gz": lambda: resume_page(2, with_contacts=False),
+    "resume_no_main.html.gz": lambda: resume_page(3, with_main=False),
+}
+
+def write_fixtures(directory=FIXTURES_DIR):
+    os.makedirs(directory, exist_ok=True)
+    for name, build in FIXTURES.items():
+        # mtime=0 — одинаковые байты при повторной генерации
+        data = gzip.compress(build().encode("utf-8"), compresslevel=9, mtime=0)
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(data)
+
+def load_fixtures(directory=FIXTURES_DIR):
+    """Возвращает [(имя, html)] для всех *.html и *.html.gz в каталоге."""
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.endswith(".html.gz"):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                pages.append((name, f.read()))
+        elif name.endswith(".html"):
+            with open(path, "r", encoding="utf-8") as f:
+                pages.append((name, f.read()))
+    return pages
+
+if __name__ == "__main__":
+    write_fixtures(sys.argv[1] if len(sys.argv) > 1 else FIXTURES_DIR)
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import openai
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import llm
+from fake_openai import DEFAULTS, make_app
+
+# Сценарии сбоев LLM на заглушке (bench/fake_openai.py): задержки и доля ошибок каждого
+# сценария сравниваются для шлюза без защиты (один запрос, без повторов) и с защитой
+# (таймауты, повторы, предохранитель, дублирование).
+#   python bench/llm_resilience.py [--requests 300] [--concurrency 10] [--scenario tail flaky outage]
+
+PORT = 18082
+
+SCENARIOS = {
+    # 3% ответов в 40 раз медленнее обычных
+    "tail": {"latency": 0.1, "slow_rate": 0.03, "slow_latency": 4.0},
+    # 10% ответов 500, 5% — 429
+    "flaky": {"latency": 0.1, "error_rate": 0.10, "rate_limit_rate": 0.05, "retry_after": 0.2},
+    # сервис лежит: предохранитель перестает отправлять в него запросы
+    "outage": {"latency": 0.1, "outage": True},
+}
+
+# Параметры шлюза и предохранителя (неудач подряд, секунд размыкания)
+MODES = {
+    "plain": (dict(attempt_timeout=3600, deadline=3600, max_retries=0, hedge_percentile=0), (10 ** 9, 0)),
+    "resilient": (dict(attempt_timeout=2.0, deadline=6.0, max_retries=3, hedge_percentile=95), (5, 5.0)),
+}
+
+
+async def run(client, app, scenario, mode, args):
+    app["config"].update({**DEFAULTS, **SCENARIOS[scenario]})
+    app["calls"].clear()
+    params, (failures, reset_timeout) = MODES[mode]
+    gateway = llm.LLMGateway(client, max_concurrency=args.concurrency * 2, breaker=llm.CircuitBreaker(failures, reset_timeout),
+                             **params)
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            if i % 4 == 0:
+                async for _ in gateway.stream([{"role": "user", "content": f"запрос {i}"}]):
+                    pass
+            else:
+                await gateway.complete([{"role": "user", "content": f"запрос {i}"}])
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+
+    queue = list(range(args.requests))
+
+    async def worker():
+        while queue:
+            await one(queue.pop())
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    stats = gateway.stats()
+    return {
+        "scenario": scenario,
+        "mode": mode,
+        "seconds": round(time.perf_counter() - started, 2),
+        "errors": errors,
+        "p50_ms": round(llm.percentile(latencies, 50) * 1000),
+        "p95_ms": round(llm.percentile(latencies, 95) * 1000),
+        "p99_ms": round(llm.percentile(latencies, 99) * 1000),
+        "max_ms": round(max(latencies) * 1000),
+        "server_requests": app["calls"]["requests"],
+        "retries": stats["retries"],
+        "hedged": stats["hedged"],
+        "rejected": stats["rejected"],
+    }
+
+async def main(args):
+    logging.basicConfig(level=logging.ERROR)
+    app = make_app()
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+    client = openai.AsyncOpenAI(api_key="bench", base_url=f"http://127.0.0.1:{PORT}/v1", max_retries=0)
+    try:
+        for scenario in args.scenario:
+            for mode in MODES:
+                print(json.dumps(await run(client, app, scenario, mode, args), ensure_ascii=False), flush=True)
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--scenario", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    asyncio.run(main(parser.parse_args()))
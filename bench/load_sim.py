@@ -0,0 +1,414 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import traceback
+import subprocess
+from collections import defaultdict
+import aiohttp
+
+# Нагрузочный симулятор рекрутеров: N виртуальных пользователей одновременно проходят сценарий
+# в боте — вакансия по ссылке HH → загрузка резюме (PDF/DOCX) → анализ → выгрузка Excel.
+# Обновления подаются напрямую в dp.feed_update этого процесса; Telegram, OpenAI и HH заменены
+# заглушками в отдельных процессах (bench/fake_telegram.py, fake_openai.py, hh_fixture_server.py),
+# чтобы их работа не попадала в event loop бота.
+#   python bench/load_sim.py [--users 1 5 10 25] [--llm-latency 0.3] [--hh-latency 50] [--json out.json]
+# Для каждого N: задержка хендлеров по шагам сценария (время feed_update), время фоновых задач
+# от нажатия до результата, задержка event loop и пропускная способность. Если loop не получал
+# управление дольше --stall мс, стек его потока снимается из отдельного потока — в отчете места
+# кода, где loop был заблокирован, и суммарное время блокировки.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+import corpus  # noqa: E402
+
+TOKEN = "123456:LOADSIM"
+TELEGRAM_PORT = 18181
+OPENAI_PORT = 18182
+HH_PORT = 18189
+VACANCIES = 10      # пользователи работают с общим набором вакансий
+USERS_PER_ROUND = 100_000
+
+
+def percentile_ms(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))] * 1000, 1) if values else None
+
+def summary(values):
+    return {"n": len(values), "p50_ms": percentile_ms(values, 50), "p95_ms": percentile_ms(values, 95),
+            "p99_ms": percentile_ms(values, 99), "max_ms": percentile_ms(values, 100)}
+
+
+class LoopMonitor:
+    """
+    Задержка event loop: корутина засыпает на interval и замеряет опоздание пробуждения.
+    Поток-сторож раз в interval проверяет, что loop недавно просыпался; если нет — снимает
+    стек потока loop и относит interval к месту в коде проекта, где loop стоит.
+    Долгий вызов C-кода, не отпускающий GIL, сторож увидит только по задержке (lag_max_ms).
+    """
+
+    def __init__(self, interval=0.01, stall=0.1):
+        self.interval = interval
+        self.stall = stall
+        self.lags = []
+        self.blocked = defaultdict(float)   # место в коде -> секунды блокировки
+        self._last = time.perf_counter()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+
+    async def _ticker(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self._last = time.perf_counter()
+            self.lags.append(max(0.0, self._last - started - self.interval))
+
+    def _watchdog(self):
+        while not self._stop.wait(self.interval):
+            if time.perf_counter() - self._last < self.stall:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.blocked[blocking_site(frame)] += self.interval
+
+    async def __aenter__(self):
+        self._last = time.perf_counter()
+        self._task = asyncio.create_task(self._ticker())
+        self._watcher = threading.Thread(target=self._watchdog, daemon=True)
+        self._watcher.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        self._stop.set()
+        self._watcher.join()
+        self._task.cancel()
+
+    def report(self, top=5):
+        sites = sorted(self.blocked.items(), key=lambda item: -item[1])[:top]
+        return {
+            "lag_p50_ms": percentile_ms(self.lags, 50),
+            "lag_p99_ms": percentile_ms(self.lags, 99),
+            "lag_max_ms": percentile_ms(self.lags, 100),
+            "stall_ms": round(self.stall * 1000),
+            "stalls": sum(1 for lag in self.lags if lag >= self.stall),
+            "blocked_ms": round(sum(self.blocked.values()) * 1000),
+            "blocking": [{"site": site, "ms": round(seconds * 1000)} for site, seconds in sites],
+        }
+
+def blocking_site(frame):
+    """Самый глубокий кадр кода проекта и самый глубокий кадр вообще — где стоит loop."""
+    stack = traceback.extract_stack(frame)
+    if stack[-1].name == "select":
+        # loop свободен, но не получает процессор: CPU и GIL заняты потоками (to_thread, пул SQLite)
+        return "select: loop ждет CPU/GIL"
+    own = ([f for f in stack if f.filename.startswith(ROOT) and not f.filename.startswith(HERE)]
+           or [f for f in stack if f.filename.startswith(HERE)])
+    site = f"{os.path.basename(own[-1].filename)}:{own[-1].lineno} {own[-1].name}" if own else "?"
+    inner = stack[-1]
+    if own and inner is own[-1]:
+        return site
+    return f"{site} → {os.path.basename(inner.filename)}:{inner.lineno} {inner.name}"
+
+
+class Simulation:
+    """Бот в этом процессе; обновления виртуальных пользователей подаются в dp.feed_update."""
+
+    def __init__(self, bot_module, files_dir, args):
+        self.bot = bot_module
+        self.files_dir = files_dir
+        self.args = args
+        self.update_id = 0
+        self.steps = defaultdict(list)      # шаг сценария -> время feed_update
+        self.jobs = defaultdict(list)       # вид задачи -> от нажатия до результата
+        self.errors = defaultdict(int)
+        self._waiters = {}
+        self._watch_jobs()
+
+    def _watch_jobs(self):
+        # Обработчики фоновых задач оборачиваются, чтобы пользователь знал, когда задача готова
+        queue = self.bot.job_queue
+        for kind in ("resume_file", "analysis"):
+            handler, attempts = queue._handlers[kind]
+            queue.register(kind, self._watched(kind, handler), attempts)
+
+    def _watched(self, kind, handler):
+        async def wrapper(task):
+            waiter = self._waiters.get((task.user_id, kind))
+            try:
+                await handler(task)
+            except Exception as e:
+                if waiter and not waiter.done():
+                    waiter.set_exception(e)
+                raise
+            if waiter and not waiter.done():
+                waiter.set_result(None)
+        return wrapper
+
+    def reset(self):
+        self.steps.clear()
+        self.jobs.clear()
+        self.errors.clear()
+
+    def _next_id(self):
+        self.update_id += 1
+        return self.update_id
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"Recruiter {user_id}"}
+
+    def _chat(self, user_id):
+        return {"id": user_id, "type": "private"}
+
+    def message(self, user_id, text=None, document=None):
+        update_id = self._next_id()
+        message = {"message_id": update_id, "date": int(time.time()), "chat": self._chat(user_id),
+                   "from": self._user(user_id)}
+        if document:
+            message["document"] = document
+        else:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": update_id, "message": message}
+
+    def callback(self, user_id, data):
+        update_id = self._next_id()
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": self._user(user_id), "chat_instance": str(user_id), "data": data,
+            "message": {"message_id": update_id, "date": int(time.time()), "chat": self._chat(user_id),
+                        "from": {"id": 1, "is_bot": True, "first_name": "HR bot"}, "text": "Меню"},
+        }}
+
+    async def feed(self, step, update):
+        from aiogram.types import Update
+        update = Update.model_validate(update, context={"bot": self.bot.bot})
+        started = time.perf_counter()
+        await self.bot.dp.feed_update(self.bot.bot, update)
+        self.steps[step].append(time.perf_counter() - started)
+
+    async def feed_job(self, step, kind, user_id, update):
+        """Шаг, который ставит фоновую задачу: ждем, пока обработчик задачи закончит."""
+        waiter = self._waiters[(user_id, kind)] = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        try:
+            await self.feed(step, update)
+            await asyncio.wait_for(waiter, self.args.step_timeout)
+        finally:
+            self._waiters.pop((user_id, kind), None)
+        self.jobs[kind].append(time.perf_counter() - started)
+
+    def document(self, user_id):
+        """Резюме пользователя: свой файл у каждого, чтобы не срабатывали кэши извлечения и анализа."""
+        pdf = user_id % 2 == 0
+        name = f"{user_id}.{'pdf' if pdf else 'docx'}"
+        path = os.path.join(self.files_dir, name)
+        if not os.path.exists(path):
+            if pdf:
+                content = corpus.text_pdf(corpus.paginate(corpus.resume_lines(user_id, 2 + user_id % 4)))
+            else:
+                content = corpus.docx_with_tables(user_id, 2 + user_id % 4)
+            with open(path, "wb") as f:
+                f.write(content)
+        return {"file_id": name, "file_unique_id": f"u{user_id}", "file_name": f"resume_{name}",
+                "file_size": os.path.getsize(path)}
+
+    async def think(self):
+        if self.args.think:
+            await asyncio.sleep(random.uniform(0, 2 * self.args.think))
+
+    async def flow(self, user_id):
+        """Сценарий одного рекрутера. Возвращает время сценария или None при ошибке."""
+        bot = self.bot
+        state = bot.dp.fsm.resolve_context(bot.bot, user_id, user_id)
+        started = time.perf_counter()
+        try:
+            await self.feed("start", self.message(user_id, "/start"))
+            await self.think()
+            await self.feed("set_vacancy", self.callback(user_id, "set_vacancy"))
+            await self.feed("vac_hh", self.callback(user_id, "vac_hh"))
+            await self.think()
+            link = f"http://127.0.0.1:{HH_PORT}/vacancy/{user_id % VACANCIES + 1}"
+            await self.feed("vacancy_link", self.message(user_id, link))
+            title = (await state.get_data()).get("job_title")
+            if not title:
+                raise RuntimeError("вакансия не сохранена")
+
+            await self.think()
+            await self.feed("set_resume", self.callback(user_id, "set_resume"))
+            await self.feed("res_pdf", self.callback(user_id, "res_pdf"))
+            await self.think()
+            await self.feed_job("resume_upload", "resume_file", user_id,
+                                self.message(user_id, document=self.document(user_id)))
+
+            await self.think()
+            await self.feed_job("run_analysis", "analysis", user_id, self.callback(user_id, "run_analysis"))
+
+            await self.think()
+            await self.feed("view_candidates", self.callback(user_id, "view_candidates"))
+            vacancy_id = await bot.db.run(bot.db.find_vacancy_id, title)
+            await self.feed("list", self.callback(user_id, f"list_{vacancy_id}"))
+            await self.feed("export_excel", self.callback(user_id, f"excel_{vacancy_id}"))
+        except Exception as e:
+            self.errors[f"{type(e).__name__}: {e}"[:120]] += 1
+            return None
+        return time.perf_counter() - started
+
+    async def round(self, number, users):
+        self.reset()
+        ids = [(number + 1) * USERS_PER_ROUND + i for i in range(users)]
+        for user_id in ids:
+            self.document(user_id)
+        async with aiohttp.ClientSession() as session:
+            await session.post(f"http://127.0.0.1:{TELEGRAM_PORT}/reset")
+
+        async def delayed(user_id):
+            await asyncio.sleep(random.uniform(0, self.args.ramp))
+            return await self.flow(user_id)
+
+        async with LoopMonitor(stall=self.args.stall / 1000) as monitor:
+            started = time.perf_counter()
+            durations = await asyncio.gather(*(delayed(user_id) for user_id in ids))
+            elapsed = time.perf_counter() - started
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{TELEGRAM_PORT}/stats") as response:
+                api_calls = sum((await response.json()).values())
+
+        done = [d for d in durations if d is not None]
+        updates = sum(len(v) for v in self.steps.values())
+        return {
+            "users": users,
+            "flows_ok": len(done),
+            "flows_failed": len(durations) - len(done),
+            "seconds": round(elapsed, 2),
+            "flows_per_min": round(len(done) / elapsed * 60, 1),
+            "updates_per_sec": round(updates / elapsed, 1),
+            "bot_api_calls": api_calls,
+            "flow": summary(done),
+            "steps": {step: summary(values) for step, values in self.steps.items()},
+            "jobs": {kind: summary(values) for kind, values in self.jobs.items()},
+            "loop": monitor.report(),
+            "errors": dict(self.errors),
+        }
+
+
+def print_round(r):
+    loop = r["loop"]
+    print(f"\nN={r['users']}: сценариев {r['flows_ok']}/{r['users']} за {r['seconds']} с, "
+          f"{r['flows_per_min']} сценариев/мин, {r['updates_per_sec']} обновлений/с; "
+          f"сценарий p50 {r['flow']['p50_ms']} мс, p95 {r['flow']['p95_ms']} мс")
+    print(f"  {'шаг':<18}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, s in list(r["steps"].items()) + [(f"задача {k}", s) for k, s in r["jobs"].items()]:
+        print(f"  {name:<18}{s['n']:>5}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}")
+    print(f"  event loop: задержка p50 {loop['lag_p50_ms']} мс, p99 {loop['lag_p99_ms']} мс, "
+          f"max {loop['lag_max_ms']} мс, задержек дольше {loop['stall_ms']} мс: {loop['stalls']}; заблокирован {loop['blocked_ms']} мс")
+    for entry in loop["blocking"]:
+        print(f"    {entry['ms']:>7} мс  {entry['site']}")
+    for error, count in r["errors"].items():
+        print(f"  ошибка x{count}: {error}")
+
+def print_scaling(results):
+    print(f"\n{'N':>5}{'сцен./мин':>11}{'обн./с':>9}{'сцен. p95':>11}{'анализ p95':>12}{'lag p99':>9}"
+          f"{'lag max':>9}{'блок. ms':>10}{'ошибки':>8}")
+    for r in results:
+        analysis = r["jobs"].get("analysis", {}).get("p95_ms")
+        print(f"{r['users']:>5}{r['flows_per_min']:>11}{r['updates_per_sec']:>9}{str(r['flow']['p95_ms']):>11}"
+              f"{str(analysis):>12}{str(r['loop']['lag_p99_ms']):>9}{str(r['loop']['lag_max_ms']):>9}"
+              f"{r['loop']['blocked_ms']:>10}{r['flows_failed']:>8}")
+
+async def wait_http(session, url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} не ответил за {timeout} с")
+
+def start_servers(files_dir, args):
+    quiet = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+    return [
+        subprocess.Popen([sys.executable, os.path.join(HERE, "fake_telegram.py"), "--port", str(TELEGRAM_PORT),
+                          "--files", files_dir], **quiet),
+        subprocess.Popen([sys.executable, os.path.join(HERE, "fake_openai.py"), "--port", str(OPENAI_PORT),
+                          "--latency", str(args.llm_latency)], **quiet),
+        subprocess.Popen([sys.executable, os.path.join(HERE, "hh_fixture_server.py"), "--port", str(HH_PORT),
+                          "--latency", str(args.hh_latency)], **quiet),
+    ]
+
+async def main(args, tmp):
+    import logging
+    logging.basicConfig(level=logging.ERROR)
+    files_dir = os.path.join(tmp, "files")
+    os.makedirs(files_dir)
+    # Модули бота читают настройки при импорте
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": TOKEN,
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{TELEGRAM_PORT}",
+        "OPENAI_API_KEY": "load-sim",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{OPENAI_PORT}/v1",
+        "DB_PATH": os.path.join(tmp, "load.db"),
+        "HH_CACHE_DIR": os.path.join(tmp, "hh"),
+        "EXTRACTION_CACHE_DIR": os.path.join(tmp, "extraction"),
+        # Лимит частоты HH рассчитан на настоящий сайт; здесь он только маскировал бы нагрузку на бота
+        "HH_RATE": "1000",
+        "HH_BURST": "1000",
+    })
+    servers = start_servers(files_dir, args)
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_http(session, f"http://127.0.0.1:{TELEGRAM_PORT}/stats")
+            await wait_http(session, f"http://127.0.0.1:{OPENAI_PORT}/stats")
+            await wait_http(session, f"http://127.0.0.1:{HH_PORT}/vacancy/1")
+
+        import bot
+        background = await bot.startup()
+        logging.getLogger().setLevel(logging.ERROR)
+        simulation = Simulation(bot, files_dir, args)
+        results = []
+        try:
+            await simulation.round(len(args.users), 1)   # прогрев: импорты, токенизатор, соединения
+            for number, users in enumerate(args.users):
+                result = await simulation.round(number, users)
+                results.append(result)
+                print_round(result)
+        finally:
+            await bot.shutdown(background)
+            await bot.bot.session.close()
+            import hh_client
+            await hh_client.close_client()
+        print_scaling(results)
+        return results
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 5, 10, 25], help="число пользователей в раундах")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="задержка ответа заглушки LLM, секунды")
+    parser.add_argument("--hh-latency", type=int, default=50, help="задержка ответа заглушки HH, мс")
+    parser.add_argument("--think", type=float, default=0.0, help="средняя пауза пользователя между шагами, секунды")
+    parser.add_argument("--ramp", type=float, default=1.0, help="пользователи начинают в течение стольких секунд")
+    parser.add_argument("--stall", type=float, default=100, help="loop не отвечает дольше — снимать стек, мс")
+    parser.add_argument("--step-timeout", type=float, default=300, help="ожидание фоновой задачи, секунды")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="hrbot-load-") as tmp:
+        results = asyncio.run(main(args, tmp))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
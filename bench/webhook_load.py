@@ -0,0 +1,167 @@
+import os
+import sys
+import time
+import json
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import aiohttp
+
+# Нагрузочный тест режима webhook: пропускная способность в зависимости от числа процессов бота.
+#   python bench/webhook_load.py [--workers 1 2 4] [--updates 2000] [--users 200] [--concurrency 64]
+# Для каждого числа процессов запускается webhook.py на временной базе, Telegram заменен
+# заглушкой (bench/fake_telegram.py). Обновление считается обработанным, когда бот отправил
+# ответ в заглушку, поэтому время включает весь путь: прием, пересылку, FSM, хендлер и ответ.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ROUTER_PORT = 18080
+WORKER_PORT = 18100
+FAKE_API_PORT = 18081
+TOKEN = "123456:LOADTEST"
+
+
+def make_update(update_id, user_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else [],
+        },
+    }
+
+async def wait_http(session, url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return await response.json()
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} не ответил за {timeout} с")
+
+async def replies(session):
+    async with session.get(f"http://127.0.0.1:{FAKE_API_PORT}/stats") as response:
+        return (await response.json()).get("sendMessage", 0)
+
+async def send_updates(session, updates, concurrency):
+    """Отправляет обновления в webhook; возвращает время подтверждения каждого (секунды)."""
+    url = f"http://127.0.0.1:{ROUTER_PORT}/webhook"
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+    acks = []
+
+    async def sender():
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            async with session.post(url, json=update) as response:
+                response.raise_for_status()
+            acks.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(sender() for _ in range(concurrency)))
+    return acks
+
+async def wait_replies(session, expected, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if await replies(session) >= expected:
+            return True
+        await asyncio.sleep(0.05)
+    return False
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000 if values else 0.0
+
+async def run_case(workers, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "TELEGRAM_BOT_TOKEN": TOKEN,
+            "OPENAI_API_KEY": "load-test",
+            "TELEGRAM_API_URL": f"http://127.0.0.1:{FAKE_API_PORT}",
+            "DB_PATH": os.path.join(tmp, "load.db"),
+            "WEBHOOK_WORKERS": str(workers),
+            "WEBHOOK_PORT": str(ROUTER_PORT),
+            "WEBHOOK_WORKER_PORT": str(WORKER_PORT),
+            "WEBHOOK_HOST": "127.0.0.1",
+        }
+        env.pop("WEBHOOK_URL", None)
+        env.pop("WEBHOOK_SECRET", None)
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, "webhook.py")], cwd=tmp, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL if args.quiet else None)
+        try:
+            async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+                await wait_http(session, f"http://127.0.0.1:{ROUTER_PORT}/health")
+                for index in range(workers):
+                    await wait_http(session, f"http://127.0.0.1:{WORKER_PORT + index}/health", timeout=120)
+                # Прогрев: по обновлению от нескольких пользователей на каждый процесс
+                warmup = [make_update(i, 10_000_000 + i, args.text) for i in range(workers * 8)]
+                await send_updates(session, warmup, 8)
+                if not await wait_replies(session, len(warmup), 60):
+                    raise RuntimeError("процессы бота не ответили на прогрев")
+                await session.post(f"http://127.0.0.1:{FAKE_API_PORT}/reset")
+
+                updates = [make_update(100 + i, 1000 + i % args.users, args.text) for i in range(args.updates)]
+                started = time.perf_counter()
+                acks = await send_updates(session, updates, args.concurrency)
+                done = await wait_replies(session, len(updates), 120)
+                elapsed = time.perf_counter() - started
+                health = await wait_http(session, f"http://127.0.0.1:{ROUTER_PORT}/health")
+                return {
+                    "workers": workers,
+                    "updates": len(updates),
+                    "completed": done,
+                    "seconds": round(elapsed, 2),
+                    "updates_per_sec": round(len(updates) / elapsed, 1),
+                    "ack_p50_ms": round(percentile(acks, 50), 1),
+                    "ack_p95_ms": round(percentile(acks, 95), 1),
+                    "per_worker": health["forwarded"],
+                }
+        finally:
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+async def main(args):
+    fake_api = subprocess.Popen([sys.executable, os.path.join(HERE, "fake_telegram.py"), "--port", str(FAKE_API_PORT)])
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_http(session, f"http://127.0.0.1:{FAKE_API_PORT}/stats")
+        results = []
+        for workers in args.workers:
+            result = await run_case(workers, args)
+            results.append(result)
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+        base = results[0]["updates_per_sec"]
+        print(f"\nCPU: {os.cpu_count()}")
+        for result in results:
+            print(f"workers={result['workers']:<3} {result['updates_per_sec']:>8} upd/s  x{result['updates_per_sec'] / base:.2f}"
+                  f"  ack p50 {result['ack_p50_ms']} ms, p95 {result['ack_p95_ms']} ms")
+    finally:
+        fake_api.terminate()
+        fake_api.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--text", default="/start", help="текст сообщений (команда бота)")
+    parser.add_argument("--quiet", action="store_true", help="не выводить логи бота")
+    asyncio.run(main(parser.parse_args()))
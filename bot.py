@@ -4,29 +4,99 @@ import io
 import re
 import asyncio
 import logging
-import sqlite3
-import pandas as pd
+import time
+import zipfile
+from collections import defaultdict
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from dotenv import load_dotenv
 import openai
 import docx
 
 # Импорты модулей
 import database as db
+import hh_client
 from parse_hh import extract_vacancy_data, extract_resume_data, get_html
 from pdf_resume_parser import extract_resume_data_from_pdf
 from docx_resume_parser import extract_resume_data_from_docx
+from llm import LLMGateway, LLM_MAX_CONCURRENCY
+import analysis_cache
+import extraction_cache
+import http_cache
+import crawler
+import compaction
+import ranking
+import prescreen
+import jobs
+import metrics
+from export import export_candidates
+from pipeline import Stage, run_pipeline
+from streaming import MessageStreamer
+import fsm_storage
 
 load_dotenv()
 
 # Инициализация
-bot = Bot(token=os.getenv("TELEGRAM_BOT_TOKEN"))
-dp = Dispatcher()
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# TELEGRAM_API_URL — свой Bot API сервер (local bot-api или заглушка для нагрузочного теста)
+_api_url = os.getenv("TELEGRAM_API_URL")
+bot = Bot(token=os.getenv("TELEGRAM_BOT_TOKEN"),
+          session=AiohttpSession(api=TelegramAPIServer.from_base(_api_url)) if _api_url else None)
+# Состояния и данные пользователей хранятся в базе: переживают перезапуск и не занимают память процесса
+dp = Dispatcher(storage=fsm_storage.SQLiteStorage())
+# Общий асинхронный шлюз к OpenAI: запросы не блокируют event loop,
+# число одновременных запросов ограничено глобально и на пользователя.
+# Повторы, таймауты и предохранитель — в шлюзе (llm.py), поэтому у клиента свои повторы выключены.
+# OPENAI_BASE_URL (читает сам клиент) — другой OpenAI-совместимый сервер, например bench/fake_openai.py
+llm = LLMGateway(
+    openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0),
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    per_user_concurrency=int(os.getenv("LLM_PER_USER_CONCURRENCY", "2"))
+)
+
+# Трасса на каждое обновление: время хендлера по этапам (metrics.py)
+@dp.update.outer_middleware()
+async def trace_update(handler, event, data):
+    user = data.get("event_from_user")
+    with metrics.trace("update", update_id=event.update_id, event=event.event_type, user_id=user.id if user else None):
+        return await handler(event, data)
+
+@dp.message.middleware()
+@dp.callback_query.middleware()
+async def trace_handler(handler, event, data):
+    metrics.annotate(data["handler"].callback.__name__)
+    return await handler(event, data)
+
+# Счетчики, которые модули ведут сами, — в /metrics
+def collect_module_stats():
+    gateway = llm.stats()
+    return [
+        ("hrbot_llm_queue", "gauge", "Запросы к LLM: в очереди и выполняются",
+         [({"state": "queued"}, gateway["queued"]), ({"state": "in_flight"}, gateway["in_flight"])]),
+        ("hrbot_llm_retries_total", "counter", "Повторы запросов к LLM", [({}, gateway["retries"])]),
+        ("hrbot_llm_hedged_total", "counter", "Дублированные запросы к LLM",
+         [({"result": "sent"}, gateway["hedged"]), ({"result": "won"}, gateway["hedge_wins"])]),
+        ("hrbot_llm_circuit_open", "gauge", "Предохранитель LLM разомкнут", [({}, int(gateway["circuit"] != "closed"))]),
+        ("hrbot_cache_requests_total", "counter", "Обращения к кэшам", [
+            ({"cache": "analysis", "result": "hit"}, analysis_cache.hits),
+            ({"cache": "analysis", "result": "miss"}, analysis_cache.misses),
+            ({"cache": "extraction", "result": "hit_file_id"}, extraction_cache.hits_by_id),
+            ({"cache": "extraction", "result": "hit_hash"}, extraction_cache.hits_by_hash),
+            ({"cache": "extraction", "result": "miss"}, extraction_cache.misses),
+            ({"cache": "hh_http", "result": "hit"}, http_cache.hits),
+            ({"cache": "hh_http", "result": "revalidated"}, http_cache.revalidated),
+            ({"cache": "hh_http", "result": "miss"}, http_cache.misses),
+        ]),
+        ("hrbot_compaction_tokens_total", "counter", "Токены текстов до и после сжатия", [
+            ({"stage": "before"}, compaction.tokens_before), ({"stage": "after"}, compaction.tokens_after),
+        ]),
+    ]
+
+metrics.register_collector(collect_module_stats)
 
 # 1. Получаем реальный текущий год (2026)
 current_year = datetime.datetime.now().year
@@ -38,6 +108,7 @@ class Form(StatesGroup):
     waiting_for_vacancy_data = State()  
     waiting_for_vacancy_docx = State()
     waiting_for_multi_resumes = State()
+    waiting_for_batch_resumes = State()
 
     # Состояния для резюме
     waiting_for_resume_type = State()
@@ -137,6 +208,11 @@ SYSTEM_PROMPT = """
 Итоговый_результат: Y/10
 """.strip()
 
+# Модель и версия промпта анализа входят в ключ кэша анализов.
+# При любом изменении SYSTEM_PROMPT увеличьте версию.
+ANALYSIS_MODEL = "gpt-4o-mini"
+ANALYSIS_PROMPT_VERSION = 1
+
 # Промпт для создания вакансии на основе нескольких резюме
 REVERSE_VACANCY_PROMPT = """
 Ты — старший HR-архитектор. Твоя цель: синтезировать эталонный профиль вакансии на основе предоставленных резюме.
@@ -215,6 +291,7 @@ def main_menu_kb():
         [InlineKeyboardButton(text="1️⃣ Установить вакансию", callback_data="set_vacancy")],
         [InlineKeyboardButton(text="2️⃣ Загрузить резюме", callback_data="set_resume")],
         [InlineKeyboardButton(text="📊 Анализ и сохранение", callback_data="run_analysis")],
+        [InlineKeyboardButton(text="📦 Пакетный анализ", callback_data="batch_start")],
         [InlineKeyboardButton(text="📋 Список кандидатов", callback_data="view_candidates")],
         [InlineKeyboardButton(text="🗑 Закрыть вакансию", callback_data="close_vacancy")]
     ])
@@ -260,6 +337,105 @@ def extract_info(text, pattern):
     match = re.search(pattern, text)
     return match.group(1).strip() if match else "Не определено"
 
+async def analyze_candidate(job, resume, user_id=None, use_cache=True, on_delta=None):
+    """
+    Анализ кандидата через GPT с кэшем результатов.
+    Вакансия и резюме предварительно ужимаются до бюджета токенов модели.
+    on_delta — async-функция(фрагмент): ответ запрашивается потоком и передается ей по мере генерации.
+    Возвращает (текст анализа, признак попадания в кэш).
+    """
+    job = await asyncio.to_thread(compaction.compact, job, "job", ANALYSIS_MODEL)
+    resume = await asyncio.to_thread(compaction.compact, resume, "resume", ANALYSIS_MODEL)
+    cache_key = analysis_cache.make_key(ANALYSIS_MODEL, ANALYSIS_PROMPT_VERSION, job, resume)
+    if use_cache:
+        cached = await db.run(analysis_cache.get_analysis, cache_key)
+        if cached:
+            return cached, True
+
+    messages = [{"role":"system","content":SYSTEM_PROMPT},{"role":"user","content":f"В:{job}\nР:{resume}"}]
+    if on_delta is None:
+        analysis = await llm.complete(model=ANALYSIS_MODEL, messages=messages, user_id=user_id)
+    else:
+        parts = []
+        async for delta in llm.stream(model=ANALYSIS_MODEL, messages=messages, user_id=user_id):
+            parts.append(delta)
+            await on_delta(delta)
+        analysis = "".join(parts)
+    await db.run(analysis_cache.put_analysis, cache_key, ANALYSIS_MODEL, analysis)
+    return analysis, False
+
+def resume_file_kind(file_name):
+    """Тип файла резюме по имени: "pdf", "docx" или None, если формат не поддерживается."""
+    file_name = (file_name or "").lower()
+    if file_name.endswith('.pdf'):
+        return "pdf"
+    if file_name.endswith('.docx') or file_name.endswith('.doc'):
+        return "docx"
+    return None
+
+def extraction_version(kind):
+    return extraction_cache.make_version(f"{kind}:compact{compaction.VERSION}", OCR_SYSTEM_PROMPT, "gpt-4o-mini")
+
+async def download_bytes(file):
+    """Скачивает файл из Telegram (объект или file_id) с учетом в метриках."""
+    with metrics.stage("download"):
+        data = (await bot.download(file)).read()
+    metrics.DOWNLOAD_BYTES.inc(len(data))
+    return data
+
+async def parse_resume_file(document, user_id=None):
+    """
+    Скачивает и разбирает резюме PDF/DOCX в markdown.
+    Результат кэшируется на диске по file_unique_id и хэшу содержимого:
+    повторно присланный файл не скачивается и не отправляется в GPT.
+    Возвращает None для неподдерживаемого формата.
+    """
+    kind = resume_file_kind(document.file_name)
+    if kind is None:
+        return None
+
+    cached = await asyncio.to_thread(extraction_cache.get_by_file_id, document.file_unique_id, extraction_version(kind))
+    if cached:
+        return cached
+
+    file_bytes = await download_bytes(document)
+    return await parse_resume_bytes(document.file_name, file_bytes, user_id, document.file_unique_id)
+
+async def parse_resume_bytes(file_name, file_bytes, user_id=None, file_unique_id=None):
+    """Разбирает уже скачанный PDF/DOCX (с кэшем по хэшу содержимого)."""
+    kind = resume_file_kind(file_name)
+    if kind is None:
+        return None
+
+    version = extraction_version(kind)
+    # Хэш файла и чтение кэша с диска — вне event loop
+    file_hash = await asyncio.to_thread(extraction_cache.content_hash, file_bytes)
+    cached = await asyncio.to_thread(extraction_cache.get_by_hash, file_hash, version, file_unique_id)
+    if cached:
+        return cached
+
+    if kind == "pdf":
+        # Ваш существующий парсер для PDF
+        resume_text = await extract_resume_data_from_pdf(file_bytes, llm, OCR_SYSTEM_PROMPT, user_id=user_id)
+    else:
+        # Читаем текст из Word
+        raw_docx_text = await asyncio.to_thread(extract_resume_data_from_docx, file_bytes)
+        raw_docx_text = await asyncio.to_thread(compaction.compact, raw_docx_text, "raw")
+
+        # Просим ИИ привести "сырой" текст из Word к нужному нам формату
+        # Это гарантирует, что в тексте появятся метки # ФИО и **Телефон**
+        resume_text = await llm.complete(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": OCR_SYSTEM_PROMPT},
+                {"role": "user", "content": raw_docx_text}
+            ],
+            user_id=user_id
+        )
+
+    await asyncio.to_thread(extraction_cache.put, file_hash, version, resume_text, file_unique_id)
+    return resume_text
+
 # --- Хендлеры ---
 
 def escape_markdown(text):
@@ -268,6 +444,47 @@ def escape_markdown(text):
     parse_chars = r'([_*`\[])'
     return re.sub(parse_chars, r'\\\1', text)
 
+# --- Фоновые задачи (jobs.py) ---
+# Долгие операции (OCR, генерация GPT, анализ, пакет) выполняются воркерами очереди:
+# хендлер отправляет сообщение «в очереди», ставит задачу и сразу отвечает Telegram,
+# а обработчик задачи показывает результат в этом сообщении.
+
+class ChatTarget:
+    """Отправка в чат задачи — замена message.answer для кода, который работает вне хендлера."""
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+
+    async def answer(self, text, **kwargs):
+        return await bot.send_message(self.chat_id, text, **kwargs)
+
+def task_message(task):
+    """Сообщение о статусе задачи как объект Message (для edit_text и MessageStreamer)."""
+    return types.Message(
+        message_id=task.message_id, date=datetime.datetime.now(), chat=types.Chat(id=task.chat_id, type="private")
+    ).as_(bot)
+
+def task_state(task):
+    """FSM-контекст пользователя задачи (хранилище общее, задача может выполняться в другом процессе)."""
+    return dp.fsm.resolve_context(bot, task.chat_id, task.user_id)
+
+def queued_kb():
+    return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="✖️ Отменить", callback_data="job_cancel")]])
+
+async def enqueue_task(message, user_id, kind, payload, priority, text):
+    """Сообщение о постановке в очередь и сама задача. message — куда отвечать."""
+    status = await message.answer(text, reply_markup=queued_kb())
+    return await job_queue.enqueue(kind, user_id, message.chat.id, payload, priority, message_id=status.message_id)
+
+async def notify_task(task, status, error):
+    text = "🚫 Задача отменена." if status == "cancelled" else f"❌ Ошибка: {error}"
+    if task.message_id:
+        await task_message(task).edit_text(text, reply_markup=main_menu_kb())
+    else:
+        await bot.send_message(task.chat_id, text, reply_markup=main_menu_kb())
+
+job_queue = jobs.JobQueue(notify=notify_task)
+
 @dp.message(Command("start"))
 async def cmd_start(message: types.Message, state: FSMContext):
     await state.clear()
@@ -282,7 +499,123 @@ async def back_to_menu_handler(callback: types.CallbackQuery, state: FSMContext)
 
 @dp.message(Command("help"))
 async def cmd_help(message: types.Message):
-    await message.answer("📖 Инструкция:\n1. Установите вакансию.\n2. Загрузите резюме.\n3. Нажмите анализ — данные сохранятся в базу автоматически.")
+    await message.answer("📖 Инструкция:\n1. Установите вакансию.\n2. Загрузите резюме.\n3. Нажмите анализ — данные сохранятся в базу автоматически.\n\n"
+                         "/crawl <ссылка> — обойти поиск резюме или отклики HH и оценить всех кандидатов по текущей вакансии.\n"
+                         "/search <запрос> — найти кандидатов всех вакансий по ФИО, тексту резюме и анализу "
+                         "(фраза в кавычках ищется точно).\n"
+                         "/jobs — ваши задачи (разбор файлов, анализ, пакеты) и их отмена.")
+
+@dp.message(Command("crawl"))
+async def cmd_crawl(message: types.Message, command: CommandObject, state: FSMContext):
+    data = await state.get_data()
+    url = (command.args or "").strip()
+    if not url.startswith(("http://", "https://")):
+        await message.answer("⚠️ Укажите ссылку на поиск резюме или отклики HH.ru: /crawl <ссылка>"); return
+    if not data.get("job_text"):
+        await message.answer("⚠️ Сначала установите вакансию!"); return
+
+    title = data.get("job_title")
+    # Та же выдача для той же вакансии — продолжаем прерванный обход, а не начинаем заново
+    job_id = await db.run(db.find_running_crawl_job, url, title)
+    if job_id is None:
+        job_id = await db.run(db.create_crawl_job, url, title, data["job_text"], message.chat.id)
+    if not await start_crawl(job_id):
+        await message.answer("⏳ Этот обход уже выполняется."); return
+    await message.answer(f"🕸 Обход выдачи запущен (задание #{job_id}). Результаты сохранятся в кандидаты вакансии.")
+
+SEARCH_PAGE_SIZE = 5
+
+async def render_search_page(query, page=0):
+    """Страница результатов поиска; запрос хранится в данных FSM, в кнопках — только номер страницы."""
+    rows, has_next = await db.run(db.search_candidates, query, page * SEARCH_PAGE_SIZE, SEARCH_PAGE_SIZE)
+    if not rows:
+        return None, None
+
+    def snippet(text):
+        # Найденные слова выделяются жирным; остальной текст экранируется
+        text = escape_markdown(re.sub(r'\s+', ' ', text or ''))
+        return text.replace(db.SNIPPET_START, "*").replace(db.SNIPPET_END, "*")
+
+    text = f"🔎 **Поиск:** {escape_markdown(query)} (стр. {page + 1})\n\n" + "\n\n".join(
+        f"{page * SEARCH_PAGE_SIZE + i}. 👤 {escape_markdown(name or '')} ({score})\n"
+        f"💼 {escape_markdown(vacancy or '')}\n{snippet(fragment)}\n🔗 {escape_markdown(url or '')}"
+        for i, (_, name, vacancy, score, url, fragment) in enumerate(rows, 1)
+    )
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"sq_{page - 1}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=f"sq_{page + 1}"))
+    buttons = [nav] if nav else []
+    buttons.append([InlineKeyboardButton(text="⬅️ В меню", callback_data="start")])
+    return text, InlineKeyboardMarkup(inline_keyboard=buttons)
+
+@dp.message(Command("search"))
+async def cmd_search(message: types.Message, command: CommandObject, state: FSMContext):
+    query = (command.args or "").strip()
+    if not query:
+        await message.answer("⚠️ Укажите запрос: /search 1С валютный контроль"); return
+
+    text, kb = await render_search_page(query)
+    if not text:
+        await message.answer("Ничего не найдено."); return
+    await state.update_data(search_query=query)
+    await message.answer(text, reply_markup=kb, parse_mode="Markdown")
+
+@dp.callback_query(F.data.startswith("sq_"))
+async def page_search(callback: types.CallbackQuery, state: FSMContext):
+    query = (await state.get_data()).get("search_query")
+    text, kb = await render_search_page(query, int(callback.data[3:])) if query else (None, None)
+    if not text: await callback.answer("Повторите поиск командой /search."); return
+
+    await callback.message.edit_text(text, reply_markup=kb, parse_mode="Markdown")
+    await callback.answer()
+
+JOB_KINDS = {"resume_file": "Разбор резюме", "collect_resume": "Резюме для вакансии", "vac_docx": "Вакансия из заявки",
+             "reverse_vac": "Вакансия по резюме", "analysis": "Анализ кандидата", "batch": "Пакетный анализ"}
+JOB_STATUSES = {"queued": "⏳ в очереди", "running": "⚙️ выполняется", "done": "✅ готово",
+                "failed": "❌ ошибка", "cancelled": "🚫 отменена"}
+
+@dp.message(Command("jobs"))
+async def cmd_jobs(message: types.Message):
+    rows = await db.run(jobs.user_jobs, message.from_user.id)
+    if not rows:
+        await message.answer("Задач пока нет."); return
+
+    lines, buttons = [], []
+    for job_id, kind, status, attempts, error, created_at in rows:
+        line = f"#{job_id} {JOB_KINDS.get(kind, kind)} — {JOB_STATUSES.get(status, status)}"
+        if status == "queued":
+            line += f" (перед ней {await db.run(jobs.queue_position, job_id)})"
+        if status == "running" and attempts > 1:
+            line += f" (попытка {attempts})"
+        if status == "failed" and error:
+            line += f": {error[:100]}"
+        lines.append(line)
+        if status not in jobs.FINISHED:
+            buttons.append([InlineKeyboardButton(text=f"✖️ Отменить #{job_id}", callback_data=f"jobx_{job_id}")])
+    await message.answer("📋 Ваши задачи:\n\n" + "\n".join(lines),
+                         reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons) if buttons else None)
+
+@dp.callback_query(F.data == "job_cancel")
+async def cancel_task_handler(callback: types.CallbackQuery):
+    """Кнопка в сообщении о статусе задачи."""
+    job_id = await db.run(jobs.find_job, callback.message.chat.id, callback.message.message_id)
+    await cancel_task(callback, job_id)
+
+@dp.callback_query(F.data.startswith("jobx_"))
+async def cancel_task_from_list(callback: types.CallbackQuery):
+    await cancel_task(callback, int(callback.data.split("_")[1]))
+
+async def cancel_task(callback, job_id):
+    previous = await job_queue.cancel(job_id, callback.from_user.id) if job_id else None
+    if previous is None:
+        await callback.answer("Задача уже завершена.", show_alert=True); return
+    await callback.answer("Задача отменена.")
+    if previous == "queued":
+        # Выполняющуюся задачу прервет очередь и сообщит сама (notify_task)
+        task = jobs.Job(await db.run(jobs.get_job, job_id))
+        await notify_task(task, "cancelled", None)
 
 # --- Блок Вакансии ---
 
@@ -292,20 +625,17 @@ async def select_vac_method(callback: types.CallbackQuery):
 
 @dp.callback_query(F.data == "vac_db")
 async def list_vacancies_from_db(callback: types.CallbackQuery):
-    vacs = db.get_vacancies() # Получаем список имен из БД
+    vacs = await db.run(db.get_vacancies) # Получаем список имен из БД
     if not vacs:
         await callback.answer("База вакансий пуста.", show_alert=True); return
-    btns = [[InlineKeyboardButton(text=v, callback_data=f"selvac_{v[:20]}")] for v in vacs]
+    btns = [[InlineKeyboardButton(text=name, callback_data=f"selvac_{vac_id}")] for vac_id, name in vacs]
     await callback.message.edit_text("Выберите сохраненную вакансию:", reply_markup=InlineKeyboardMarkup(inline_keyboard=btns))
 
 @dp.callback_query(F.data.startswith("selvac_"))
 async def process_vac_selection(callback: types.CallbackQuery, state: FSMContext):
     part = callback.data.replace("selvac_", "")
-    conn = sqlite3.connect('hr_assistant.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT name, description FROM vacancies WHERE name LIKE ?', (part + '%',))
-    res = cursor.fetchone()
-    conn.close()
+    vacancy_id = await db.run(db.find_vacancy_id, part)
+    res = await db.run(db.get_vacancy, vacancy_id)
     if res:
         await state.update_data(job_title=res[0], job_text=res[1])
         await callback.message.answer(f"✅ Выбрана вакансия: **{res[0]}**", reply_markup=main_menu_kb())
@@ -347,9 +677,13 @@ async def handle_vacancy_input(message: types.Message, state: FSMContext):
         title, text = "", ""
         if method == "vac_gen":
             title = message.text
-            res = client.chat.completions.create(model="gpt-4o-mini", messages=[{"role":"system","content":VAC_GEN_PROMPT},{"role":"user","content":title}])
-            text = res.choices[0].message.content
-            await message.answer(f"Черновик:\n`{text}`", parse_mode="Markdown")
+            # Черновик показывается по мере генерации; внутри `...` экранировать нечего, кроме самих `
+            streamer = MessageStreamer(message, header="Черновик:\n", parse_mode="Markdown", wrap=("`", "`"),
+                                       escape=lambda t: t.replace("`", "'"), placeholder="⌛ Генерирую черновик...")
+            await streamer.start()
+            async for delta in llm.stream(model="gpt-4o-mini", messages=[{"role":"system","content":VAC_GEN_PROMPT},{"role":"user","content":title}], user_id=message.from_user.id):
+                await streamer.feed(delta)
+            await streamer.finish()
             await message.answer("Пришлите итоговый вариант текста вакансии:")
             await state.update_data(vac_method="vac_text", job_title=title)
             return
@@ -357,11 +691,11 @@ async def handle_vacancy_input(message: types.Message, state: FSMContext):
             title = data.get("job_title")
             text = message.text
         elif method == "vac_hh":
-            html = get_html(message.text)
-            text = extract_vacancy_data(html)
+            html = await get_html(message.text)
+            text = await asyncio.to_thread(extract_vacancy_data, html)
             title = text.split('\n')[0].replace('#', '').strip()
         
-        db.save_vacancy(title, text) # Сохраняем в таблицу vacancies
+        await db.run(db.save_vacancy, title, text) # Сохраняем в таблицу vacancies
         await state.update_data(job_title=title, job_text=text)
         await message.answer(f"🎯 Вакансия '{title}' сохранена!", reply_markup=main_menu_kb())
         await state.set_state(None)
@@ -378,52 +712,47 @@ async def process_vac_docx(message: types.Message, state: FSMContext):
     if not message.document.file_name.lower().endswith(".docx"):
         await message.answer("❌ Ошибка: поддерживаются только файлы .docx"); return
 
-    await message.answer("⌛ Читаю заявку и формирую текст по шаблону ПЕРВОУРАЛЬСКБАНКА...")
-    
-    try:
-        # Скачиваем и парсим Word (используем ваш docx_resume_parser)
-        file_content = await bot.download(message.document)
-        from docx_resume_parser import extract_resume_data_from_docx
-        raw_text = extract_resume_data_from_docx(file_content.read())
-        
-        # Отправляем в GPT с вашим строгим REVERSE_VACANCY_PROMPT
-        res = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": FROM_APPLICATION_VACANCY_PROMPT},
-                {"role": "user", "content": f"Сформируй вакансию из этой заявки:\n{raw_text}"}
-            ],
-            temperature=0.5 # Низкая температура для исключения галлюцинаций
-        )
-        final_text = res.choices[0].message.content
-        
-        # Вытаскиваем название (оно в шаблоне после "Вакансия: ")
-        title = "Новая вакансия"
-        if "Вакансия:" in final_text:
-            title = final_text.split("Вакансия:")[1].split("\n")[0].strip()
+    await enqueue_task(message, message.from_user.id, "vac_docx", {"file_id": message.document.file_id},
+                       jobs.PRIORITY_NORMAL, "⌛ Читаю заявку и формирую текст по шаблону ПЕРВОУРАЛЬСКБАНКА...")
+    await state.set_state(None)
 
-        await state.update_data(job_title=title, job_text=final_text)
-        
-        # Показываем результат и кнопку сохранения
-        await message.answer(f"<b>📋 Результат:</b>\n\n{final_text}", parse_mode="HTML")
-        
-        kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="💾 Сохранить в базу", callback_data="save_vac_confirmed")],
-            [InlineKeyboardButton(text="🔄 Сбросить", callback_data="start")]
-        ])
-        await message.answer(f"Сохранить вакансию '{title}'?", reply_markup=kb)
+async def vac_docx_task(task):
+    # Скачиваем и парсим Word (используем ваш docx_resume_parser)
+    raw_text = await asyncio.to_thread(extract_resume_data_from_docx, await download_bytes(task.payload["file_id"]))
+
+    # Отправляем в GPT с вашим строгим REVERSE_VACANCY_PROMPT
+    final_text = await llm.complete(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": FROM_APPLICATION_VACANCY_PROMPT},
+            {"role": "user", "content": f"Сформируй вакансию из этой заявки:\n{raw_text}"}
+        ],
+        user_id=task.user_id,
+        temperature=0.5 # Низкая температура для исключения галлюцинаций
+    )
 
-    except Exception as e:
-        await message.answer(f"❌ Ошибка: {e}")
-    
-    await state.set_state(None)
+    # Вытаскиваем название (оно в шаблоне после "Вакансия: ")
+    title = "Новая вакансия"
+    if "Вакансия:" in final_text:
+        title = final_text.split("Вакансия:")[1].split("\n")[0].strip()
+
+    await task_state(task).update_data(job_title=title, job_text=final_text)
+
+    # Показываем результат и кнопку сохранения
+    await task_message(task).edit_text(f"<b>📋 Результат:</b>\n\n{final_text}", parse_mode="HTML")
+
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="💾 Сохранить в базу", callback_data="save_vac_confirmed")],
+        [InlineKeyboardButton(text="🔄 Сбросить", callback_data="start")]
+    ])
+    await bot.send_message(task.chat_id, f"Сохранить вакансию '{title}'?", reply_markup=kb)
 
 @dp.callback_query(F.data == "save_vac_confirmed")
 async def confirm_save_vac(callback: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
     title, text = data.get("job_title"), data.get("job_text")
     
-    db.save_vacancy(title, text)
+    await db.run(db.save_vacancy, title, text)
     await callback.message.edit_text(f"🎯 Вакансия '{title}' успешно сохранена в базу!", reply_markup=main_menu_kb())
     await callback.answer()
 
@@ -449,34 +778,43 @@ async def generate_reverse_vac(callback: types.CallbackQuery, state: FSMContext)
         await callback.answer("⚠️ Пришлите хотя бы 2 резюме для анализа!", show_alert=True)
         return
 
-    await callback.message.answer("⌛ Нейросеть изучает опыт кандидатов и формирует список задач...")
-    
-    combined_text = "\n\n--- СЛЕДУЮЩЕЕ РЕЗЮМЕ ---\n\n".join(resumes)
-    
-    try:
-        res = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": REVERSE_VACANCY_PROMPT},
-                {"role": "user", "content": f"Вот резюме для анализа:\n{combined_text}"}
-            ],
-            temperature=0.7 # Здесь можно чуть выше, так как нужен творческий синтез
-        )
-        final_duties = res.choices[0].message.content
-        
-        # Сохраняем черновик в FSM, чтобы пользователь мог его потом сохранить как вакансию
-        await state.update_data(last_gen_vac=final_duties)
-        
-        await callback.message.answer(f"📋 **Сформированные обязанности:**\n\n{final_duties}")
-        await callback.message.answer(
-            "Вы можете скопировать этот текст или использовать его для создания новой вакансии.",
-            reply_markup=main_menu_kb()
-        )
-        await state.set_state(None)
-    except Exception as e:
-        await callback.message.answer(f"❌ Ошибка генерации: {e}")
-    
     await callback.answer()
+    # Резюме берутся из FSM при выполнении задачи, в задачу их не копируем
+    await enqueue_task(callback.message, callback.from_user.id, "reverse_vac", {}, jobs.PRIORITY_NORMAL,
+                       "⌛ Нейросеть изучает опыт кандидатов и формирует список задач...")
+
+async def reverse_vac_task(task):
+    state = task_state(task)
+    resumes = (await state.get_data()).get("temp_resumes", [])
+    if len(resumes) < 2:
+        raise jobs.PermanentJobError("нужно хотя бы 2 резюме")
+
+    target = ChatTarget(task.chat_id)
+    streamer = MessageStreamer(target, header="📋 **Сформированные обязанности:**\n\n")
+    await streamer.start(task_message(task))
+
+    combined_text = "\n\n--- СЛЕДУЮЩЕЕ РЕЗЮМЕ ---\n\n".join(resumes)
+    async for delta in llm.stream(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": REVERSE_VACANCY_PROMPT},
+            {"role": "user", "content": f"Вот резюме для анализа:\n{combined_text}"}
+        ],
+        user_id=task.user_id,
+        temperature=0.7 # Здесь можно чуть выше, так как нужен творческий синтез
+    ):
+        await streamer.feed(delta)
+    final_duties = streamer.text
+
+    # Сохраняем черновик в FSM, чтобы пользователь мог его потом сохранить как вакансию
+    await state.update_data(last_gen_vac=final_duties)
+
+    await streamer.finish()
+    await target.answer(
+        "Вы можете скопировать этот текст или использовать его для создания новой вакансии.",
+        reply_markup=main_menu_kb()
+    )
+    await state.set_state(None)
 
 # --- Блок Резюме ---
 
@@ -498,41 +836,29 @@ async def handle_resume_input(message: types.Message, state: FSMContext):
     try:
         resume_text, resume_url = "", "Загружено вручную"
         
-        # Обработка файлов (PDF или DOCX)
+        # Обработка файлов (PDF или DOCX): из кэша сразу, иначе — задачей в очереди
         if message.document:
-            file_name = message.document.file_name.lower()
-            file_content = await bot.download(message.document)
-            file_bytes = file_content.read()
-
-            if file_name.endswith('.pdf'):
-                # Ваш существующий парсер для PDF
-                resume_text = extract_resume_data_from_pdf(file_bytes, client, OCR_SYSTEM_PROMPT)
-            
-            elif file_name.endswith('.docx') or file_name.endswith('.doc'):
-                # Читаем текст из Word
-                from docx_resume_parser import extract_resume_data_from_docx
-                raw_docx_text = extract_resume_data_from_docx(file_bytes)
-                
-                # Просим ИИ привести "сырой" текст из Word к нужному нам формату
-                # Это гарантирует, что в тексте появятся метки # ФИО и **Телефон**
-                res = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": OCR_SYSTEM_PROMPT},
-                        {"role": "user", "content": raw_docx_text}
-                    ]
-                )
-                resume_text = res.choices[0].message.content
-            else:
+            kind = resume_file_kind(message.document.file_name)
+            if kind is None:
                 await message.answer("❌ Формат не поддерживается. Пришлите PDF или DOCX.")
                 return
+            resume_text = await asyncio.to_thread(extraction_cache.get_by_file_id, message.document.file_unique_id,
+                                                  extraction_version(kind))
+            if not resume_text:
+                document = message.document
+                await enqueue_task(message, message.from_user.id, "resume_file",
+                                   {"file_id": document.file_id, "file_unique_id": document.file_unique_id,
+                                    "file_name": document.file_name},
+                                   jobs.PRIORITY_NORMAL, "⌛ Резюме в очереди на обработку...")
+                await state.set_state(None)
+                return
 
         elif method == "res_text":
             resume_text = message.text
         
         elif method == "res_hh":
             resume_url = message.text
-            resume_text = extract_resume_data(resume_url)
+            resume_text = await extract_resume_data(resume_url)
 
         if resume_text:
             await state.update_data(resume_text=resume_text, resume_url=resume_url)
@@ -545,9 +871,17 @@ async def handle_resume_input(message: types.Message, state: FSMContext):
     
     await state.set_state(None)
 
+async def resume_file_task(task):
+    document = types.Document(**task.payload)
+    resume_text = await parse_resume_file(document, task.user_id)
+    if not resume_text:
+        raise jobs.PermanentJobError("не удалось извлечь данные, попробуйте другой файл")
+    await task_state(task).update_data(resume_text=resume_text, resume_url="Загружено вручную")
+    await task_message(task).edit_text("✅ Резюме (Word/PDF) успешно обработано!", reply_markup=main_menu_kb())
+
 # --- Анализ и база ---
 
-@dp.callback_query(F.data == "run_analysis")
+@dp.callback_query(F.data.in_({"run_analysis", "run_analysis_fresh"}))
 async def run_analysis(callback: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
     job, resume, title = data.get("job_text"), data.get("resume_text"), data.get("job_title")
@@ -556,126 +890,650 @@ async def run_analysis(callback: types.CallbackQuery, state: FSMContext):
     if not job or not resume:
         await callback.answer("⚠️ Нет данных для анализа!", show_alert=True); return
     
-    await callback.message.answer("⌛ Анализирую...")
-    try:
-        res = client.chat.completions.create(model="gpt-4o-mini", messages=[{"role":"system","content":SYSTEM_PROMPT},{"role":"user","content":f"В:{job}\nР:{resume}"}])
-        analysis = res.choices[0].message.content
-        name = extract_info(resume, r"# ФИО:\s*(.*)")
-        phone = extract_info(resume, r"\*\*Телефон:\*\*\s*(.*)")
-        score_q, score_f, total_exp = extract_analysis_data(analysis)
-        
-        db.add_candidate(name, phone, title, f"{score_f}/10", f"{score_q}/10", total_exp, analysis, url)
-        safe_analysis = escape_markdown(analysis) # Экранируем текст от ИИ
-        await callback.message.answer(f"📊 **Анализ {name}:**\n\n{safe_analysis}", parse_mode="Markdown")
-        await callback.message.answer("✅ Результат сохранен.", reply_markup=main_menu_kb())
-    except Exception as e: await callback.message.answer(f"❌ Ошибка анализа: {e}")
     await callback.answer()
+    # Интерактивный приоритет: одиночный анализ не ждет пакетные задачи и OCR.
+    # Тексты копируются в задачу — результат не зависит от того, что пользователь загрузит потом
+    payload = {"job": job, "resume": resume, "title": title, "url": url,
+               "use_cache": callback.data != "run_analysis_fresh"}   # "Анализ заново" идет мимо кэша
+    await enqueue_task(callback.message, callback.from_user.id, "analysis", payload, jobs.PRIORITY_INTERACTIVE,
+                       "⌛ Анализирую...")
+
+async def analysis_task(task):
+    job, resume, title, url = (task.payload[k] for k in ("job", "resume", "title", "url"))
+    target = ChatTarget(task.chat_id)
+    name = extract_info(resume, r"# ФИО:\s*(.*)")
+    phone = extract_info(resume, r"\*\*Телефон:\*\*\s*(.*)")
+    # Анализ появляется в одном сообщении по мере генерации; текст от ИИ экранируется
+    streamer = MessageStreamer(target, header=f"📊 **Анализ {name}:**\n\n", parse_mode="Markdown",
+                               escape=escape_markdown)
+    await streamer.start(task_message(task))
+    analysis, from_cache = await analyze_candidate(job, resume, task.user_id, use_cache=task.payload["use_cache"],
+                                                   on_delta=streamer.feed)
+    score_q, score_f, total_exp = extract_analysis_data(analysis)
+
+    # id кандидата запоминается в задаче: повтор после сбоя при отправке результата не создаст дубль
+    if "candidate_id" not in task.payload:
+        task.payload["candidate_id"] = await db.run(db.add_candidate, name, phone, title, f"{score_f}/10", f"{score_q}/10",
+                                                    total_exp, analysis, url, resume, job_text=job)
+        await db.run(jobs.update_payload, task.id, task.payload)
+    await streamer.finish(analysis)
+    if from_cache:
+        kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🔄 Анализ заново", callback_data="run_analysis_fresh")],
+            [InlineKeyboardButton(text="⬅️ В меню", callback_data="start")]
+        ])
+        await target.answer("⚡ Результат взят из кэша и сохранен.", reply_markup=kb)
+    else:
+        await target.answer("✅ Результат сохранен.", reply_markup=main_menu_kb())
 
 @dp.callback_query(F.data == "view_candidates")
 async def show_vac_list(callback: types.CallbackQuery):
-    vacs = db.get_vacancies()
+    vacs = await db.run(db.get_vacancies)
     if not vacs: await callback.answer("База пуста", show_alert=True); return
-    btns = [[InlineKeyboardButton(text=v, callback_data=f"list_{v[:20]}")] for v in vacs]
+    btns = [[InlineKeyboardButton(text=name, callback_data=f"list_{vac_id}")] for vac_id, name in vacs]
     await callback.message.edit_text("Список кандидатов по вакансии:", reply_markup=InlineKeyboardMarkup(inline_keyboard=btns))
 
+CANDIDATES_PAGE_SIZE = 10
+_SORT_CODES = {"s": "score", "d": "date"}
+_DIRECTION_CODES = {"f": "first", "n": "next", "p": "prev"}
+
+async def render_candidates_page(vacancy_id, sort="s", direction="f", cursor=None):
+    """
+    Текст и клавиатура одной страницы списка кандидатов.
+    Кнопки листания несут курсор (оценка, id) крайней строки: cp_<вакансия>_<сортировка>_<направление>_<оценка>_<id>
+    """
+    rows, has_prev, has_next = await db.run(
+        db.get_candidates_page, vacancy_id, _SORT_CODES[sort], _DIRECTION_CODES[direction], cursor, CANDIDATES_PAGE_SIZE
+    )
+    if not rows:
+        return None, None
+
+    sort_title = "по оценке" if sort == "s" else "по дате"
+    text = f"👥 **Результаты анализа** ({sort_title}):\n\n" + "\n".join(
+        [f"👤 {escape_markdown(c[1] or '')} ({c[3]})\n📞 {escape_markdown(c[2] or '')}\n🔗 {escape_markdown(c[4] or '')}\n---" for c in rows]
+    )
+
+    first, last = rows[0], rows[-1]
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"cp_{vacancy_id}_{sort}_p_{first[5]}_{first[0]}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=f"cp_{vacancy_id}_{sort}_n_{last[5]}_{last[0]}"))
+
+    other_sort = "d" if sort == "s" else "s"
+    buttons = [nav] if nav else []
+    buttons += [
+        [InlineKeyboardButton(text="📅 По дате" if sort == "s" else "⭐ По оценке", callback_data=f"cp_{vacancy_id}_{other_sort}_f_0_0")],
+        [InlineKeyboardButton(text="🧭 Похожие резюме из базы", callback_data=f"sim_{vacancy_id}")],
+        [InlineKeyboardButton(text="📥 Скачать Excel", callback_data=f"excel_{vacancy_id}"),
+         InlineKeyboardButton(text="📄 CSV", callback_data=f"csv_{vacancy_id}")],
+        [InlineKeyboardButton(text="⬅️ В меню", callback_data="start")]
+    ]
+    return text, InlineKeyboardMarkup(inline_keyboard=buttons)
+
 @dp.callback_query(F.data.startswith("list_"))
 async def show_cands(callback: types.CallbackQuery):
     part = callback.data.replace("list_", "")
-    conn = sqlite3.connect('hr_assistant.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT full_name, phone, score, resume_url FROM candidates WHERE vacancy_name LIKE ?', (part + '%',))
-    cands = cursor.fetchall()
-    conn.close()
-    
-    if not cands: await callback.answer("Кандидатов нет."); return
+    vacancy_id = await db.run(db.find_vacancy_id, part)
+    text, kb = await render_candidates_page(vacancy_id) if vacancy_id is not None else (None, None)
     
-    text = "👥 **Результаты анализа:**\n\n" + "\n".join([f"👤 {c[0]} ({c[2]})\n📞 {c[1]}\n🔗 {c[3]}\n---" for c in cands])
-    
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📥 Скачать Excel", callback_data=f"excel_{part}")],
-        [InlineKeyboardButton(text="⬅️ В меню", callback_data="start")]
-    ])
+    if not text: await callback.answer("Кандидатов нет."); return
     
     await callback.message.answer(text, reply_markup=kb, parse_mode="Markdown")
     await callback.answer()
 
-@dp.callback_query(F.data.startswith("excel_"))
+@dp.callback_query(F.data.startswith("cp_"))
+async def page_cands(callback: types.CallbackQuery):
+    """Листание и смена сортировки: страница перерисовывается в том же сообщении."""
+    _, vacancy_id, sort, direction, score_value, cand_id = callback.data.split("_")
+    cursor = (int(score_value), int(cand_id)) if direction != "f" else None
+    text, kb = await render_candidates_page(int(vacancy_id), sort, direction, cursor)
+
+    if not text: await callback.answer("Кандидатов нет."); return
+
+    await callback.message.edit_text(text, reply_markup=kb, parse_mode="Markdown")
+    await callback.answer()
+
+@dp.callback_query(F.data.startswith("sim_"))
+async def show_similar(callback: types.CallbackQuery):
+    """Мгновенный подбор без GPT: кандидаты всей базы по сходству резюме с текстом вакансии."""
+    vacancy_id = await db.run(db.find_vacancy_id, callback.data.replace("sim_", ""))
+    rows = await db.run(db.similar_candidates, vacancy_id, CANDIDATES_PAGE_SIZE) if vacancy_id is not None else []
+    if not rows: await callback.answer("Нет резюме для сравнения."); return
+
+    text = "🧭 **Похожие резюме из базы** (сходство с вакансией, без GPT):\n\n" + "\n".join(
+        f"{i}. {escape_markdown(name or '')} — {similarity:.0%}\n    {escape_markdown(vacancy or '')}, оценка {score}\n    🔗 {escape_markdown(url or '')}"
+        for i, (_, name, vacancy, score, url, similarity) in enumerate(rows, 1)
+    )
+    await callback.message.answer(text, parse_mode="Markdown", reply_markup=main_menu_kb())
+    await callback.answer()
+
+@dp.callback_query(F.data.startswith("excel_") | F.data.startswith("csv_"))
 async def export_to_excel(callback: types.CallbackQuery):
-    part = callback.data.replace("excel_", "")
+    fmt, part = callback.data.split("_", 1)
+    fmt = "csv" if fmt == "csv" else "xlsx"
+    vacancy_id = await db.run(db.find_vacancy_id, part)
     await callback.answer("⏳ Генерирую файл...")
     
-    conn = sqlite3.connect('hr_assistant.db')
-    query = '''
-        SELECT full_name as "ФИО", 
-               phone as "Телефон", 
-               vacancy_name as "Вакансия", 
-               score as "Оценка", 
-               resume_url as "Ссылка",
-               analysis_text as "Анализ ИИ"
-        FROM candidates 
-        WHERE vacancy_name LIKE ?
-    '''
-    df = pd.read_sql_query(query, conn, params=(part + '%',))
-    conn.close()
-    
-    if df.empty:
+    # Файл пишется потоково во временный файл в потоке пула базы (его соединение) и отправляется с диска
+    exported = await db.run(export_candidates, vacancy_id, fmt) if vacancy_id is not None else None
+    if not exported:
         await callback.message.answer("❌ Данные не найдены."); return
 
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Кандидаты')
-    output.seek(0)
-    
-    file_name = f"Candidates_{part[:15]}.xlsx"
-    input_file = BufferedInputFile(output.read(), filename=file_name)
-    
-    await callback.message.answer_document(
-        document=input_file,
-        caption=f"📊 Выгружен список по вакансии: **{df['Вакансия'].iloc[0]}**",
-        parse_mode="Markdown"
-    )
+    path, file_name, vacancy_name = exported
+    try:
+        await callback.message.answer_document(
+            document=FSInputFile(path, filename=file_name),
+            caption=f"📊 Выгружен список по вакансии: **{escape_markdown(vacancy_name)}**",
+            parse_mode="Markdown"
+        )
+    finally:
+        os.remove(path)
 
 @dp.callback_query(F.data == "close_vacancy")
 async def show_del_list(callback: types.CallbackQuery):
-    vacs = db.get_vacancies()
+    vacs = await db.run(db.get_vacancies)
     if not vacs: await callback.answer("Нет вакансий", show_alert=True); return
-    btns = [[InlineKeyboardButton(text=f"🗑 {v}", callback_data=f"del_{v[:20]}")] for v in vacs]
+    btns = [[InlineKeyboardButton(text=f"🗑 {name}", callback_data=f"del_{vac_id}")] for vac_id, name in vacs]
     await callback.message.edit_text("Выберите вакансию для УДАЛЕНИЯ:", reply_markup=InlineKeyboardMarkup(inline_keyboard=btns))
 
 @dp.callback_query(F.data.startswith("del_"))
 async def process_delete(callback: types.CallbackQuery):
     part = callback.data.replace("del_", "")
-    db.delete_vacancy_and_candidates(part)
+    vacancy_id = await db.run(db.find_vacancy_id, part)
+    if vacancy_id is not None:
+        await db.run(db.delete_vacancy_and_candidates, vacancy_id)
     await callback.answer("✅ Вакансия и кандидаты удалены.", show_alert=True)
     await callback.message.edit_text("Готово. Что дальше?", reply_markup=main_menu_kb())
 
 # 2. Сбор файлов и текста (хендлер для состояния waiting_for_multi_resumes)
 @dp.message(Form.waiting_for_multi_resumes)
 async def collect_resumes(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    temp_resumes = data.get("temp_resumes", [])
-    
     text_to_add = ""
     
     if message.document and message.document.mime_type == 'application/pdf':
-        file_content = await bot.download(message.document)
-        text_to_add = extract_resume_data_from_pdf(file_content.read(), client, OCR_SYSTEM_PROMPT)
-        await message.answer(f"✅ Файл '{message.document.file_name}' добавлен.")
+        document = message.document
+        text_to_add = await asyncio.to_thread(extraction_cache.get_by_file_id, document.file_unique_id,
+                                              extraction_version("pdf"))
+        if not text_to_add:
+            # Скачивание, OCR и оформление GPT — задачей в очереди; резюме добавит в список обработчик
+            await enqueue_task(message, message.from_user.id, "collect_resume",
+                               {"document": {"file_id": document.file_id, "file_unique_id": document.file_unique_id,
+                                             "file_name": document.file_name}},
+                               jobs.PRIORITY_INTERACTIVE, f"⌛ Файл '{document.file_name}' в очереди на обработку...")
+            return
+        await message.answer(f"✅ Файл '{document.file_name}' добавлен.")
     elif message.text:
         text_to_add = message.text
         await message.answer("✅ Текст добавлен.")
     
     if text_to_add:
-        temp_resumes.append(text_to_add)
-        await state.update_data(temp_resumes=temp_resumes)
-    
-    await message.answer(f"В списке уже {len(temp_resumes)} резюме. Пришлите еще или нажмите кнопку выше для генерации.")
+        await add_temp_resume(state, message, text_to_add)
 
-async def main():
-    db.init_db()
-    await bot.set_my_commands([types.BotCommand(command="start", description="Меню"), types.BotCommand(command="help", description="Помощь")])
+async def add_temp_resume(state, target, text):
+    """
+    Добавляет резюме в список для вакансии по резюме. Файлы альбома приходят параллельно,
+    поэтому список дополняется одной транзакцией хранилища, а не чтением и перезаписью.
+    """
+    try:
+        count = await state.storage.append_data(state.key, "temp_resumes", text)
+    except fsm_storage.StorageLimitError:
+        await target.answer("⚠️ Достигнут лимит объема резюме в списке. Сгенерируйте результат или начните заново."); return
+    await target.answer(f"В списке уже {count} резюме. Пришлите еще или нажмите кнопку выше для генерации.")
+
+async def collect_resume_task(task):
+    document = types.Document(**task.payload["document"])
+    resume_text = await parse_resume_file(document, task.user_id)
+    if not resume_text:
+        raise jobs.PermanentJobError("не удалось извлечь данные, попробуйте другой файл")
+    await task_message(task).edit_text(f"✅ Файл '{document.file_name}' добавлен.")
+    # Отметка в задаче: повтор после сбоя не добавит резюме в список второй раз
+    if not task.payload.get("added"):
+        await add_temp_resume(task_state(task), ChatTarget(task.chat_id), resume_text)
+        task.payload["added"] = True
+        await db.run(jobs.update_payload, task.id, task.payload)
+
+# --- Пакетный анализ ---
+
+# Параллелизм этапов пакетной обработки
+BATCH_DOWNLOAD_CONCURRENCY = int(os.getenv("BATCH_DOWNLOAD_CONCURRENCY", "4"))
+BATCH_EXTRACT_CONCURRENCY = int(os.getenv("BATCH_EXTRACT_CONCURRENCY", "2"))
+BATCH_SCORE_CONCURRENCY = int(os.getenv("BATCH_SCORE_CONCURRENCY", "4"))
+BATCH_QUEUE_SIZE = int(os.getenv("BATCH_QUEUE_SIZE", "20"))
+BATCH_PROGRESS_INTERVAL = 2.0  # секунды между правками сообщения о прогрессе
+# Оценка пачкой резюме в одном запросе к GPT (ranking.py): дешевле, но анализ короче полного.
+# По умолчанию выключена — каждое резюме получает полный анализ по SYSTEM_PROMPT
+BATCH_RANKING = os.getenv("BATCH_RANKING", "0") == "1"
+# Ограничения для ZIP-архивов
+ZIP_MAX_FILES = 500
+ZIP_MAX_FILE_SIZE = 20 * 1024 * 1024
+ZIP_MAX_TOTAL_SIZE = 200 * 1024 * 1024   # распакованного из одного архива (защита от zip-бомб)
+
+# Файлы приходят пачкой (альбомом) параллельно — список дополняем под замком
+_batch_locks = defaultdict(asyncio.Lock)
+
+def batch_kb():
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🚀 Запустить анализ", callback_data="batch_run")],
+        [InlineKeyboardButton(text="🔄 Сбросить", callback_data="start")]
+    ])
+
+async def rank_candidates(job, resumes):
+    """
+    Анализы списка резюме по одной вакансии: из кэша, затем общими запросами ranking.
+    Кандидатов, которых нет в ответе пакетной оценки, оцениваем отдельным анализом.
+    """
+    version = f"rank-{ranking.RANK_PROMPT_VERSION}"
+    keys = [analysis_cache.make_key(ANALYSIS_MODEL, version, job, resume) for resume in resumes]
+    results = [await db.run(analysis_cache.get_analysis, key) for key in keys]
+    missing = [i for i, analysis in enumerate(results) if analysis is None]
+    if not missing:
+        return results
+
+    ranked = await ranking.rank_resumes(llm, job, [resumes[i] for i in missing], ANALYSIS_MODEL)
+    fallback = []
+    for i, analysis in zip(missing, ranked):
+        if analysis is None:
+            fallback.append(i)
+        else:
+            results[i] = analysis
+            await db.run(analysis_cache.put_analysis, keys[i], ANALYSIS_MODEL, analysis)
+    for i, (analysis, _) in zip(fallback, await asyncio.gather(*(analyze_candidate(job, resumes[i]) for i in fallback))):
+        results[i] = analysis
+    return results
+
+def read_zip_member(archive, info, limit):
+    """Содержимое файла архива или None, если оно больше limit (размеру в заголовке верить нельзя)."""
+    with archive.open(info) as f:
+        data = f.read(limit + 1)
+    return data if len(data) <= limit else None
+
+async def unpack_zip(zip_bytes):
+    """
+    Резюме PDF/DOCX из ZIP по одному: (имя файла, содержимое). Асинхронный генератор: следующий
+    файл распаковывается, когда конвейер готов его принять, поэтому в памяти не весь архив.
+    """
+    archive = zipfile.ZipFile(io.BytesIO(zip_bytes))
+    try:
+        members = [info for info in archive.infolist()
+                   if not info.is_dir() and resume_file_kind(info.filename) and info.file_size <= ZIP_MAX_FILE_SIZE]
+        total = 0
+        for info in members[:ZIP_MAX_FILES]:
+            limit = min(ZIP_MAX_FILE_SIZE, ZIP_MAX_TOTAL_SIZE - total)
+            data = await asyncio.to_thread(read_zip_member, archive, info, limit)
+            if data is None:
+                if limit < ZIP_MAX_FILE_SIZE:
+                    raise ValueError(f"архив распаковывается больше чем в {ZIP_MAX_TOTAL_SIZE // 2**20} МБ")
+                continue
+            total += len(data)
+            yield os.path.basename(info.filename), data
+    finally:
+        archive.close()
+
+@dp.callback_query(F.data == "batch_start")
+async def start_batch(callback: types.CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    if not data.get("job_text"):
+        await callback.answer("⚠️ Сначала установите вакансию!", show_alert=True); return
+
+    await state.set_state(Form.waiting_for_batch_resumes)
+    await state.update_data(batch_items=[], batch_counter_msg=None)
+    await callback.message.answer(
+        f"📦 Пакетный анализ по вакансии **{escape_markdown(data.get('job_title') or '')}**\n\n"
+        "Пришлите резюме: файлы PDF/DOCX, ZIP-архив или ссылки HH.ru (можно несколько в одном сообщении).\n"
+        "Когда закончите, нажмите «Запустить анализ».",
+        parse_mode="Markdown",
+        reply_markup=batch_kb()
+    )
+    await callback.answer()
+
+@dp.message(Form.waiting_for_batch_resumes)
+async def collect_batch_item(message: types.Message, state: FSMContext):
+    new_items = []
+    if message.document:
+        name = message.document.file_name or "file"
+        if resume_file_kind(name) or name.lower().endswith(".zip"):
+            new_items.append({
+                "file_id": message.document.file_id,
+                "file_unique_id": message.document.file_unique_id,
+                "file_name": name,
+            })
+        else:
+            await message.answer(f"❌ '{name}': поддерживаются PDF, DOCX и ZIP."); return
+    elif message.text:
+        urls = re.findall(r'https?://\S*hh\.ru/resume/\S+', message.text)
+        new_items.extend({"url": url} for url in urls)
+        if not urls:
+            await message.answer("⚠️ Ссылки на резюме HH.ru не найдены."); return
+
+    async with _batch_locks[message.from_user.id]:
+        data = await state.get_data()
+        items = data.get("batch_items", []) + new_items
+        text = f"📥 В очереди: {len(items)}. Пришлите еще или нажмите «Запустить анализ»."
+        counter_msg = data.get("batch_counter_msg")
+        # Один счетчик, который редактируется, вместо ответа на каждый файл
+        if counter_msg:
+            try:
+                await bot.edit_message_text(text, chat_id=message.chat.id, message_id=counter_msg, reply_markup=batch_kb())
+            except Exception:
+                counter_msg = None
+        if not counter_msg:
+            sent = await message.answer(text, reply_markup=batch_kb())
+            counter_msg = sent.message_id
+        try:
+            await state.update_data(batch_items=items, batch_counter_msg=counter_msg)
+        except fsm_storage.StorageLimitError:
+            await message.answer("⚠️ Очередь пакета переполнена — запустите анализ.")
+
+@dp.callback_query(F.data == "batch_run")
+async def run_batch(callback: types.CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    items = data.get("batch_items", [])
+    job, title = data.get("job_text"), data.get("job_title")
+    if not items:
+        await callback.answer("⚠️ Список пуст — пришлите резюме.", show_alert=True); return
+    if not job:
+        await callback.answer("⚠️ Сначала установите вакансию!", show_alert=True); return
+
+    await state.update_data(batch_items=[], batch_counter_msg=None)
+    await state.set_state(None)
+    await callback.answer()
+
+    # Низший приоритет: пакет не задерживает одиночные анализы и загрузку резюме других пользователей.
+    # Повтор пакета целиком дублировал бы кандидатов в базе, поэтому попытка одна
+    await enqueue_task(callback.message, callback.from_user.id, "batch",
+                       {"items": items, "job": job, "title": title}, jobs.PRIORITY_BULK,
+                       f"⌛ Пакетный анализ: {len(items)} шт. в очереди...")
+
+async def batch_task(task):
+    items, job, title = task.payload["items"], task.payload["job"], task.payload["title"]
+    user_id = task.user_id
+    progress_msg = task_message(task)
+    last_edit = 0.0
+
+    # 1. Скачивание (файл из кэша извлечения не скачивается вовсе)
+    async def download(item):
+        if "url" in item:
+            return item
+        kind = resume_file_kind(item["file_name"])
+        if kind:
+            cached = await asyncio.to_thread(extraction_cache.get_by_file_id, item["file_unique_id"], extraction_version(kind))
+            if cached:
+                return {**item, "resume_text": cached}
+
+        file_bytes = await download_bytes(item["file_id"])
+        if item["file_name"].lower().endswith(".zip"):
+            return ({"file_name": name, "bytes": content} async for name, content in unpack_zip(file_bytes))
+        return {**item, "bytes": file_bytes}
+
+    # 2. Извлечение текста (PDF / DOCX / HH)
+    async def extract(item):
+        if "resume_text" in item:
+            return item
+        if "url" in item:
+            text = await extract_resume_data(item["url"])
+        else:
+            text = await parse_resume_bytes(item["file_name"], item.pop("bytes"), user_id, item.get("file_unique_id"))
+        if not text:
+            raise ValueError(f"не удалось извлечь текст: {item.get('file_name') or item.get('url')}")
+        return {**item, "resume_text": text}
+
+    # 3. Оценка GPT. user_id не передаем: параллелизм пакета задает BATCH_SCORE_CONCURRENCY,
+    # а общий лимит шлюза по-прежнему действует
+    async def score(item):
+        analysis, _ = await analyze_candidate(job, item["resume_text"])
+        return {**item, "analysis": analysis}
+
+    # 3'. Оценка пачкой: одна вакансия и несколько резюме в одном запросе
+    async def score_batch(batch):
+        analyses = await rank_candidates(job, [item["resume_text"] for item in batch])
+        return [{**item, "analysis": analysis} for item, analysis in zip(batch, analyses)]
+
+    # 4. Сохранение в базу
+    async def save(item):
+        resume, analysis = item["resume_text"], item["analysis"]
+        name = extract_info(resume, r"# ФИО:\s*(.*)")
+        phone = extract_info(resume, r"\*\*Телефон:\*\*\s*(.*)")
+        score_q, score_f, total_exp = extract_analysis_data(analysis)
+        url = item.get("url") or f"Файл: {item.get('file_name')}"
+        await db.run(db.add_candidate, name, phone, title, f"{score_f}/10", f"{score_q}/10", total_exp, analysis, url, resume,
+                     job_text=job)
+        return {"name": name, "phone": phone, "score_f": int(score_f), "score_q": int(score_q), "source": url}
+
+    # 4'. Отсеянные предварительным отбором сохраняются без оценки GPT, чтобы не пропасть из базы
+    async def save_screened(screened):
+        for item, similarity in screened:
+            resume = item["resume_text"]
+            name = extract_info(resume, r"# ФИО:\s*(.*)")
+            phone = extract_info(resume, r"\*\*Телефон:\*\*\s*(.*)")
+            url = item.get("url") or f"Файл: {item.get('file_name')}"
+            note = f"Не оценено GPT: отсеяно предварительным отбором (сходство с вакансией {similarity:.2f})."
+            await db.run(db.add_candidate, name, phone, title, "—", "—", "", note, url, resume, job_text=job)
+
+    prepare_stages = [
+        Stage("download", download, BATCH_DOWNLOAD_CONCURRENCY),
+        Stage("extract", extract, BATCH_EXTRACT_CONCURRENCY),
+    ]
+    gpt_stages = [
+        Stage("score", score_batch, BATCH_SCORE_CONCURRENCY, batch_size=ranking.RANK_MAX_BATCH, batch_wait=1.0)
+        if BATCH_RANKING else Stage("score", score, BATCH_SCORE_CONCURRENCY),
+        Stage("save", save, 1),
+    ]
+    stats = {s.name: {"done": 0, "failed": 0, "active": 0} for s in prepare_stages + gpt_stages}
+    screened_out = 0
+
+    def progress_text():
+        failed = sum(s["failed"] for s in stats.values())
+        screened = f"🧭 Отсеяно по сходству с вакансией: {screened_out}\n" if screened_out else ""
+        return (
+            f"⌛ Пакетный анализ: {len(items)} шт.\n"
+            f"⬇️ Скачано: {stats['download']['done']} | 📄 Разобрано: {stats['extract']['done']}\n"
+            f"{screened}"
+            f"🤖 Оценено: {stats['score']['done']} | 💾 Сохранено: {stats['save']['done']}\n"
+            f"❌ Ошибок: {failed}"
+        )
+
+    async def on_progress(stage_stats):
+        nonlocal last_edit
+        stats.update(stage_stats)
+        # Не чаще одной правки в BATCH_PROGRESS_INTERVAL секунд (лимиты Telegram)
+        if time.monotonic() - last_edit < BATCH_PROGRESS_INTERVAL:
+            return
+        last_edit = time.monotonic()
+        await progress_msg.edit_text(progress_text())
+
+    if prescreen.PRESCREEN_TOP_K > 0:
+        # Предварительный отбор: в GPT идут только PRESCREEN_TOP_K резюме, ближайших к вакансии.
+        # Top-K считается по всему пакету, поэтому сначала разбираются все резюме; отобранные идут
+        # в конвейер оценки, а остальные сохраняются без оценки, пока он работает.
+        prepared = await run_pipeline(items, prepare_stages, queue_size=BATCH_QUEUE_SIZE, on_progress=on_progress)
+        extracted = prepared.results
+        picked, similarity = await asyncio.to_thread(prescreen.shortlist, job, [item["resume_text"] for item in extracted])
+        chosen = set(picked)
+        screened_out = len(extracted) - len(chosen)
+        screened = [(item, similarity[i]) for i, item in enumerate(extracted) if i not in chosen]
+        result, _ = await asyncio.gather(
+            run_pipeline([extracted[i] for i in picked], gpt_stages, queue_size=BATCH_QUEUE_SIZE, on_progress=on_progress),
+            save_screened(screened),
+        )
+        result.errors = prepared.errors + result.errors
+        stats.update(prepared.stats)
+    else:
+        result = await run_pipeline(items, prepare_stages + gpt_stages, queue_size=BATCH_QUEUE_SIZE,
+                                    on_progress=on_progress)
+    stats.update(result.stats)
+
+    try:
+        await progress_msg.edit_text(progress_text().replace("⌛", "✅", 1), reply_markup=None)
+    except Exception:
+        pass
+
+    # Итоговый рейтинг
+    ranked = sorted(result.results, key=lambda r: (r["score_f"], r["score_q"]), reverse=True)
+    summary = f"🏆 **Рейтинг кандидатов** ({len(ranked)}):\n" if ranked else "⚠️ Ни одно резюме не удалось обработать."
+    for i, r in enumerate(ranked, 1):
+        line = f"\n{i}. {escape_markdown(r['name'])} — {r['score_f']}/10 (качество {r['score_q']}/10)"
+        # Лимит сообщения Telegram — 4096 символов, режем по целым строкам
+        if len(summary) + len(line) > 3900:
+            summary += f"\n... и еще {len(ranked) - i + 1}"
+            break
+        summary += line
+    if screened_out:
+        summary += f"\n\n🧭 Сохранено без оценки GPT (низкое сходство с вакансией): {screened_out}"
+    if result.errors:
+        summary += f"\n\n❌ Не обработано: {len(result.errors)}"
+    await bot.send_message(task.chat_id, summary, parse_mode="Markdown", reply_markup=main_menu_kb())
+
+# --- Обход выдачи HH ---
+
+CRAWL_PROGRESS_INTERVAL = 3.0
+_crawl_tasks = {}   # id задания -> asyncio.Task
+
+async def evaluate_resume(job, resume):
+    """Оценка резюме для обхода: данные кандидата в виде, который пишет add_candidate."""
+    analysis, _ = await analyze_candidate(job, resume)
+    name = extract_info(resume, r"# ФИО:\s*(.*)")
+    phone = extract_info(resume, r"\*\*Телефон:\*\*\s*(.*)")
+    score_q, score_f, total_exp = extract_analysis_data(analysis)
+    return name, phone, f"{score_f}/10", f"{score_q}/10", total_exp, analysis
+
+async def start_crawl(job_id):
+    """Берет задание в аренду и запускает в фоне. False — оно уже выполняется (в этом или другом процессе)."""
+    if job_id in _crawl_tasks or not await db.run(db.claim_crawl_job, job_id, job_queue.owner, crawler.CRAWL_LEASE):
+        return False
+    task = asyncio.create_task(crawl_job_task(job_id))
+    _crawl_tasks[job_id] = task
+    task.add_done_callback(lambda _: _crawl_tasks.pop(job_id, None))
+    return True
+
+async def crawl_monitor_task():
+    """Продлевает аренду обходов этого процесса и продолжает брошенные (процесс-владелец остановился или упал)."""
+    while True:
+        try:
+            await db.run(db.renew_crawl_leases, job_queue.owner)
+            for job_id in await db.run(db.get_abandoned_crawl_jobs, crawler.CRAWL_LEASE):
+                await start_crawl(job_id)
+        except Exception as e:
+            logging.warning("Crawl monitor failed: %s", e)
+        await asyncio.sleep(crawler.CRAWL_MONITOR_INTERVAL)
+
+async def stop_crawls():
+    """Прерывает обходы процесса; аренда освобождается, и их продолжит следующий запуск или другой процесс."""
+    running = dict(_crawl_tasks)
+    for task in running.values():
+        task.cancel()
+    await asyncio.gather(*running.values(), return_exceptions=True)
+    # Задача, отмененная до первого шага, не дошла до своего finally
+    for job_id in running:
+        await db.run(db.release_crawl_job, job_id, job_queue.owner)
+
+async def crawl_job_task(job_id):
+    try:
+        await run_crawl_job(job_id)
+    finally:
+        await db.run(db.release_crawl_job, job_id, job_queue.owner)
+
+async def run_crawl_job(job_id):
+    job = await db.run(db.get_crawl_job, job_id)
+    chat_id = job[5]
+    progress_msg = None
+    last_edit = 0.0
+
+    def progress_text(state, stats):
+        return (
+            f"🕸 Обход #{job_id}: страниц {state.pages_done}, новых резюме {state.found}\n"
+            f"📄 Загружено: {stats['extract']['done']} | 🤖 Оценено: {stats['score']['done']} | "
+            f"💾 Сохранено: {stats['save']['done']}\n"
+            f"❌ Ошибок: {sum(s['failed'] for s in stats.values())}"
+        )
+
+    async def on_progress(state, stats):
+        nonlocal progress_msg, last_edit
+        if not chat_id or time.monotonic() - last_edit < CRAWL_PROGRESS_INTERVAL:
+            return
+        last_edit = time.monotonic()
+        if progress_msg is None:
+            progress_msg = await bot.send_message(chat_id, progress_text(state, stats))
+        else:
+            await progress_msg.edit_text(progress_text(state, stats))
+
+    try:
+        state, counts = await crawler.run_crawl(job_id, evaluate_resume, on_progress)
+    except Exception as e:
+        logging.exception("Crawl job %s failed", job_id)
+        if chat_id:
+            await bot.send_message(chat_id, f"❌ Обход #{job_id} прерван: {e}")
+        return
+
+    if not chat_id:
+        return
+    text = (
+        f"✅ Обход #{job_id} завершен: страниц {state.pages_done}.\n"
+        f"💾 Сохранено кандидатов: {counts['done']} | ❌ Ошибок: {counts['failed']}"
+    )
+    if state.next_url:
+        reason = state.page_error or f"пройдено {crawler.CRAWL_MAX_PAGES} страниц выдачи за запуск"
+        text = (
+            f"⏸ Обход #{job_id} приостановлен: {reason}.\n"
+            f"💾 Сохранено кандидатов: {counts['done']}. Повторите /crawl с той же ссылкой, чтобы продолжить."
+        )
+    await bot.send_message(chat_id, text, reply_markup=main_menu_kb())
+
+job_queue.register("resume_file", resume_file_task)
+job_queue.register("collect_resume", collect_resume_task)
+job_queue.register("vac_docx", vac_docx_task)
+job_queue.register("reverse_vac", reverse_vac_task)
+job_queue.register("analysis", analysis_task)
+job_queue.register("batch", batch_task, max_attempts=1)
+
+async def fsm_cleanup_task():
+    """Периодически удаляет устаревшие состояния FSM и тексты без ссылок."""
+    while True:
+        try:
+            await db.run(fsm_storage.cleanup)
+        except Exception as e:
+            logging.warning("FSM cleanup failed: %s", e)
+        await asyncio.sleep(fsm_storage.FSM_CLEANUP_INTERVAL)
+
+async def startup(primary=True):
+    """
+    Подготовка процесса бота. primary — процесс, который регистрирует команды и чистит FSM
+    (в режиме webhook процессов несколько, это делается в одном). Возвращает фоновые задачи.
+    """
     logging.basicConfig(level=logging.INFO)
-    await dp.start_polling(bot)
+    await db.run(db.init_db)
+    await db.run(analysis_cache.init_cache)
+    # Воркеры очереди задач и обходы есть в каждом процессе: задания общие, в базе, и выполняются
+    # по аренде. Обходы, прерванные остановкой бота, продолжаются с контрольной точки.
+    job_queue.start()
+    background = [asyncio.create_task(crawl_monitor_task())]
+    if not primary:
+        return background
+    await bot.set_my_commands([types.BotCommand(command="start", description="Меню"), types.BotCommand(command="help", description="Помощь"),
+                               types.BotCommand(command="crawl", description="Обход выдачи HH"),
+                               types.BotCommand(command="search", description="Поиск кандидатов"),
+                               types.BotCommand(command="jobs", description="Мои задачи")])
+    return background + [asyncio.create_task(fsm_cleanup_task())]
+
+async def shutdown(background):
+    for task in background:
+        task.cancel()
+    await stop_crawls()
+    # Незавершенные задачи возвращаются в очередь
+    await job_queue.stop()
+    await hh_client.close_client()
+    await bot.session.close()
+    db.close_all()
+
+async def main():
+    background = await startup()
+    metrics_server = await metrics.serve() if metrics.METRICS_PORT else None
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if metrics_server:
+            await metrics_server.cleanup()
+        await shutdown(background)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
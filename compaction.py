@@ -0,0 +1,226 @@
+import os
+import re
+import math
+import logging
+import threading
+import metrics
+
+try:
+    import tiktoken
+except ImportError:  # без tiktoken токены оцениваются по длине слов
+    tiktoken = None
+
+# Сжатие текстов перед отправкой в GPT: чистка шума (навигация HH, служебные строки,
+# повторы, лишние пробелы) и отбор разделов по приоритету в пределах бюджета токенов.
+# Раздел, который не влезает целиком, обрезается по строкам; порядок разделов в тексте сохраняется.
+
+VERSION = 1  # увеличить при изменении правил (входит в версию кэша извлечения)
+DEFAULT_MODEL = "gpt-4o-mini"
+
+# Бюджеты входа по моделям (токены): resume — резюме для анализа, job — вакансия,
+# raw — сырой текст PDF/DOCX перед структурированием
+MODEL_BUDGETS = {
+    "gpt-4o-mini": {"resume": 2500, "job": 1500, "raw": 6000},
+    "gpt-4o": {"resume": 2000, "job": 1200, "raw": 5000},
+}
+DEFAULT_BUDGETS = {"resume": 2000, "job": 1200, "raw": 5000}
+# Переопределение для всех моделей: COMPACT_RESUME_TOKENS, COMPACT_JOB_TOKENS, COMPACT_RAW_TOKENS
+ENV_BUDGETS = {
+    kind: int(os.getenv(f"COMPACT_{kind.upper()}_TOKENS"))
+    for kind in ("resume", "job", "raw") if os.getenv(f"COMPACT_{kind.upper()}_TOKENS")
+}
+
+# Разделы: (приоритет, шаблон заголовка). Меньше — важнее; текст до первого заголовка
+# и заголовок первого уровня (# ФИО, # Название вакансии) — 0
+SECTIONS = {
+    "resume": [
+        (0, re.compile(r'фио\b.*|данные для анализа|контакты', re.I)),
+        (1, re.compile(r'(опыт работы|опыт|experience|места работы)(\s*[—–-]?\s*\d+\s*(год|лет|мес).*)?', re.I)),
+        (2, re.compile(r'(ключевые )?навыки|skills|компетенции|технологии', re.I)),
+        (3, re.compile(r'образование|education', re.I)),
+        (4, re.compile(r'о себе|обо мне|about|дополнительн', re.I)),
+        (5, re.compile(r'курсы|повышение квалификации|сертификат|тесты|языки|гражданство|рекомендации', re.I)),
+    ],
+    "job": [
+        (1, re.compile(r'требования|ожидаем|нам важно|мы ждем', re.I)),
+        (2, re.compile(r'обязанности|задачи|чем предстоит|главная задача', re.I)),
+        (3, re.compile(r'ключевые навыки|навыки', re.I)),
+        (4, re.compile(r'условия|мы предлагаем|предлагаем', re.I)),
+        (5, re.compile(r'о компании|о нас|описание', re.I)),
+    ],
+}
+SECTIONS["raw"] = SECTIONS["resume"]
+OTHER_PRIORITY = 4   # раздел с незнакомым заголовком
+KEY_PRIORITY = 3     # разделы до этого приоритета (опыт, навыки, образование) обязательны
+SECTION_MIN_TOKENS = 150  # сколько оставлять каждому обязательному разделу, пока идут более важные
+HEADING_MAX_LEN = 60
+
+# Строки-шум: навигация и служебные надписи HH, ссылки, колонтитулы
+NOISE_RE = re.compile(
+    r'^(?:показать (?:еще|все|полностью|контакты)|скрыть|откликнуться|пригласить|'
+    r'скачать(?: резюме)?|распечатать|поделиться|в избранное|добавить в избранное|'
+    r'написать|позвонить|войти|регистрация|создать резюме|мои резюме|поиск|'
+    r'резюме обновлено.*|обновлено \d.*|\d+ просмотр\w*.*|страница \d+( из \d+)?|'
+    r'©.*|https?://\S+|www\.\S+|[\W_]+)$',
+    re.I
+)
+
+tokens_before = 0
+tokens_after = 0
+calls = 0
+
+_encodings = {}
+# Токенизатор загружается один раз: compact вызывается из нескольких потоков (to_thread),
+# и без блокировки каждый поток пытался бы скачать словарь сам
+_encodings_lock = threading.Lock()
+
+
+def _load_encoding(model):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # Словарь токенизатора не скачался (нет сети) — работаем по оценке
+        logging.warning("tiktoken unavailable, using estimate: %s", e)
+        return None
+
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    if model in _encodings:
+        return _encodings[model]
+    with _encodings_lock:
+        if model not in _encodings:
+            _encodings[model] = _load_encoding(model)
+        return _encodings[model]
+
+def count_tokens(text, model=DEFAULT_MODEL):
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # Оценка с запасом: ~3.5 символа слова на токен (кириллица), знак препинания — токен
+    return sum(math.ceil(len(piece) / 3.5) for piece in re.findall(r'\w+|[^\w\s]', text))
+
+def budget_for(kind, model=DEFAULT_MODEL):
+    if kind in ENV_BUDGETS:
+        return ENV_BUDGETS[kind]
+    return MODEL_BUDGETS.get(model, DEFAULT_BUDGETS)[kind]
+
+def clean(text):
+    """Убирает шумовые строки, повторы строк и лишние пробелы."""
+    lines, seen = [], set()
+    for line in text.splitlines():
+        line = re.sub(r'[ \t\u00a0\u200b]+', ' ', line).strip()
+        if not line:
+            if lines and lines[-1]:
+                lines.append("")
+            continue
+        if NOISE_RE.match(line):
+            continue
+        key = line.lower()
+        # Повторы (OCR, дубли блоков страницы) — кроме коротких строк вроде дат и «Москва»
+        if len(key) > 20 and key in seen:
+            continue
+        seen.add(key)
+        lines.append(line)
+    return "\n".join(lines).strip()
+
+def _heading_priority(line, kind):
+    title = line.lstrip('#').strip(' *:').strip()
+    if not title or len(title) > HEADING_MAX_LEN:
+        return None
+    is_heading = line.startswith('#') or line.endswith(':') or (line.startswith('**') and line.endswith('**'))
+    for priority, pattern in SECTIONS[kind]:
+        # Без разметки заголовком считаем только строку, целиком состоящую из названия раздела
+        if pattern.fullmatch(title) or (is_heading and pattern.match(title)):
+            return priority
+    if line.startswith('# '):
+        return 0
+    return OTHER_PRIORITY if line.startswith('#') else None
+
+def split_sections(text, kind):
+    """Список [приоритет, строки] в порядке текста."""
+    sections = [[0, []]]
+    for line in text.split("\n"):
+        priority = _heading_priority(line, kind)
+        if priority is not None:
+            sections.append([priority, [line]])
+        else:
+            sections[-1][1].append(line)
+    return [s for s in sections if any(s[1])]
+
+def _truncate(lines, budget, model):
+    """Строки с начала, пока влезают в бюджет; длинная строка режется по словам."""
+    kept, used = [], 0
+    for line in lines:
+        cost = count_tokens(line, model) + 1
+        if used + cost <= budget:
+            kept.append(line)
+            used += cost
+            continue
+        words, part = line.split(" "), []
+        for word in words:
+            word_cost = count_tokens(word, model) + 1
+            if used + word_cost > budget:
+                break
+            part.append(word)
+            used += word_cost
+        if part:
+            kept.append(" ".join(part) + " …")
+        break
+    return kept
+
+@metrics.timed("compact")
+def compact(text, kind="resume", model=DEFAULT_MODEL, budget=None):
+    """
+    Сжимает текст резюме (kind="resume"/"raw") или вакансии (kind="job") до бюджета токенов модели.
+    Разделы берутся по приоритету: для резюме — опыт, навыки, образование, остальное.
+    """
+    global tokens_before, tokens_after, calls
+    if not text:
+        return text
+    budget = budget or budget_for(kind, model)
+    before = count_tokens(text, model)
+    result = clean(text)
+
+    if count_tokens(result, model) > budget:
+        sections = split_sections(result, kind)
+        costs = [sum(count_tokens(line, model) + 1 for line in lines) for _, lines in sections]
+        order = sorted(range(len(sections)), key=lambda i: (sections[i][0], i))
+        remaining = budget
+        included = {}
+        for position, index in enumerate(order):
+            # Длинный опыт не должен вытеснить навыки и образование целиком
+            reserve = sum(
+                min(costs[j], SECTION_MIN_TOKENS) for j in order[position + 1:]
+                if sections[j][0] <= KEY_PRIORITY
+            )
+            allowance = remaining - reserve if sections[index][0] <= KEY_PRIORITY else remaining
+            if allowance <= 0:
+                continue
+            lines = _truncate(sections[index][1], allowance, model)
+            # Один заголовок без содержимого не нужен
+            if len(lines) == 1 and index and len(sections[index][1]) > 1:
+                lines = []
+            if lines:
+                included[index] = lines
+                remaining -= sum(count_tokens(line, model) + 1 for line in lines)
+        result = "\n".join("\n".join(included[i]) for i in sorted(included)).strip()
+
+    after = count_tokens(result, model)
+    tokens_before += before
+    tokens_after += after
+    calls += 1
+    if before != after:
+        logging.info("Compaction %s: %d -> %d tokens (-%d%%)", kind, before, after, 100 - after * 100 // max(before, 1))
+    return result
+
+def compaction_stats():
+    return {
+        "calls": calls,
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+    }
@@ -0,0 +1,111 @@
+import os
+import asyncio
+import logging
+import database as db
+from parse_hh import get_html, extract_resume_data, parse_search_page, resume_id, RESUME_ACCESS_ERROR
+from pipeline import Stage, run_pipeline
+
+# Обход выдачи HH (поиск резюме или отклики на вакансию работодателя):
+# страницы выдачи идут по ссылке «дальше» последовательно, а найденные резюме
+# параллельно скачиваются, оцениваются и сохраняются в кандидаты.
+# После каждой страницы в crawl_jobs/crawl_items пишется контрольная точка,
+# поэтому прерванный обход продолжается с того же места. Задание выполняет процесс,
+# взявший его в аренду (CRAWL_LEASE); брошенное задание продолжает любой процесс бота.
+
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "4"))              # резюме скачиваются одновременно
+CRAWL_SCORE_CONCURRENCY = int(os.getenv("CRAWL_SCORE_CONCURRENCY", "4"))  # одновременных оценок GPT
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "50"))          # страниц выдачи за один запуск
+CRAWL_ITEM_ATTEMPTS = int(os.getenv("CRAWL_ITEM_ATTEMPTS", "3"))    # попыток на резюме, которое не загрузилось или не оценилось
+CRAWL_QUEUE_SIZE = int(os.getenv("CRAWL_QUEUE_SIZE", "20"))
+CRAWL_LEASE = 60.0              # секунды без продления, после которых обход считается брошенным
+CRAWL_MONITOR_INTERVAL = 5.0    # продление аренды и поиск брошенных обходов
+
+
+class CrawlState:
+    def __init__(self, job):
+        self.job_id, self.start_url, self.next_url, self.vacancy_name, self.job_text, \
+            self.chat_id, self.status, self.pages_done = job
+        self.found = 0          # новых резюме в этом запуске
+        self.pages_run = 0      # страниц выдачи в этом запуске
+        self.page_error = None  # страница выдачи не загрузилась — обход можно продолжить позже
+
+
+async def _pending(job_id):
+    """Необработанные резюме и резюме с ошибкой, у которых остались попытки."""
+    for rid, url in await db.run(db.get_pending_crawl_items, job_id, CRAWL_ITEM_ATTEMPTS):
+        yield {"resume_id": rid, "url": url}
+
+async def _walk(state):
+    """Сначала необработанные резюме с прошлого запуска, затем новые страницы выдачи."""
+    async for item in _pending(state.job_id):
+        yield item
+
+    while state.next_url and state.pages_run < CRAWL_MAX_PAGES:
+        html = await get_html(state.next_url, use_auth=True)
+        if not html:
+            state.page_error = f"страница выдачи не загрузилась: {state.next_url}"
+            return
+        links, following = await asyncio.to_thread(parse_search_page, html, state.next_url)
+        resumes = [(resume_id(url), url) for url in links]
+        added = await db.run(db.checkpoint_crawl_page, state.job_id, resumes, following)
+        state.next_url = following
+        state.pages_done += 1
+        state.pages_run += 1
+        state.found += len(added)
+        for rid, url in added:
+            yield {"resume_id": rid, "url": url}
+
+async def run_crawl(job_id, evaluate, on_progress=None):
+    """
+    Выполняет (или продолжает) задание обхода.
+
+    :param evaluate: async-функция (текст вакансии, текст резюме) ->
+                     (ФИО, телефон, соответствие "7/10", качество "6/10", стаж, текст анализа)
+    :param on_progress: async-функция (CrawlState, stats конвейера)
+    :return: (CrawlState, счетчики резюме задания по статусам)
+    """
+    state = CrawlState(await db.run(db.get_crawl_job, job_id))
+
+    async def extract(item):
+        text = await extract_resume_data(item["url"])
+        if not text or text == RESUME_ACCESS_ERROR:
+            raise ValueError(f"резюме не загрузилось: {item['url']}")
+        return {**item, "resume_text": text}
+
+    async def score(item):
+        return {**item, "candidate": await evaluate(state.job_text, item["resume_text"])}
+
+    async def save(item):
+        name, phone, score_fit, score_quality, total_exp, analysis = item["candidate"]
+        await db.run(db.save_crawled_candidate, job_id, item["resume_id"], name, phone, state.vacancy_name,
+                     score_fit, score_quality, total_exp, analysis, item["url"], item["resume_text"], state.job_text)
+        return item["resume_id"]
+
+    stages = [
+        Stage("extract", extract, CRAWL_CONCURRENCY),
+        Stage("score", score, CRAWL_SCORE_CONCURRENCY),
+        Stage("save", save, 1),
+    ]
+
+    async def progress(stats):
+        if on_progress:
+            await on_progress(state, stats)
+
+    async def run(items):
+        result = await run_pipeline(items, stages, queue_size=CRAWL_QUEUE_SIZE, on_progress=progress)
+        for stage_name, item, error in result.errors:
+            await db.run(db.fail_crawl_item, job_id, item["resume_id"], f"{stage_name}: {error}")
+        return result.errors
+
+    errors = await run(_walk(state))
+    if state.next_url:
+        # Выдача пройдена не до конца: страница не загрузилась или достигнут CRAWL_MAX_PAGES.
+        # Ссылка на следующую страницу уже в контрольной точке, обход продолжится по /crawl
+        logging.warning("Crawl job %s paused: %s", job_id, state.page_error or f"{CRAWL_MAX_PAGES} pages per run")
+        await db.run(db.pause_crawl_job, job_id)
+    else:
+        # Каждый проход засчитывает неудачным резюме попытку, поэтому повторы конечны
+        while errors:
+            errors = await run(_pending(job_id))
+        await db.run(db.finish_crawl_job, job_id)
+    return state, await db.run(db.crawl_job_counts, job_id)
@@ -1,67 +1,223 @@
+import os
+import re
+import time
 import sqlite3
+import asyncio
+import threading
+import functools
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+import migrations
+import prescreen
+import metrics
+
+DB_PATH = os.getenv("DB_PATH", 'hr_assistant.db')
+# Потоки, в которых выполняются запросы (у каждого свое долгоживущее соединение)
+DB_THREADS = int(os.getenv("DB_THREADS", "4"))
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_executor = None
+
+def get_connection():
+    """
+    Долгоживущее соединение текущего потока.
+    Вместе с потоками executor'а это небольшой пул: соединение открывается один раз,
+    а sqlite3 кэширует подготовленные выражения (cached_statements) по тексту SQL,
+    поэтому все запросы модуля — неизменяемые строки с параметрами.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=30, cached_statements=256, check_same_thread=False)
+        # WAL: читатели не блокируют писателя и наоборот
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-16000')   # ~16 МБ страничного кэша
+        _local.conn = conn
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+    return _executor
+
+async def run(func, *args, **kwargs):
+    """Выполняет функцию доступа к БД в потоке пула, не блокируя event loop."""
+    loop = asyncio.get_running_loop()
+    with metrics.DB_SECONDS.time(op=func.__name__):
+        return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+def close_all():
+    """Закрывает все соединения и пул потоков (при остановке бота)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+    _local.conn = None
+
+@contextmanager
+def _transaction():
+    """
+    Транзакция на соединении потока (как with conn). Векторы prescreen, записанные в ней,
+    попадают в индекс в памяти только после commit.
+    """
+    conn = get_connection()
+    try:
+        with conn:
+            yield conn
+    except BaseException:
+        prescreen.rollback(conn)
+        raise
+    prescreen.commit(conn)
 
 def init_db():
-    conn = sqlite3.connect('hr_assistant.db')
-    cursor = conn.cursor()
-    
-    # 1. Таблица вакансий (храним название и текст описания)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS vacancies (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE,
-            description TEXT
-        )
-    ''')
-    
-    # 2. Таблица кандидатов (добавлена колонка resume_url)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS candidates (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            full_name TEXT,
-            phone TEXT,
-            vacancy_name TEXT,
-            score TEXT,
-            analysis_text TEXT,
-            resume_url TEXT,
-            FOREIGN KEY (vacancy_name) REFERENCES vacancies (name)
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    """Создает/обновляет схему базы через версионные миграции (migrations.py)."""
+    migrations.migrate(get_connection())
 
 def save_vacancy(name, description):
-    """Сохраняет или обновляет текст вакансии."""
-    conn = sqlite3.connect('hr_assistant.db')
-    cursor = conn.cursor()
-    cursor.execute('INSERT OR REPLACE INTO vacancies (name, description) VALUES (?, ?)', (name, description))
-    conn.commit()
-    conn.close()
+    """Сохраняет или обновляет текст вакансии. Возвращает id вакансии."""
+    with _transaction() as conn:
+        # UPSERT, а не INSERT OR REPLACE: REPLACE удаляет строку и меняет id,
+        # что оторвало бы от вакансии всех ее кандидатов
+        conn.execute('''
+            INSERT INTO vacancies (name, description) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET description = excluded.description
+        ''', (name, description))
+        vacancy_id = conn.execute('SELECT id FROM vacancies WHERE name = ?', (name,)).fetchone()[0]
+        prescreen.index_record(conn, "vacancy", vacancy_id, f"{name}\n{description or ''}")
+        return vacancy_id
 
 def get_vacancies():
-    """Возвращает список имен всех вакансий."""
-    conn = sqlite3.connect('hr_assistant.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT name FROM vacancies')
-    rows = cursor.fetchall()
-    conn.close()
-    return [row[0] for row in rows]
+    """Возвращает список (id, имя) всех вакансий."""
+    cursor = get_connection().execute('SELECT id, name FROM vacancies ORDER BY id')
+    return cursor.fetchall()
+
+def find_vacancy_id(key):
+    """
+    id вакансии по данным кнопки: число — это id, иначе начало названия
+    (формат старых кнопок). Поиск по началу идет диапазоном по уникальному индексу name.
+    """
+    if key.isdigit():
+        return int(key)
+    row = get_connection().execute(
+        'SELECT id FROM vacancies WHERE name >= ? AND name < ? ORDER BY name LIMIT 1',
+        (key, key + '\U0010ffff')
+    ).fetchone()
+    return row[0] if row else None
 
-def add_candidate(full_name, phone, vacancy_name, score_fit, score_quality, total_exp, analysis_text, resume_url):
-    conn = sqlite3.connect('hr_assistant.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO candidates (full_name, phone, vacancy_name, score, score_quality, total_experience, analysis_text, resume_url)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (full_name, phone, vacancy_name, score_fit, score_quality, total_exp, analysis_text, resume_url))
-    conn.commit()
-    conn.close()
-
-def get_candidates_df(vacancy_name_part):
+def get_vacancy(vacancy_id):
+    """Возвращает (название, описание) вакансии или None."""
+    cursor = get_connection().execute('SELECT name, description FROM vacancies WHERE id = ?', (vacancy_id,))
+    return cursor.fetchone()
+
+def _score_value(score):
+    """'7/10' -> 7"""
+    match = re.match(r'\s*(\d+)', score or "")
+    return int(match.group(1)) if match else 0
+
+def add_candidate(full_name, phone, vacancy_name, score_fit, score_quality, total_exp, analysis_text, resume_url, resume_text=None, job_text=None):
+    """
+    Сохраняет кандидата. vacancy_id определяется по названию вакансии; если вакансию не сохраняли,
+    она создается с текстом job_text. Возвращает id кандидата.
+    resume_text — текст резюме для предварительного отбора (prescreen).
+    """
+    with _transaction() as conn:
+        return _insert_candidate(conn, full_name, phone, vacancy_name, score_fit, score_quality, total_exp, analysis_text, resume_url, resume_text, job_text)
+
+def _vacancy_id(conn, name, description=None):
+    """id вакансии по названию; несохраненная вакансия создается, существующая не меняется."""
+    if not name:
+        return None
+    cursor = conn.execute(
+        'INSERT INTO vacancies (name, description) VALUES (?, ?) ON CONFLICT (name) DO NOTHING', (name, description)
+    )
+    vacancy_id = conn.execute('SELECT id FROM vacancies WHERE name = ?', (name,)).fetchone()[0]
+    if cursor.rowcount == 1:
+        prescreen.index_record(conn, "vacancy", vacancy_id, f"{name}\n{description or ''}")
+    return vacancy_id
+
+def _insert_candidate(conn, full_name, phone, vacancy_name, score_fit, score_quality, total_exp, analysis_text, resume_url, resume_text=None, job_text=None):
+    # Без строки вакансии кандидат сохранился бы с vacancy_id = NULL и не попал бы ни в список, ни в выгрузку
+    vacancy_id = _vacancy_id(conn, vacancy_name, job_text)
+    cursor = conn.execute('''
+        INSERT INTO candidates (vacancy_id, full_name, phone, vacancy_name, score, score_value, score_quality, total_experience, analysis_text, resume_url, resume_text)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (vacancy_id, full_name, phone, vacancy_name, score_fit, _score_value(score_fit), score_quality, total_exp, analysis_text, resume_url, resume_text))
+    prescreen.index_record(conn, "candidate", cursor.lastrowid, resume_text)
+    return cursor.lastrowid
+
+# Keyset-пагинация: страница выбирается по индексу от курсора (оценка, id) последней
+# или первой строки соседней страницы, без OFFSET — время не зависит от номера страницы.
+# Сортировка "score": по оценке, затем новые; "date": сначала новые.
+_PAGE_QUERIES = {
+    ("score", "first"): '''
+        SELECT id, full_name, phone, score, resume_url, score_value FROM candidates
+        WHERE vacancy_id = ? ORDER BY score_value DESC, id DESC LIMIT ?''',
+    ("score", "next"): '''
+        SELECT id, full_name, phone, score, resume_url, score_value FROM candidates
+        WHERE vacancy_id = ? AND (score_value, id) < (?, ?)
+        ORDER BY score_value DESC, id DESC LIMIT ?''',
+    ("score", "prev"): '''
+        SELECT id, full_name, phone, score, resume_url, score_value FROM candidates
+        WHERE vacancy_id = ? AND (score_value, id) > (?, ?)
+        ORDER BY score_value ASC, id ASC LIMIT ?''',
+    ("date", "first"): '''
+        SELECT id, full_name, phone, score, resume_url, score_value FROM candidates
+        WHERE vacancy_id = ? ORDER BY id DESC LIMIT ?''',
+    ("date", "next"): '''
+        SELECT id, full_name, phone, score, resume_url, score_value FROM candidates
+        WHERE vacancy_id = ? AND id < ? ORDER BY id DESC LIMIT ?''',
+    ("date", "prev"): '''
+        SELECT id, full_name, phone, score, resume_url, score_value FROM candidates
+        WHERE vacancy_id = ? AND id > ? ORDER BY id ASC LIMIT ?''',
+}
+
+def get_candidates_page(vacancy_id, sort="score", direction="first", cursor=None, limit=10):
+    """
+    Одна страница кандидатов вакансии.
+
+    :param sort: "score" или "date"
+    :param direction: "first", "next" (после cursor) или "prev" (перед cursor)
+    :param cursor: (score_value, id) строки, от которой листаем
+    :return: (строки (id, ФИО, телефон, оценка, ссылка, score_value), есть_предыдущая, есть_следующая)
+    """
+    if direction != "first" and cursor is None:
+        direction = "first"
+    query = _PAGE_QUERIES[(sort, direction)]
+    if direction == "first":
+        params = (vacancy_id,)
+    elif sort == "score":
+        params = (vacancy_id, cursor[0], cursor[1])
+    else:
+        params = (vacancy_id, cursor[1])
+
+    # Берем на одну строку больше, чтобы узнать, есть ли еще страница в этом направлении
+    rows = get_connection().execute(query, params + (limit + 1,)).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if direction == "prev":
+        rows.reverse()
+        return rows, has_more, True
+    return rows, direction == "next", has_more
+
+def get_candidates_df(vacancy_id):
     """Получает данные кандидатов и возвращает их в виде DataFrame."""
-    conn = sqlite3.connect('hr_assistant.db')
+    conn = get_connection()
     
-    # Используем SQL-запрос для получения данных по маске названия
+    # Выборка по индексу idx_candidates_vacancy
     query = '''
         SELECT full_name as "ФИО", 
                phone as "Телефон", 
@@ -71,26 +227,212 @@ def get_candidates_df(vacancy_name_part):
                resume_url as "Ссылка",
                analysis_text as "Анализ ИИ"
         FROM candidates 
-        WHERE vacancy_name LIKE ?
+        WHERE vacancy_id = ?
+        ORDER BY id
     '''
-    df = pd.read_sql_query(query, conn, params=(vacancy_name_part + '%',))
-    conn.close()
-    return df
-
-def delete_vacancy_and_candidates(vacancy_name_part):
-    """Удаляет вакансию и всех привязанных к ней кандидатов по части названия."""
-    conn = sqlite3.connect('hr_assistant.db')
-    cursor = conn.cursor()
-    # Находим полное имя вакансии
-    cursor.execute('SELECT name FROM vacancies WHERE name LIKE ?', (vacancy_name_part + '%',))
-    res = cursor.fetchone()
-    
-    if res:
-        full_name = res[0]
-        # Удаляем кандидатов
-        cursor.execute('DELETE FROM candidates WHERE vacancy_name = ?', (full_name,))
-        # Удаляем саму вакансию
-        cursor.execute('DELETE FROM vacancies WHERE name = ?', (full_name,))
-        
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    return pd.read_sql_query(query, conn, params=(vacancy_id,))
+
+def delete_vacancy_and_candidates(vacancy_id):
+    """Удаляет вакансию и всех привязанных к ней кандидатов."""
+    with get_connection() as conn:
+        candidate_ids = [row[0] for row in conn.execute('SELECT id FROM candidates WHERE vacancy_id = ?', (vacancy_id,))]
+        # Кандидаты удалились бы и каскадом, но удаляем явно — по индексу
+        conn.execute('DELETE FROM candidates WHERE vacancy_id = ?', (vacancy_id,))
+        conn.execute('DELETE FROM vacancies WHERE id = ?', (vacancy_id,))
+    prescreen.forget("candidate", candidate_ids)
+    prescreen.forget("vacancy", [vacancy_id])
+
+def similar_candidates(vacancy_id, limit=10):
+    """
+    Кандидаты всей базы, резюме которых ближе всего к тексту вакансии (без GPT).
+    Возвращает строки (id, ФИО, вакансия, оценка, ссылка, сходство).
+    """
+    conn = get_connection()
+    vacancy = get_vacancy(vacancy_id)
+    if vacancy is None:
+        return []
+    found = prescreen.similar(conn, "candidate", f"{vacancy[0]}\n{vacancy[1] or ''}", limit)
+    if not found:
+        return []
+    rows = conn.execute(
+        f"SELECT id, full_name, vacancy_name, score, resume_url FROM candidates WHERE id IN ({','.join('?' * len(found))})",
+        [item_id for item_id, _ in found]
+    ).fetchall()
+    by_id = {row[0]: row for row in rows}
+    return [by_id[item_id] + (similarity,) for item_id, similarity in found if item_id in by_id]
+
+# --- Полнотекстовый поиск (candidates_fts) ---
+
+SNIPPET_START, SNIPPET_END = "\x02", "\x03"   # границы найденных слов в сниппете
+
+def fts_query(text):
+    """
+    Запрос пользователя -> выражение FTS5. Фразы в кавычках ищутся точно, остальные слова —
+    по началу: у длинных слов отбрасывается окончание («валютный» найдет «валютного»),
+    короткие ищутся как есть («1С»).
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]+)"|(\w+)', text):
+        if phrase:
+            words = re.findall(r'\w+', phrase)
+            if words:
+                terms.append('"' + " ".join(words) + '"')
+        elif len(word) >= 5 and word.isalpha():
+            terms.append(f'"{word[:max(4, len(word) - 2)]}"*')
+        elif len(word) >= 3 and word.isalpha():
+            terms.append(f'"{word}"*')
+        else:
+            terms.append(f'"{word}"')
+    return " ".join(terms)
+
+def search_candidates(query, offset=0, limit=5):
+    """
+    Кандидаты всех вакансий по тексту запроса, сначала наиболее релевантные (rank — bm25 с весами колонок).
+    Сниппеты строятся только для строк страницы, а не для всех совпадений.
+    :return: (строки (id, ФИО, вакансия, оценка, ссылка, сниппет), есть_следующая)
+    """
+    expression = fts_query(query)
+    if not expression:
+        return [], False
+    rows = get_connection().execute('''
+        WITH hits AS (
+            SELECT rowid AS id, rank FROM candidates_fts WHERE candidates_fts MATCH ?
+            ORDER BY rank LIMIT ? OFFSET ?
+        )
+        SELECT c.id, c.full_name, c.vacancy_name, c.score, c.resume_url,
+               snippet(candidates_fts, -1, ?, ?, '…', 16)
+        FROM hits
+        JOIN candidates_fts ON candidates_fts.rowid = hits.id
+        JOIN candidates c ON c.id = hits.id
+        WHERE candidates_fts MATCH ?
+        ORDER BY hits.rank
+    ''', (expression, limit + 1, offset, SNIPPET_START, SNIPPET_END, expression)).fetchall()
+    return rows[:limit], len(rows) > limit
+
+# --- Обход выдачи HH (crawler.py) ---
+
+def create_crawl_job(start_url, vacancy_name, job_text, chat_id=None):
+    """Новое задание обхода. Возвращает его id."""
+    with get_connection() as conn:
+        cursor = conn.execute('''
+            INSERT INTO crawl_jobs (start_url, next_url, vacancy_name, job_text, chat_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (start_url, start_url, vacancy_name, job_text, chat_id))
+        return cursor.lastrowid
+
+def find_running_crawl_job(start_url, vacancy_name):
+    """Незавершенное задание с той же ссылкой и вакансией (чтобы продолжить, а не начать заново)."""
+    row = get_connection().execute('''
+        SELECT id FROM crawl_jobs
+        WHERE status IN ('running', 'paused') AND start_url = ? AND vacancy_name = ?
+        ORDER BY id DESC LIMIT 1
+    ''', (start_url, vacancy_name)).fetchone()
+    return row[0] if row else None
+
+def get_crawl_job(job_id):
+    """(id, start_url, next_url, vacancy_name, job_text, chat_id, status, pages_done) или None."""
+    return get_connection().execute('''
+        SELECT id, start_url, next_url, vacancy_name, job_text, chat_id, status, pages_done
+        FROM crawl_jobs WHERE id = ?
+    ''', (job_id,)).fetchone()
+
+def get_abandoned_crawl_jobs(lease):
+    """id выполнявшихся заданий, которые никто не выполняет: процесс-владелец остановился или упал."""
+    rows = get_connection().execute(
+        "SELECT id FROM crawl_jobs WHERE status = 'running' AND (owner IS NULL OR heartbeat_at < ?) ORDER BY id",
+        (time.time() - lease,)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+def claim_crawl_job(job_id, owner, lease):
+    """
+    Берет задание в аренду процесса owner: брошенное или приостановленное.
+    False — задание завершено или его выполняет другой процесс (аренда продлевается).
+    """
+    now = time.time()
+    with get_connection() as conn:
+        cursor = conn.execute('''
+            UPDATE crawl_jobs SET status = 'running', owner = ?, heartbeat_at = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND (status = 'paused' OR (status = 'running' AND (owner IS NULL OR heartbeat_at < ?)))
+        ''', (owner, now, job_id, now - lease))
+        return cursor.rowcount == 1
+
+def renew_crawl_leases(owner):
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE crawl_jobs SET heartbeat_at = ? WHERE owner = ? AND status = 'running'", (time.time(), owner)
+        )
+
+def release_crawl_job(job_id, owner):
+    with get_connection() as conn:
+        conn.execute('UPDATE crawl_jobs SET owner = NULL WHERE id = ? AND owner = ?', (job_id, owner))
+
+def checkpoint_crawl_page(job_id, resumes, next_url):
+    """
+    Контрольная точка после страницы выдачи: новые резюме и ссылка на следующую страницу
+    пишутся одной транзакцией. Резюме, уже обработанные для этой вакансии в других заданиях,
+    пропускаются. resumes — список (resume_id, url). Возвращает добавленные (resume_id, url).
+    """
+    added = []
+    with get_connection() as conn:
+        vacancy_name = conn.execute('SELECT vacancy_name FROM crawl_jobs WHERE id = ?', (job_id,)).fetchone()[0]
+        for resume_id, url in resumes:
+            done_before = conn.execute('''
+                SELECT 1 FROM crawl_items i JOIN crawl_jobs j ON j.id = i.job_id
+                WHERE i.resume_id = ? AND i.status = 'done' AND j.vacancy_name = ? LIMIT 1
+            ''', (resume_id, vacancy_name)).fetchone()
+            if done_before:
+                continue
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO crawl_items (job_id, resume_id, url) VALUES (?, ?, ?)',
+                (job_id, resume_id, url)
+            )
+            if cursor.rowcount:
+                added.append((resume_id, url))
+        conn.execute('''
+            UPDATE crawl_jobs SET next_url = ?, pages_done = pages_done + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (next_url, job_id))
+    return added
+
+def get_pending_crawl_items(job_id, max_attempts):
+    """Резюме задания, которые еще не обработаны или не удались меньше max_attempts раз: список (resume_id, url)."""
+    return get_connection().execute('''
+        SELECT resume_id, url FROM crawl_items
+        WHERE job_id = ? AND (status = 'pending' OR (status = 'failed' AND attempts < ?))
+    ''', (job_id, max_attempts)).fetchall()
+
+def save_crawled_candidate(job_id, resume_id, full_name, phone, vacancy_name, score_fit, score_quality, total_exp, analysis_text, resume_url, resume_text=None, job_text=None):
+    """Сохраняет кандидата и отмечает резюме обработанным в одной транзакции — после сбоя дубля не будет."""
+    with _transaction() as conn:
+        candidate_id = _insert_candidate(conn, full_name, phone, vacancy_name, score_fit, score_quality, total_exp, analysis_text, resume_url, resume_text, job_text)
+        conn.execute(
+            "UPDATE crawl_items SET status = 'done', candidate_id = ?, error = NULL WHERE job_id = ? AND resume_id = ?",
+            (candidate_id, job_id, resume_id)
+        )
+        return candidate_id
+
+def fail_crawl_item(job_id, resume_id, error):
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE crawl_items SET status = 'failed', attempts = attempts + 1, error = ? WHERE job_id = ? AND resume_id = ?",
+            (str(error)[:500], job_id, resume_id)
+        )
+
+def finish_crawl_job(job_id):
+    with get_connection() as conn:
+        conn.execute("UPDATE crawl_jobs SET status = 'done', updated_at = CURRENT_TIMESTAMP WHERE id = ?", (job_id,))
+
+def pause_crawl_job(job_id):
+    """Обход продолжится только по /crawl с той же ссылкой, а не сам при следующей проверке аренды."""
+    with get_connection() as conn:
+        conn.execute("UPDATE crawl_jobs SET status = 'paused', updated_at = CURRENT_TIMESTAMP WHERE id = ?", (job_id,))
+
+def crawl_job_counts(job_id):
+    """Число резюме задания по статусам: {'pending': .., 'done': .., 'failed': ..}."""
+    rows = get_connection().execute(
+        'SELECT status, COUNT(*) FROM crawl_items WHERE job_id = ? GROUP BY status', (job_id,)
+    ).fetchall()
+    counts = {"pending": 0, "done": 0, "failed": 0}
+    counts.update(dict(rows))
+    return counts
\ No newline at end of file
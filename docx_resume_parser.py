@@ -1,5 +1,7 @@
 import docx
+import metrics
 
+@metrics.timed("docx")
 def extract_resume_data_from_docx(docx_bytes):
     from docx import Document
     from io import BytesIO
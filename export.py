@@ -0,0 +1,88 @@
+import os
+import re
+import csv
+import tempfile
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+import database as db
+
+# Колонки выгрузки: (заголовок, колонка таблицы candidates)
+EXPORT_COLUMNS = [
+    ("ФИО", "full_name"),
+    ("Телефон", "phone"),
+    ("Вакансия", "vacancy_name"),
+    ("Оценка", "score"),
+    ("Ссылка", "resume_url"),
+    ("Анализ ИИ", "analysis_text"),
+]
+EXPORT_PAGE_SIZE = 500
+EXCEL_CELL_LIMIT = 32767  # максимум символов в ячейке Excel
+
+def _iter_rows(vacancy_id):
+    """Кандидаты вакансии порциями через курсор — вся выборка в память не грузится."""
+    columns = ", ".join(col for _, col in EXPORT_COLUMNS)
+    cursor = db.get_connection().cursor()
+    cursor.execute(f'SELECT {columns} FROM candidates WHERE vacancy_id = ? ORDER BY id', (vacancy_id,))
+    try:
+        while True:
+            rows = cursor.fetchmany(EXPORT_PAGE_SIZE)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+def _excel_value(value):
+    if not isinstance(value, str):
+        return value
+    value = ILLEGAL_CHARACTERS_RE.sub("", value)
+    return value[:EXCEL_CELL_LIMIT]
+
+def _write_xlsx(path, rows):
+    # write_only: строки сразу уходят во временный XML, а не держатся в модели книги
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Кандидаты')
+    ws.append([title for title, _ in EXPORT_COLUMNS])
+    count = 0
+    for row in rows:
+        ws.append([_excel_value(v) for v in row])
+        count += 1
+    wb.save(path)
+    return count
+
+def _write_csv(path, rows):
+    # utf-8-sig и ';' — чтобы русский Excel открыл файл без мастера импорта
+    count = 0
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow([title for title, _ in EXPORT_COLUMNS])
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+def export_candidates(vacancy_id, fmt="xlsx"):
+    """
+    Выгружает кандидатов вакансии во временный файл (xlsx или csv).
+    Функция синхронная: вызывать через db.run (читает базу соединением потока пула).
+    Возвращает (путь к файлу, имя файла для отправки, название вакансии)
+    или None, если кандидатов нет. Файл удаляет вызывающий код.
+    """
+    vacancy = db.get_vacancy(vacancy_id)
+    vacancy_name = vacancy[0] if vacancy else str(vacancy_id)
+
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}", prefix="candidates_")
+    os.close(fd)
+    try:
+        writer = _write_csv if fmt == "csv" else _write_xlsx
+        count = writer(path, _iter_rows(vacancy_id))
+    except Exception:
+        os.remove(path)
+        raise
+
+    if count == 0:
+        os.remove(path)
+        return None
+
+    safe_name = re.sub(r'[^\w\-]+', '_', vacancy_name)[:15]
+    return path, f"Candidates_{safe_name}.{fmt}", vacancy_name
@@ -0,0 +1,146 @@
+import os
+import time
+import tempfile
+import hashlib
+import logging
+
+# Дисковый кэш структурированных резюме (markdown после парсинга PDF/DOCX и GPT).
+# data/<хэш содержимого>_<версия>.md — сам результат,
+# ids/<file_unique_id> — хэш содержимого файла Telegram, чтобы не скачивать его повторно.
+CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", os.path.join("cache", "extraction"))
+CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+hits_by_id = 0      # попадание без скачивания файла
+hits_by_hash = 0    # файл скачан, но GPT не вызывался
+misses = 0
+
+def _data_dir():
+    path = os.path.join(CACHE_DIR, "data")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _ids_dir():
+    path = os.path.join(CACHE_DIR, "ids")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _safe_name(file_unique_id):
+    # file_unique_id состоит из [A-Za-z0-9_-], но имя файла строим только из безопасных символов
+    return "".join(ch for ch in file_unique_id if ch.isalnum() or ch in "-_")
+
+def _atomic_write(path, text):
+    # Свой временный файл на каждую запись: записи идут из потоков (to_thread) и процессов параллельно
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+    try:
+        with open(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def make_version(kind, system_prompt, model):
+    """Версия извлечения: тип файла, промпт и модель. Смена любого из них инвалидирует кэш."""
+    raw = f"{kind}\n{model}\n{system_prompt}".encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()[:12]
+
+def content_hash(file_bytes):
+    return hashlib.sha256(file_bytes).hexdigest()
+
+def _data_path(file_hash, version):
+    return os.path.join(_data_dir(), f"{file_hash}_{version}.md")
+
+def _read(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None
+    # Обновляем время доступа для вытеснения по LRU
+    os.utime(path)
+    return text
+
+def get_by_file_id(file_unique_id, version):
+    """Ищет результат по file_unique_id Telegram — без скачивания файла."""
+    global hits_by_id
+    id_path = os.path.join(_ids_dir(), _safe_name(file_unique_id))
+    try:
+        with open(id_path, 'r', encoding='utf-8') as f:
+            file_hash = f.read().strip()
+    except FileNotFoundError:
+        return None
+
+    text = _read(_data_path(file_hash, version))
+    if text is not None:
+        os.utime(id_path)
+        hits_by_id += 1
+        logging.info("Extraction cache hit (file_unique_id): %s", file_unique_id)
+    return text
+
+def get_by_hash(file_hash, version, file_unique_id=None):
+    """Ищет результат по хэшу содержимого. Найденный файл привязывается к file_unique_id."""
+    global hits_by_hash, misses
+    text = _read(_data_path(file_hash, version))
+    if text is None:
+        misses += 1
+        return None
+
+    hits_by_hash += 1
+    logging.info("Extraction cache hit (content hash): %s", file_hash[:12])
+    if file_unique_id:
+        _atomic_write(os.path.join(_ids_dir(), _safe_name(file_unique_id)), file_hash)
+    return text
+
+def put(file_hash, version, text, file_unique_id=None):
+    """Сохраняет результат извлечения и вытесняет старые записи сверх лимита размера."""
+    if not text:
+        return
+    _atomic_write(_data_path(file_hash, version), text)
+    if file_unique_id:
+        _atomic_write(os.path.join(_ids_dir(), _safe_name(file_unique_id)), file_hash)
+    evict()
+
+def evict():
+    """Удаляет давно не использованные результаты, пока кэш больше CACHE_MAX_BYTES."""
+    data_dir = _data_dir()
+    entries = []
+    total = 0
+    for entry in os.scandir(data_dir):
+        if not entry.is_file() or not entry.name.endswith(".md"):
+            continue
+        st = entry.stat()
+        entries.append((st.st_mtime, st.st_size, entry.path))
+        total += st.st_size
+
+    if total <= CACHE_MAX_BYTES:
+        return
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+    # Ссылки ids/ на удаленные результаты безвредны (get_by_file_id вернет промах),
+    # но чистим те, что старше всего кэша, чтобы каталог не рос бесконечно
+    oldest_kept = min((e[0] for e in entries if os.path.exists(e[2])), default=time.time())
+    for entry in os.scandir(_ids_dir()):
+        if entry.is_file() and entry.stat().st_mtime < oldest_kept:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+def cache_stats():
+    total = hits_by_id + hits_by_hash + misses
+    hits = hits_by_id + hits_by_hash
+    return {
+        "hits_by_file_id": hits_by_id,
+        "hits_by_hash": hits_by_hash,
+        "misses": misses,
+        "hit_rate": round(hits / total, 3) if total else 0.0,
+    }
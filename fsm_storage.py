@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import zlib
+import hashlib
+import logging
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+import database as db
+
+# Хранилище состояний FSM в hr_assistant.db вместо памяти процесса: состояние и данные
+# пользователя переживают перезапуск, а память не растет с числом пользователей.
+# Длинные строки (тексты вакансий и резюме) хранятся отдельно в fsm_blobs, сжатыми zlib,
+# а в данных остается ссылка на хэш: одинаковый текст хранится один раз, а перезапись
+# данных (например, списка резюме) не переписывает уже сохраненные тексты.
+
+FSM_TTL = int(os.getenv("FSM_TTL", str(14 * 24 * 3600)))                    # секунды без активности
+FSM_MAX_USER_BYTES = int(os.getenv("FSM_MAX_USER_BYTES", str(5 * 1024 * 1024)))  # на пользователя, в сжатом виде
+FSM_BLOB_MIN_CHARS = 1024          # строки короче хранятся прямо в данных
+FSM_CLEANUP_INTERVAL = 3600        # секунды между удалениями устаревших записей
+
+BLOB_REF = "$blob"
+
+
+class StorageLimitError(ValueError):
+    """Данные пользователя не помещаются в FSM_MAX_USER_BYTES."""
+
+
+def _key(key: StorageKey):
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.business_connection_id or ''}:{key.destiny}"
+
+def _pack(value, blobs):
+    """Заменяет длинные строки ссылками; blobs — хэш -> текст в utf-8."""
+    if isinstance(value, str) and len(value) >= FSM_BLOB_MIN_CHARS:
+        data = value.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        blobs[digest] = data
+        return {BLOB_REF: digest}
+    if isinstance(value, dict):
+        return {k: _pack(v, blobs) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_pack(v, blobs) for v in value]
+    return value
+
+def _unpack(value, conn):
+    if isinstance(value, dict):
+        if len(value) == 1 and BLOB_REF in value:
+            row = conn.execute('SELECT data FROM fsm_blobs WHERE hash = ?', (value[BLOB_REF],)).fetchone()
+            return zlib.decompress(row[0]).decode("utf-8") if row else None
+        return {k: _unpack(v, conn) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_unpack(v, conn) for v in value]
+    return value
+
+def _load_state(key):
+    row = db.get_connection().execute('SELECT state, updated_at FROM fsm_states WHERE key = ?', (key,)).fetchone()
+    return row[0] if row and time.time() - row[1] <= FSM_TTL else None
+
+def _load_data(key):
+    """Данные пользователя; {} для отсутствующей или устаревшей записи."""
+    conn = db.get_connection()
+    row = conn.execute('SELECT data, updated_at FROM fsm_states WHERE key = ?', (key,)).fetchone()
+    if not row or time.time() - row[1] > FSM_TTL:
+        return {}
+    return _unpack(json.loads(row[0]), conn)
+
+# Запись в устаревшую строку начинается с чистого листа: вторая половина (данные или состояние) сбрасывается
+_WRITE_STATE = '''
+    INSERT INTO fsm_states (key, user_id, state, updated_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT (key) DO UPDATE SET
+        state = excluded.state,
+        data = CASE WHEN updated_at < ? THEN '{}' ELSE data END,
+        size = CASE WHEN updated_at < ? THEN 0 ELSE size END,
+        updated_at = excluded.updated_at
+'''
+_WRITE_DATA = '''
+    INSERT INTO fsm_states (key, user_id, data, size, updated_at) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (key) DO UPDATE SET
+        state = CASE WHEN updated_at < ? THEN NULL ELSE state END,
+        data = excluded.data,
+        size = excluded.size,
+        updated_at = excluded.updated_at
+'''
+# Пустая запись не нужна
+_DELETE_EMPTY = "DELETE FROM fsm_states WHERE key = ? AND state IS NULL AND data = '{}'"
+
+def _write_state(key, user_id, state):
+    now = time.time()
+    with db.get_connection() as conn:
+        conn.execute(_WRITE_STATE, (key, user_id, state, now, now - FSM_TTL, now - FSM_TTL))
+        conn.execute(_DELETE_EMPTY, (key,))
+
+def _write_data(key, user_id, data):
+    with db.get_connection() as conn:
+        # Блокировка записи сразу: cleanup не удалит текст между проверкой и записью ссылки
+        conn.execute('BEGIN IMMEDIATE')
+        _store_data(conn, key, user_id, data)
+
+def _append_data(key, user_id, field, value):
+    """
+    Добавляет value в список data[field] одной транзакцией. Возвращает длину списка.
+    Блокировка записи берется до чтения: параллельные добавления (альбом файлов, задачи
+    в других процессах) не затирают друг друга.
+    """
+    with db.get_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        data = _load_data(key)
+        data[field] = (data.get(field) or []) + [value]
+        _store_data(conn, key, user_id, data)
+        return len(data[field])
+
+def _store_data(conn, key, user_id, data):
+    """Запись данных в открытой транзакции с блокировкой записи."""
+    blobs = {}
+    packed = json.dumps(_pack(dict(data), blobs), ensure_ascii=False, separators=(",", ":"))
+    now = time.time()
+    # Сжимаются только новые тексты: повторная запись того же списка резюме почти бесплатна
+    stored = dict(conn.execute(
+        f"SELECT hash, size FROM fsm_blobs WHERE hash IN ({','.join('?' * len(blobs))})", list(blobs)
+    ).fetchall()) if blobs else {}
+    new_blobs = [(digest, zlib.compress(raw, 6)) for digest, raw in blobs.items() if digest not in stored]
+    size = len(packed.encode("utf-8")) + sum(stored.values()) + sum(len(blob) for _, blob in new_blobs)
+
+    used = conn.execute(
+        'SELECT COALESCE(SUM(size), 0) FROM fsm_states WHERE user_id = ? AND key != ? AND updated_at >= ?',
+        (user_id, key, now - FSM_TTL)
+    ).fetchone()[0]
+    if used + size > FSM_MAX_USER_BYTES:
+        raise StorageLimitError(f"FSM data for user {user_id} exceeds {FSM_MAX_USER_BYTES} bytes")
+
+    conn.executemany(
+        'INSERT OR IGNORE INTO fsm_blobs (hash, data, size) VALUES (?, ?, ?)',
+        [(digest, blob, len(blob)) for digest, blob in new_blobs]
+    )
+    conn.execute(_WRITE_DATA, (key, user_id, packed, size, now, now - FSM_TTL))
+    conn.execute('DELETE FROM fsm_refs WHERE key = ?', (key,))
+    conn.executemany('INSERT INTO fsm_refs (key, hash) VALUES (?, ?)', [(key, digest) for digest in blobs])
+    conn.execute(_DELETE_EMPTY, (key,))
+
+def cleanup():
+    """Удаляет записи без активности дольше FSM_TTL и тексты, на которые больше нет ссылок."""
+    with db.get_connection() as conn:
+        expired = conn.execute('DELETE FROM fsm_states WHERE updated_at < ?', (time.time() - FSM_TTL,)).rowcount
+        conn.execute('DELETE FROM fsm_refs WHERE key NOT IN (SELECT key FROM fsm_states)')
+        orphans = conn.execute('DELETE FROM fsm_blobs WHERE hash NOT IN (SELECT hash FROM fsm_refs)').rowcount
+    if expired or orphans:
+        logging.info("FSM cleanup: %d expired states, %d unused blobs", expired, orphans)
+    return expired, orphans
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM aiogram в SQLite (таблицы fsm_states, fsm_blobs, fsm_refs)."""
+
+    async def set_state(self, key: StorageKey, state=None):
+        state = getattr(state, "state", state)
+        await db.run(_write_state, _key(key), key.user_id, state)
+
+    async def get_state(self, key: StorageKey):
+        return await db.run(_load_state, _key(key))
+
+    async def set_data(self, key: StorageKey, data):
+        await db.run(_write_data, _key(key), key.user_id, data)
+
+    async def get_data(self, key: StorageKey):
+        return await db.run(_load_data, _key(key))
+
+    async def append_data(self, key: StorageKey, field, value):
+        """Добавляет value в список data[field] без гонки с другими записями. Возвращает длину списка."""
+        return await db.run(_append_data, _key(key), key.user_id, field, value)
+
+    async def close(self):
+        pass
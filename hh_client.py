@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from http.cookies import SimpleCookie
+import aiohttp
+from yarl import URL
+
+# Заголовки для имитации реального браузера
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
+    "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
+}
+
+HH_RATE = float(os.getenv("HH_RATE", "2"))              # запросов в секунду в среднем
+HH_BURST = int(os.getenv("HH_BURST", "5"))              # допустимый всплеск
+HH_CONCURRENCY = int(os.getenv("HH_CONCURRENCY", "4"))  # одновременных запросов
+HH_TIMEOUT = int(os.getenv("HH_TIMEOUT", "15"))
+
+
+class TokenBucket:
+    """Ограничитель частоты: rate токенов в секунду, не больше capacity в запасе."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HHClient:
+    """
+    Долгоживущий асинхронный HTTP-клиент для hh.ru.
+    Пул keep-alive соединений общий для публичных и авторизованных запросов;
+    куки работодателя читаются из cookies.json один раз и сохраняются обратно,
+    когда HH обновляет их через Set-Cookie.
+    """
+
+    def __init__(self, cookies_path='cookies.json', rate=HH_RATE, burst=HH_BURST,
+                 max_concurrency=HH_CONCURRENCY, timeout=HH_TIMEOUT):
+        self.cookies_path = cookies_path
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._connector = None
+        self._public = None
+        self._auth = None
+        self._cookie_entries = []   # записи cookies.json в исходном формате
+        self._save_lock = asyncio.Lock()
+
+    def _load_cookies(self, jar):
+        """Загружает куки работодателя из JSON-файла в cookie jar."""
+        try:
+            with open(self.cookies_path, 'r', encoding='utf-8') as f:
+                self._cookie_entries = json.load(f)
+        except FileNotFoundError:
+            print(f"Файл {self.cookies_path} не найден.")
+            return False
+        except Exception as e:
+            print(f"Ошибка загрузки куки: {e}")
+            return False
+
+        for entry in self._cookie_entries:
+            cookie = SimpleCookie()
+            cookie[entry['name']] = entry['value']
+            cookie[entry['name']]['domain'] = entry.get('domain', '.hh.ru').lstrip('.')
+            cookie[entry['name']]['path'] = entry.get('path', '/')
+            jar.update_cookies(cookie, URL("https://hh.ru/"))
+        return True
+
+    def _sessions(self):
+        if self._connector is None:
+            self._connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency * 2,
+                keepalive_timeout=60,
+                ttl_dns_cache=300
+            )
+            common = dict(
+                connector=self._connector,
+                connector_owner=False,
+                headers=HEADERS,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._public = aiohttp.ClientSession(**common)
+            auth_jar = aiohttp.CookieJar()
+            self._load_cookies(auth_jar)
+            self._auth = aiohttp.ClientSession(cookie_jar=auth_jar, **common)
+        return self._public, self._auth
+
+    async def fetch(self, url, use_auth=False, headers=None):
+        """
+        GET-запрос с учетом лимита частоты и числа одновременных запросов.
+        Возвращает уже прочитанный ответ: (status, headers, text).
+        """
+        public, auth = self._sessions()
+        session = auth if use_auth else public
+        async with self._semaphore:
+            await self.bucket.acquire()
+            async with session.get(url, headers=headers) as response:
+                text = await response.text()
+                if use_auth and response.cookies:
+                    await self._persist_cookies(response.cookies)
+                return response.status, response.headers, text
+
+    async def _persist_cookies(self, updated):
+        """Переносит куки из Set-Cookie в cookies.json (формат файла сохраняется)."""
+        async with self._save_lock:
+            by_name = {entry['name']: entry for entry in self._cookie_entries}
+            changed = False
+            for name, morsel in updated.items():
+                entry = by_name.get(name)
+                if entry is None:
+                    entry = {"name": name, "domain": morsel['domain'] or ".hh.ru", "path": morsel['path'] or "/"}
+                    self._cookie_entries.append(entry)
+                    by_name[name] = entry
+                if entry.get('value') != morsel.value:
+                    entry['value'] = morsel.value
+                    changed = True
+                if morsel['max-age']:
+                    entry['expirationDate'] = time.time() + int(morsel['max-age'])
+            if changed:
+                await asyncio.to_thread(self._write_cookies)
+                logging.info("HH cookies updated: %s", ", ".join(updated.keys()))
+
+    def _write_cookies(self):
+        tmp_path = self.cookies_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._cookie_entries, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.cookies_path)
+
+    async def close(self):
+        for session in (self._public, self._auth):
+            if session is not None:
+                await session.close()
+        if self._connector is not None:
+            await self._connector.close()
+        self._connector = self._public = self._auth = None
+
+
+_client = None
+
+def get_client():
+    """Общий клиент процесса (создается при первом запросе)."""
+    global _client
+    if _client is None:
+        _client = HHClient()
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
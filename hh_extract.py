@@ -0,0 +1,118 @@
+try:
+    from lxml import etree
+except ImportError:  # без lxml parse_hh работает через BeautifulSoup
+    etree = None
+
+# Адресное извлечение нужных data-qa узлов со страниц HH.
+# Страница разбирается потоковым C-парсером lxml порциями; элементы вне искомых узлов
+# сразу удаляются из дерева, а разбор прекращается, как только все обязательные узлы найдены.
+# Полное дерево страницы (как в BeautifulSoup) не строится.
+
+CHUNK_SIZE = 64 * 1024
+# Текст внутри этих тегов не виден пользователю (get_text BeautifulSoup его тоже пропускает)
+SKIP_TAGS = {"script", "style", "noscript", "template"}
+
+
+class Target:
+    """Искомый узел: теги, значение data-qa или id. required=False — не ждать его до конца страницы."""
+
+    def __init__(self, key, tags, data_qa=None, element_id=None, required=True):
+        self.key = key
+        self.tags = set(tags)
+        self.data_qa = data_qa
+        self.element_id = element_id
+        self.required = required
+
+    def matches(self, el):
+        if el.tag not in self.tags:
+            return False
+        if self.data_qa is not None and el.get("data-qa") != self.data_qa:
+            return False
+        if self.element_id is not None and el.get("id") != self.element_id:
+            return False
+        return True
+
+
+def available():
+    return etree is not None
+
+def element_strings(el):
+    """Текстовые фрагменты элемента в порядке документа (как strings в BeautifulSoup)."""
+    if el.text and el.tag not in SKIP_TAGS:
+        yield el.text
+    for child in el:
+        # У комментариев и инструкций tag — не строка
+        if isinstance(child.tag, str) and child.tag not in SKIP_TAGS:
+            yield from element_strings(child)
+        if child.tail:
+            yield child.tail
+
+def extract(html, targets):
+    """
+    Находит первый элемент для каждой цели.
+    Возвращает dict: key -> список текстовых фрагментов элемента (нет ключа — элемент не найден).
+    """
+    found = {}
+    required = {t.key for t in targets if t.required}
+    by_tag = {}
+    for t in targets:
+        for tag in t.tags:
+            by_tag.setdefault(tag, []).append(t)
+    capturing = {}       # элемент -> ключи целей, для которых он собирается
+    depth = 0            # вложенность внутри собираемых элементов
+
+    parser = etree.HTMLPullParser(events=("start", "end"))
+    for offset in range(0, len(html), CHUNK_SIZE):
+        parser.feed(html[offset:offset + CHUNK_SIZE])
+        for event, el in parser.read_events():
+            if not isinstance(el.tag, str):
+                continue
+            if event == "start":
+                candidates = by_tag.get(el.tag)
+                if candidates:
+                    busy = {key for keys in capturing.values() for key in keys}
+                    keys = [t.key for t in candidates if t.key not in found and t.key not in busy and t.matches(el)]
+                    if keys:
+                        capturing[el] = keys
+                        depth += 1
+                continue
+
+            keys = capturing.pop(el, None)
+            if keys:
+                strings = list(element_strings(el))
+                for key in keys:
+                    found[key] = strings
+                depth -= 1
+            if depth == 0:
+                # Узел больше не нужен: освобождаем его и уже пройденных соседей
+                el.clear(keep_tail=True)
+                parent = el.getparent()
+                if parent is not None:
+                    while el.getprevious() is not None:
+                        del parent[0]
+
+        if required <= found.keys():
+            break
+    return found
+
+def anchors(html):
+    """Все ссылки страницы: список (href, data-qa) в порядке документа."""
+    links = []
+    parser = etree.HTMLPullParser(events=("end",), tag="a")
+    for offset in range(0, len(html), CHUNK_SIZE):
+        parser.feed(html[offset:offset + CHUNK_SIZE])
+        for _, el in parser.read_events():
+            href = el.get("href")
+            if href:
+                links.append((href, el.get("data-qa")))
+    parser.close()
+    return links
+
+def page_text(html):
+    """Видимый текст всей страницы — запасной вариант, когда нужного блока нет."""
+    root = etree.fromstring(html, etree.HTMLParser())
+    if root is None:
+        return ""
+    body = root.find("body")
+    strings = (s.strip() for s in element_strings(body if body is not None else root))
+    return "\n".join(s for s in strings if s)
@@ -0,0 +1,219 @@
+import os
+import re
+import json
+import gzip
+import time
+import asyncio
+import hashlib
+import tempfile
+import threading
+import metrics
+
+# Дисковый кэш страниц hh.ru.
+# <ключ>.json — метаданные (url, время загрузки, ETag, Last-Modified), <ключ>.html.gz — сжатое тело.
+# Пока запись свежая (TTL по типу страницы), сеть не трогаем; после — переспрашиваем
+# HH условным запросом (If-None-Match / If-Modified-Since) и на 304 берем тело из кэша.
+CACHE_DIR = os.getenv("HH_CACHE_DIR", os.path.join("cache", "hh"))
+CACHE_MAX_BYTES = int(os.getenv("HH_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+
+# TTL по шаблону URL (секунды), первое совпадение
+TTL_RULES = [
+    (re.compile(r'/resume/'), 12 * 3600),
+    (re.compile(r'/vacancy/'), 6 * 3600),
+    (re.compile(r'/search/|/employer/|negotiations|responses'), 10 * 60),
+]
+DEFAULT_TTL = 3600
+# Размер кэша ведется счетчиком; каталог пересчитывается, когда лимит превышен, и не реже
+# раза в EVICT_INTERVAL секунд (в кэш пишут и другие процессы бота)
+EVICT_INTERVAL = 300.0
+# Вытеснение освобождает запас до этой доли лимита, чтобы следующие записи не пересчитывали каталог
+EVICT_TARGET = 0.9
+
+hits = 0           # свежая запись, без сети
+revalidated = 0    # 304 Not Modified
+misses = 0         # полная загрузка
+
+_total_bytes = None    # размер кэша по последнему пересчету плюс записанное после него
+_scanned_at = 0.0
+_size_lock = threading.Lock()
+
+def ttl_for(url):
+    for pattern, ttl in TTL_RULES:
+        if pattern.search(url):
+            return ttl
+    return DEFAULT_TTL
+
+def _key(url, use_auth):
+    # Авторизованная и публичная версии страницы различаются — кэшируем раздельно
+    return hashlib.sha256(f"{int(bool(use_auth))}:{url}".encode('utf-8')).hexdigest()
+
+def _paths(key):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    base = os.path.join(CACHE_DIR, key)
+    return base + ".json", base + ".html.gz"
+
+def _atomic_write(path, data):
+    # Свой временный файл на каждую запись: записи идут из потоков (to_thread) и процессов параллельно
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+    try:
+        with open(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+class CacheEntry:
+    def __init__(self, key, meta):
+        self.key = key
+        self.meta = meta
+
+    @property
+    def fresh(self):
+        return time.time() - self.meta["fetched_at"] < self.meta["ttl"]
+
+    def conditional_headers(self):
+        headers = {}
+        if self.meta.get("etag"):
+            headers["If-None-Match"] = self.meta["etag"]
+        if self.meta.get("last_modified"):
+            headers["If-Modified-Since"] = self.meta["last_modified"]
+        return headers
+
+    def body(self):
+        _, body_path = _paths(self.key)
+        with open(body_path, 'rb') as f:
+            return gzip.decompress(f.read()).decode('utf-8')
+
+
+def load(url, use_auth=False):
+    """Возвращает CacheEntry (свежую или устаревшую) или None."""
+    key = _key(url, use_auth)
+    meta_path, body_path = _paths(key)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if not os.path.exists(body_path):
+        return None
+    # Время доступа — для вытеснения давно не используемых страниц
+    os.utime(meta_path)
+    return CacheEntry(key, meta)
+
+def store(url, use_auth, text, etag=None, last_modified=None):
+    key = _key(url, use_auth)
+    meta_path, body_path = _paths(key)
+    body = gzip.compress(text.encode('utf-8'), compresslevel=6)
+    meta = {
+        "url": url,
+        "fetched_at": time.time(),
+        "ttl": ttl_for(url),
+        "etag": etag,
+        "last_modified": last_modified,
+        "size": len(body),
+    }
+    meta_data = json.dumps(meta).encode('utf-8')
+    replaced = _file_size(body_path) + _file_size(meta_path)
+    _atomic_write(body_path, body)
+    _atomic_write(meta_path, meta_data)
+    _account(len(body) + len(meta_data) - replaced)
+
+def _account(delta):
+    """Учитывает изменение размера кэша; вытеснение — только когда оно может понадобиться."""
+    global _total_bytes
+    with _size_lock:
+        if _total_bytes is not None:
+            _total_bytes += delta
+        due = (_total_bytes is None or _total_bytes > CACHE_MAX_BYTES
+               or time.monotonic() - _scanned_at > EVICT_INTERVAL)
+    if due:
+        evict()
+
+def refresh(entry):
+    """Страница не изменилась (304): продлеваем срок жизни записи."""
+    meta_path, _ = _paths(entry.key)
+    entry.meta["fetched_at"] = time.time()
+    _atomic_write(meta_path, json.dumps(entry.meta).encode('utf-8'))
+
+def evict():
+    """Если кэш больше CACHE_MAX_BYTES, удаляет давно не использованные страницы. Пересчитывает размер кэша."""
+    global _total_bytes, _scanned_at
+    entries = []
+    total = 0
+    for item in os.scandir(CACHE_DIR):
+        if not item.name.endswith(".json"):
+            continue
+        key = item.name[:-len(".json")]
+        body_path = os.path.join(CACHE_DIR, key + ".html.gz")
+        try:
+            size = os.path.getsize(body_path) + item.stat().st_size
+            entries.append((item.stat().st_mtime, size, key))
+        except FileNotFoundError:
+            continue
+        total += size
+
+    if total > CACHE_MAX_BYTES:
+        total = _remove_oldest(entries, total)
+    with _size_lock:
+        _total_bytes, _scanned_at = total, time.monotonic()
+
+def _remove_oldest(entries, total):
+    entries.sort()
+    for _, size, key in entries:
+        if total <= CACHE_MAX_BYTES * EVICT_TARGET:
+            break
+        for path in _paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total -= size
+    return total
+
+async def fetch_cached(fetch, url, use_auth=False, force_refresh=False):
+    """
+    Загрузка страницы через кэш.
+
+    :param fetch: async-функция (url, use_auth, headers) -> (status, headers, text), например HHClient.fetch
+    :param force_refresh: игнорировать кэш и загрузить страницу заново
+    :return: (status, text)
+    """
+    global hits, revalidated, misses
+    entry = None if force_refresh else await asyncio.to_thread(load, url, use_auth)
+    if entry and entry.fresh:
+        hits += 1
+        return 200, await asyncio.to_thread(entry.body)
+
+    headers = entry.conditional_headers() if entry else None
+    with metrics.stage("hh_fetch"):
+        status, response_headers, text = await fetch(url, use_auth=use_auth, headers=headers)
+
+    if status == 304 and entry:
+        revalidated += 1
+        await asyncio.to_thread(refresh, entry)
+        return 200, await asyncio.to_thread(entry.body)
+
+    misses += 1
+    if status == 200:
+        await asyncio.to_thread(
+            store, url, use_auth, text,
+            response_headers.get("ETag"), response_headers.get("Last-Modified")
+        )
+    return status, text
+
+def cache_stats():
+    total = hits + revalidated + misses
+    return {
+        "hits": hits,
+        "revalidated": revalidated,
+        "misses": misses,
+        "hit_rate": round((hits + revalidated) / total, 3) if total else 0.0,
+    }
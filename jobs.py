@@ -0,0 +1,328 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import socket
+import database as db
+import metrics
+
+# Очередь фоновых задач (OCR, генерация текстов GPT, анализ, пакетная обработка) в таблице jobs.
+# Хендлер ставит задачу и сразу отвечает, воркеры выполняют ее и сами присылают результат.
+# Порядок: сначала класс приоритета (интерактивные раньше пакетных), внутри класса — пользователи
+# с меньшим числом выполняющихся задач, затем по очереди постановки. У пользователя одновременно
+# выполняется не больше JOB_PER_USER задач, а JOB_INTERACTIVE_WORKERS воркеров берут только
+# интерактивные задачи — короткий запрос не ждет чужой OCR на 50 страниц.
+# Задачи переживают перезапуск: выполнявшиеся возвращаются в очередь (пока не кончились попытки),
+# если их процесс перестал продлевать аренду (JOB_LEASE). Очередь общая для всех процессов бота (режим webhook).
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))                          # берут задачи любого класса
+JOB_INTERACTIVE_WORKERS = int(os.getenv("JOB_INTERACTIVE_WORKERS", "2"))  # только интерактивные
+JOB_PER_USER = int(os.getenv("JOB_PER_USER", "2"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))   # секунды; растет вдвое с каждой попыткой
+JOB_LEASE = 60.0            # секунды без продления, после которых задача считается брошенной
+JOB_MONITOR_INTERVAL = 2.0  # продление аренды, отмены из других процессов, брошенные задачи
+JOB_KEEP = 7 * 24 * 3600    # сколько хранить завершенные задачи
+
+FINISHED = ("done", "failed", "cancelled")
+
+
+class PermanentJobError(Exception):
+    """Ошибка, при которой повтор задачи бесполезен (неподдерживаемый файл, нет данных)."""
+
+
+class Job:
+    def __init__(self, row):
+        self.id, self.kind, self.priority, self.user_id, self.chat_id, self.message_id, payload, \
+            self.attempts, self.max_attempts = row
+        self.payload = json.loads(payload)
+
+
+# --- Таблица jobs (функции синхронные, из async-кода — через db.run) ---
+
+_JOB_COLUMNS = 'id, kind, priority, user_id, chat_id, message_id, payload, attempts, max_attempts'
+
+def _insert(kind, priority, user_id, chat_id, message_id, payload, max_attempts):
+    with db.get_connection() as conn:
+        cursor = conn.execute('''
+            INSERT INTO jobs (kind, priority, user_id, chat_id, message_id, payload, max_attempts, available_at, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (kind, priority, user_id, chat_id, message_id, json.dumps(payload, ensure_ascii=False), max_attempts,
+              time.time(), time.time()))
+        return cursor.lastrowid
+
+def _claim(max_priority, owner, per_user):
+    """Забирает следующую задачу класса не ниже max_priority или возвращает None."""
+    now = time.time()
+    with db.get_connection() as conn:
+        # Блокировка записи: два воркера (или процесса) не заберут одну задачу
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('''
+            SELECT j.id FROM jobs j
+            WHERE j.status = 'queued' AND j.available_at <= ? AND j.priority <= ? AND j.attempts < j.max_attempts
+              AND (SELECT COUNT(*) FROM jobs r WHERE r.user_id = j.user_id AND r.status = 'running') < ?
+            ORDER BY j.priority,
+                     (SELECT COUNT(*) FROM jobs r WHERE r.user_id = j.user_id AND r.status = 'running'),
+                     j.id
+            LIMIT 1
+        ''', (now, max_priority, per_user)).fetchone()
+        if row is None:
+            return None
+        conn.execute('''
+            UPDATE jobs SET status = 'running', owner = ?, attempts = attempts + 1, started_at = ?, heartbeat_at = ?
+            WHERE id = ?
+        ''', (owner, now, now, row[0]))
+        return Job(conn.execute(f'SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?', row).fetchone())
+
+def _finish(job_id, status, error=None):
+    with db.get_connection() as conn:
+        # Задачу, отмененную во время выполнения, не перезаписываем
+        conn.execute('''
+            UPDATE jobs SET status = ?, error = ?, finished_at = ?, owner = NULL
+            WHERE id = ? AND status = 'running'
+        ''', (status, str(error)[:500] if error else None, time.time(), job_id))
+
+def _retry(job_id, delay, error):
+    with db.get_connection() as conn:
+        conn.execute('''
+            UPDATE jobs SET status = 'queued', error = ?, available_at = ?, owner = NULL
+            WHERE id = ? AND status = 'running'
+        ''', (str(error)[:500], time.time() + delay, job_id))
+
+def update_payload(job_id, payload):
+    """Сохраняет payload выполняющейся задачи: повтор после сбоя увидит, что уже сделано."""
+    with db.get_connection() as conn:
+        conn.execute('UPDATE jobs SET payload = ? WHERE id = ?', (json.dumps(payload, ensure_ascii=False), job_id))
+
+def _release(job_ids):
+    """Возвращает в очередь задачи, прерванные остановкой процесса (попытка не засчитывается)."""
+    with db.get_connection() as conn:
+        conn.executemany('''
+            UPDATE jobs SET status = 'queued', attempts = attempts - 1, owner = NULL
+            WHERE id = ? AND status = 'running'
+        ''', [(job_id,) for job_id in job_ids])
+
+def _monitor(owner, job_ids):
+    """
+    Продлевает аренду своих задач и разбирает брошенные: с оставшимися попытками они возвращаются
+    в очередь, остальные завершаются с ошибкой (иначе задача, роняющая процесс, повторялась бы без конца).
+    Возвращает (id своих отмененных задач, задачи, завершенные с ошибкой).
+    """
+    now = time.time()
+    with db.get_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status = 'running'", (now, owner)
+        )
+        # Очередные задачи без попыток — брошенные до того, как число попыток стали проверять
+        exhausted = [Job(row) for row in conn.execute(f'''
+            SELECT {_JOB_COLUMNS} FROM jobs
+            WHERE ((status = 'running' AND heartbeat_at < ?) OR status = 'queued') AND attempts >= max_attempts
+        ''', (now - JOB_LEASE,))]
+        conn.executemany('''
+            UPDATE jobs SET status = 'failed', error = 'lease expired', finished_at = ?, owner = NULL WHERE id = ?
+        ''', [(now, job.id) for job in exhausted])
+        stale = conn.execute('''
+            UPDATE jobs SET status = 'queued', owner = NULL
+            WHERE status = 'running' AND heartbeat_at < ?
+        ''', (now - JOB_LEASE,)).rowcount
+        if stale:
+            logging.warning("Jobs: %d abandoned jobs returned to the queue", stale)
+        if exhausted:
+            logging.warning("Jobs: %d abandoned jobs failed, no attempts left", len(exhausted))
+        if not job_ids:
+            return [], exhausted
+        rows = conn.execute(
+            f"SELECT id FROM jobs WHERE status = 'cancelled' AND id IN ({','.join('?' * len(job_ids))})", list(job_ids)
+        ).fetchall()
+    return [row[0] for row in rows], exhausted
+
+def cleanup():
+    with db.get_connection() as conn:
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?",
+            (time.time() - JOB_KEEP,)
+        )
+
+def cancel_job(job_id, user_id):
+    """Отменяет задачу пользователя, если она еще не завершена. Возвращает прежний статус или None."""
+    with db.get_connection() as conn:
+        row = conn.execute('SELECT status FROM jobs WHERE id = ? AND user_id = ?', (job_id, user_id)).fetchone()
+        if not row or row[0] in FINISHED:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ?", (time.time(), job_id)
+        )
+        return row[0]
+
+def get_job(job_id):
+    return db.get_connection().execute(f'SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+
+def find_job(chat_id, message_id):
+    """id задачи по ее сообщению о статусе."""
+    row = db.get_connection().execute(
+        'SELECT id FROM jobs WHERE chat_id = ? AND message_id = ? ORDER BY id DESC LIMIT 1', (chat_id, message_id)
+    ).fetchone()
+    return row[0] if row else None
+
+def queue_position(job_id):
+    """Сколько задач в очереди будет взято раньше этой (без учета лимитов пользователей)."""
+    row = db.get_connection().execute('''
+        SELECT COUNT(*) FROM jobs q, jobs j
+        WHERE j.id = ? AND q.status = 'queued'
+          AND (q.priority < j.priority OR (q.priority = j.priority AND q.id < j.id))
+    ''', (job_id,)).fetchone()
+    return row[0]
+
+def user_jobs(user_id, limit=10):
+    """Последние задачи пользователя: (id, kind, status, attempts, error, created_at)."""
+    return db.get_connection().execute('''
+        SELECT id, kind, status, attempts, error, created_at FROM jobs
+        WHERE user_id = ? ORDER BY id DESC LIMIT ?
+    ''', (user_id, limit)).fetchall()
+
+
+# --- Планировщик ---
+
+class JobQueue:
+    """
+    Воркеры очереди задач в текущем процессе.
+
+    :param notify: async-функция (job, status, error) — сообщить пользователю о неудаче
+                   ("failed") или отмене ("cancelled"); об успехе сообщает сам обработчик
+    """
+
+    def __init__(self, workers=JOB_WORKERS, interactive_workers=JOB_INTERACTIVE_WORKERS,
+                 per_user=JOB_PER_USER, notify=None):
+        self.workers = workers
+        self.interactive_workers = interactive_workers
+        self.per_user = per_user
+        self.notify = notify
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._handlers = {}     # kind -> (async-функция(job), число попыток)
+        self._running = {}      # id задачи -> asyncio.Task обработчика
+        self._cancelled = set()
+        self._wakeups = []
+        self._tasks = []
+
+    def register(self, kind, handler, max_attempts=3):
+        self._handlers[kind] = (handler, max_attempts)
+
+    async def enqueue(self, kind, user_id, chat_id, payload, priority=PRIORITY_NORMAL, message_id=None):
+        """
+        Ставит задачу в очередь и будит свободных воркеров. Возвращает id задачи.
+        message_id — сообщение о статусе задачи, в котором обработчик покажет результат.
+        """
+        job_id = await db.run(_insert, kind, priority, user_id, chat_id, message_id, payload, self._handlers[kind][1])
+        for event in self._wakeups:
+            event.set()
+        return job_id
+
+    async def cancel(self, job_id, user_id):
+        """Отменяет задачу; выполняющаяся в этом процессе прерывается сразу, в другом — при проверке монитором."""
+        previous = await db.run(cancel_job, job_id, user_id)
+        if previous == "running" and job_id in self._running:
+            self._cancelled.add(job_id)
+            self._running[job_id].cancel()
+        return previous
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker(PRIORITY_BULK)) for _ in range(self.workers)]
+        self._tasks += [asyncio.create_task(self._worker(PRIORITY_INTERACTIVE)) for _ in range(self.interactive_workers)]
+        self._tasks.append(asyncio.create_task(self._monitor()))
+
+    async def stop(self):
+        # Снимок до отмены: прерванная задача убирает себя из _running в finally у _run
+        running = list(self._running)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if running:
+            await db.run(_release, running)
+
+    async def _worker(self, max_priority):
+        wakeup = asyncio.Event()
+        self._wakeups.append(wakeup)
+        while True:
+            # Сброс до запроса: задача, поставленная во время запроса, разбудит воркер снова
+            wakeup.clear()
+            try:
+                job = await db.run(_claim, max_priority, self.owner, self.per_user)
+            except Exception as e:
+                logging.warning("Jobs: claim failed: %s", e)
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), JOB_MONITOR_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job):
+        handler, _ = self._handlers.get(job.kind, (None, 0))
+        if handler is None:
+            await db.run(_finish, job.id, "failed", f"unknown job kind {job.kind}")
+            return
+
+        task = asyncio.create_task(self._traced(handler, job))
+        self._running[job.id] = task
+        started = time.monotonic()
+        try:
+            await task
+        except asyncio.CancelledError:
+            if job.id not in self._cancelled:
+                raise   # остановка процесса: задача вернется в очередь в stop()
+            self._cancelled.discard(job.id)
+            logging.info("Job %s (%s) cancelled", job.id, job.kind)
+            await self._notify(job, "cancelled", None)
+            return
+        except Exception as e:
+            if not isinstance(e, PermanentJobError) and job.attempts < job.max_attempts:
+                delay = JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+                logging.warning("Job %s (%s) attempt %d failed, retry in %.0fs: %s", job.id, job.kind, job.attempts, delay, e)
+                await db.run(_retry, job.id, delay, e)
+            else:
+                logging.warning("Job %s (%s) failed: %s", job.id, job.kind, e)
+                await db.run(_finish, job.id, "failed", e)
+                await self._notify(job, "failed", e)
+            return
+        finally:
+            self._running.pop(job.id, None)
+
+        await db.run(_finish, job.id, "done")
+        logging.info("Job %s (%s) done in %.1fs", job.id, job.kind, time.monotonic() - started)
+
+    async def _traced(self, handler, job):
+        with metrics.trace("job", job.kind, job_id=job.id, user_id=job.user_id, attempt=job.attempts):
+            await handler(job)
+
+    async def _notify(self, job, status, error):
+        if self.notify:
+            try:
+                await self.notify(job, status, error)
+            except Exception as e:
+                logging.warning("Jobs: notify failed: %s", e)
+
+    async def _monitor(self):
+        last_cleanup = 0.0
+        while True:
+            await asyncio.sleep(JOB_MONITOR_INTERVAL)
+            try:
+                cancelled, exhausted = await db.run(_monitor, self.owner, list(self._running))
+                for job_id in cancelled:
+                    # Отменено из другого процесса
+                    if job_id in self._running:
+                        self._cancelled.add(job_id)
+                        self._running[job_id].cancel()
+                for job in exhausted:
+                    await self._notify(job, "failed", "задача прервана остановкой бота")
+                if time.monotonic() - last_cleanup > 3600:
+                    last_cleanup = time.monotonic()
+                    await db.run(cleanup)
+            except Exception as e:
+                logging.warning("Jobs: monitor failed: %s", e)
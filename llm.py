@@ -0,0 +1,415 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+import metrics
+
+# Устойчивость запросов к LLM:
+# - крайний срок: попытка ограничена LLM_ATTEMPT_TIMEOUT, весь вызов с повторами — LLM_DEADLINE
+#   (время ожидания в очереди шлюза не считается);
+# - повтор с экспоненциальной задержкой и случайным разбросом (full jitter) при 429, 5xx, обрыве
+#   соединения и таймауте; Retry-After от сервера учитывается;
+# - предохранитель: после LLM_BREAKER_FAILURES неудач подряд запросы сразу отклоняются
+#   на LLM_BREAKER_RESET секунд, затем проходит один пробный запрос;
+# - дублирование (hedging): если ответа нет дольше LLM_HEDGE_PERCENTILE-го процентиля недавних
+#   задержек, отправляется второй такой же запрос и берется первый ответ. Дублирование удваивает
+#   расход токенов на медленных запросах, поэтому по умолчанию выключено (0).
+# Встроенные повторы клиента openai нужно отключить (max_retries=0), иначе повторы умножаются.
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))   # одновременных запросов на весь бот
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "60"))   # секунды; для потока — до первого фрагмента и между фрагментами
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "150"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE = 1.0        # секунды, первая задержка (до разброса)
+LLM_RETRY_MAX = 20.0
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))  # например 95; 0 — без дублирования
+LLM_HEDGE_MIN_SAMPLES = 20  # до стольких замеров порог дублирования не считается
+LLM_LATENCY_WINDOW = 500    # сколько последних задержек хранить
+
+
+class LLMUnavailableError(Exception):
+    """Предохранитель разомкнут: LLM недавно отвечал ошибками подряд."""
+
+
+def is_retryable(error):
+    """Имеет ли смысл повторить запрос: таймаут, обрыв соединения, 408/409/429 и 5xx."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    # openai.APIConnectionError и APITimeoutError — без кода ответа
+    if type(error).__name__ in ("APIConnectionError", "APITimeoutError"):
+        return True
+    status = getattr(error, "status_code", None)
+    return status is not None and (status in (408, 409, 429) or status >= 500)
+
+def retry_after(error):
+    """Задержка из заголовка Retry-After ответа с ошибкой (секунды) или None."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else None
+
+
+class CircuitBreaker:
+    """Закрыт -> (failures неудач подряд) -> открыт reset_timeout секунд -> один пробный запрос."""
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, reset_timeout=LLM_BREAKER_RESET):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.errors = 0
+        self.opened_at = None
+        self.probing = False
+        self.rejected = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.probing or time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def check(self):
+        """Пропускает запрос или бросает LLMUnavailableError."""
+        if self.opened_at is None:
+            return
+        wait = self.reset_timeout - (time.monotonic() - self.opened_at)
+        if wait > 0 or self.probing:
+            self.rejected += 1
+            raise LLMUnavailableError(f"LLM временно недоступен, повторите через {max(wait, 1):.0f} с")
+        self.probing = True
+
+    def success(self):
+        if self.opened_at is not None:
+            logging.info("LLM circuit closed")
+        self.errors = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self):
+        self.errors += 1
+        if self.probing or (self.opened_at is None and self.errors >= self.failures):
+            logging.warning("LLM circuit opened after %d failures", self.errors)
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def abort(self):
+        """Пробный запрос отменен, не дождавшись ответа."""
+        self.probing = False
+
+
+class LLMGateway:
+    """
+    Общая асинхронная точка доступа к LLM для всех хендлеров.
+    Ограничивает число одновременных запросов глобально и на одного пользователя,
+    ведет учет запросов, ожидающих своей очереди, и делает запросы устойчивыми
+    к медленным ответам и сбоям (см. начало модуля).
+    """
+
+    def __init__(self, client, max_concurrency=16, per_user_concurrency=2, default_model="gpt-4o-mini",
+                 attempt_timeout=LLM_ATTEMPT_TIMEOUT, deadline=LLM_DEADLINE, max_retries=LLM_MAX_RETRIES,
+                 hedge_percentile=LLM_HEDGE_PERCENTILE, breaker=None):
+        self.client = client  # openai.AsyncOpenAI(max_retries=0)
+        self.default_model = default_model
+        self.max_concurrency = max_concurrency
+        self.per_user_concurrency = per_user_concurrency
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = deque(maxlen=LLM_LATENCY_WINDOW)   # успешные попытки, секунды
+
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._user_slots = {}   # user_id -> [Semaphore, число активных + ожидающих]
+
+        # Учет очереди
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.queued_by_user = {}
+
+    def _user_semaphore(self, user_id):
+        slot = self._user_slots.get(user_id)
+        if slot is None:
+            slot = [asyncio.Semaphore(self.per_user_concurrency), 0]
+            self._user_slots[user_id] = slot
+        slot[1] += 1
+        return slot
+
+    def _release_user(self, user_id):
+        slot = self._user_slots.get(user_id)
+        if slot is None:
+            return
+        slot[1] -= 1
+        # Не держим семафоры для пользователей без запросов
+        if slot[1] <= 0:
+            del self._user_slots[user_id]
+
+    @asynccontextmanager
+    async def slot(self, user_id=None):
+        """Занимает место в пользовательской и глобальной очереди на время запроса."""
+        user_slot = self._user_semaphore(user_id) if user_id is not None else None
+        self._enqueue(user_id)
+        dequeued = False
+        queued_at = time.perf_counter()
+        try:
+            # Сначала лимит пользователя, чтобы его очередь не занимала глобальные слоты
+            if user_slot:
+                await user_slot[0].acquire()
+            try:
+                async with self._global:
+                    metrics.LLM_QUEUE_SECONDS.observe(time.perf_counter() - queued_at)
+                    self._dequeue(user_id)
+                    dequeued = True
+                    self.in_flight += 1
+                    try:
+                        yield
+                    finally:
+                        self.in_flight -= 1
+            finally:
+                if user_slot:
+                    user_slot[0].release()
+        finally:
+            if not dequeued:
+                self._dequeue(user_id)
+            if user_id is not None:
+                self._release_user(user_id)
+
+    def _enqueue(self, user_id):
+        self.queued += 1
+        if user_id is not None:
+            self.queued_by_user[user_id] = self.queued_by_user.get(user_id, 0) + 1
+
+    def _dequeue(self, user_id):
+        self.queued -= 1
+        if user_id is None:
+            return
+        left = self.queued_by_user.get(user_id, 0) - 1
+        if left > 0:
+            self.queued_by_user[user_id] = left
+        else:
+            self.queued_by_user.pop(user_id, None)
+
+    def hedge_delay(self):
+        """Через сколько секунд без ответа отправлять дубль; None — не дублировать."""
+        if not self.hedge_percentile or len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return percentile(self.latencies, self.hedge_percentile)
+
+    async def _hedged(self, request, timeout, discard=None):
+        """
+        Одна попытка с ограничением timeout: request() и, если он задерживается дольше
+        hedge_delay() и есть свободный глобальный слот, его дубль. Возвращает первый успешный
+        результат; discard(result) освобождает результат проигравшего (например, закрывает поток).
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        primary = asyncio.ensure_future(request())
+        pending, hedge, error = {primary}, None, None
+        hedge_at = self.hedge_delay()
+        try:
+            while pending:
+                wake = timeout if hedge is not None or hedge_at is None else min(hedge_at, timeout)
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, started + wake - loop.time()), return_when=asyncio.FIRST_COMPLETED
+                )
+                winner = next((t for t in done if not t.cancelled() and t.exception() is None), None)
+                if winner is not None:
+                    self.latencies.append(loop.time() - started)
+                    if winner is hedge:
+                        self.hedge_wins += 1
+                    for other in done - {winner}:
+                        if not other.cancelled() and other.exception() is None and discard:
+                            await discard(other.result())
+                    return winner.result()
+                for task in done:
+                    error = task.exception()
+                if loop.time() - started >= timeout:
+                    break
+                if pending and hedge is None and hedge_at is not None:
+                    # Дубль только при свободной емкости: под нагрузкой он лишь удлинит очередь
+                    if not self._global.locked():
+                        hedge = asyncio.ensure_future(self._hedge_request(request))
+                        pending.add(hedge)
+                        self.hedged += 1
+                    hedge_at = None
+        finally:
+            for task in pending:
+                task.cancel()
+        if error is not None:
+            raise error
+        raise asyncio.TimeoutError(f"LLM не ответил за {timeout:.0f} с")
+
+    async def _hedge_request(self, request):
+        async with self._global:
+            self.in_flight += 1
+            try:
+                return await request()
+            finally:
+                self.in_flight -= 1
+
+    async def _resilient(self, request, deadline=None, discard=None):
+        """Попытки request() с повторами, крайним сроком и предохранителем (вызывается внутри slot)."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (deadline or self.deadline)
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.check()
+            try:
+                result = await self._hedged(request, min(self.attempt_timeout, deadline - loop.time()), discard)
+            except asyncio.CancelledError:
+                self.breaker.abort()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # Ошибка запроса (400, 401, ...): LLM отвечает, для предохранителя это не сбой
+                    self.breaker.success()
+                    self.failed += 1
+                    raise
+                self.breaker.failure()
+                delay = min(LLM_RETRY_MAX, retry_after(e) or random.uniform(0, LLM_RETRY_BASE * 2 ** (attempt - 1)))
+                if attempt > self.max_retries or loop.time() + delay >= deadline:
+                    self.failed += 1
+                    raise
+                self.retries += 1
+                logging.warning("LLM attempt %d failed (%s: %s), retry in %.1fs", attempt, type(e).__name__, e, delay)
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.success()
+            return result
+
+    async def complete(self, messages, model=None, user_id=None, deadline=None, **params):
+        """
+        Выполняет chat completion и возвращает текст ответа.
+
+        :param messages: список сообщений в формате OpenAI
+        :param model: модель (по умолчанию default_model)
+        :param user_id: id пользователя Telegram для пользовательского лимита
+        :param deadline: крайний срок вызова с повторами, секунды (по умолчанию LLM_DEADLINE)
+        :param params: остальные параметры (temperature, max_tokens, ...)
+        """
+        model = model or self.default_model
+
+        async def request():
+            return await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                **params
+            )
+
+        # Слот занят и на время задержек между повторами: при 429 и сбоях шлюз сам снижает нагрузку
+        async with self.slot(user_id):
+            try:
+                with metrics.LLM_SECONDS.time(model=model, mode="complete"):
+                    response = await self._resilient(request, deadline)
+            except Exception as e:
+                metrics.LLM_ERRORS.inc(model=model, error=type(e).__name__)
+                raise
+            self.completed += 1
+        _record_usage(model, getattr(response, "usage", None))
+        return response.choices[0].message.content
+
+    async def stream(self, messages, model=None, user_id=None, deadline=None, **params):
+        """
+        Потоковый chat completion: асинхронный генератор фрагментов текста по мере генерации.
+        Место в очереди занято, пока ответ не дочитан. Повтор и дублирование возможны только
+        до первого фрагмента: начатый ответ не повторяется, чтобы текст не задвоился.
+        """
+        model = model or self.default_model
+        # Последний чанк потока несет usage — для учета токенов
+        params.setdefault("stream_options", {"include_usage": True})
+
+        async def request():
+            response = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                **params
+            )
+            texts = _texts(response, model)
+            try:
+                return await texts.__anext__(), response, texts
+            except StopAsyncIteration:
+                return None, response, texts
+            except BaseException:
+                await _close(response)
+                raise
+
+        async with self.slot(user_id):
+            started = time.perf_counter()
+            try:
+                first, response, texts = await self._resilient(request, deadline, discard=lambda r: _close(r[1]))
+            except Exception as e:
+                metrics.LLM_ERRORS.inc(model=model, error=type(e).__name__)
+                raise
+            try:
+                if first is not None:
+                    yield first
+                while True:
+                    try:
+                        text = await asyncio.wait_for(texts.__anext__(), self.attempt_timeout)
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise asyncio.TimeoutError(f"LLM прервал ответ: нет данных {self.attempt_timeout:.0f} с") from None
+                    yield text
+            except Exception as e:
+                self.failed += 1
+                metrics.LLM_ERRORS.inc(model=model, error=type(e).__name__)
+                raise
+            finally:
+                await _close(response)
+                metrics.LLM_SECONDS.observe(time.perf_counter() - started, model=model, mode="stream")
+            self.completed += 1
+
+    def stats(self):
+        """Текущее состояние очереди запросов к LLM."""
+        return {
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "users_waiting": len(self.queued_by_user),
+            "retries": self.retries,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "circuit": self.breaker.state,
+            "rejected": self.breaker.rejected,
+            "latency_p50": percentile(self.latencies, 50),
+            "latency_p99": percentile(self.latencies, 99),
+        }
+
+
+def _record_usage(model, usage):
+    if usage is None:
+        return
+    metrics.LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, model=model, type="prompt")
+    metrics.LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, model=model, type="completion")
+
+async def _texts(response, model):
+    """Текстовые фрагменты потокового ответа; usage из последнего чанка идет в метрики."""
+    async for chunk in response:
+        _record_usage(model, getattr(chunk, "usage", None))
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+async def _close(response):
+    close = getattr(response, "close", None)
+    if close is not None:
+        try:
+            await close()
+        except Exception:
+            pass
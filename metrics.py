@@ -0,0 +1,321 @@
+import os
+import time
+import json
+import asyncio
+import logging
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+
+# Метрики и трассировка запросов.
+# Гистограммы и счетчики живут в памяти процесса и отдаются в формате Prometheus (render, serve).
+# Трасса — сводка одного обновления Telegram или фоновой задачи: сколько времени ушло на каждый
+# этап (скачивание, OCR, GPT, SQLite...) и сколько байт, страниц и токенов обработано. Этапы
+# находят текущую трассу через contextvars, в том числе из asyncio.to_thread. Трасса пишется
+# в лог одной JSON-строкой (логгер hrbot.trace), если длилась не меньше TRACE_LOG_MIN_MS.
+# Этапы могут быть вложенными (compact внутри hh_parse), поэтому их время не складывается в общее.
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))    # 0 — не поднимать сервер /metrics (режим polling)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+TRACE_LOG_MIN_MS = float(os.getenv("TRACE_LOG_MIN_MS", "0"))
+
+# Секунды: от запроса к SQLite до ответа GPT
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_metrics = []
+_collectors = []
+_trace = contextvars.ContextVar("hrbot_trace", default=None)
+trace_log = logging.getLogger("hrbot.trace")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+def _number(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Counter:
+    """
+    Монотонный счетчик. trace — под каким именем прибавлять значения к текущей трассе
+    (шаблон str.format по меткам, например "tokens_{type}").
+    """
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labels=(), trace=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.trace = trace
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, value=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+        if self.trace:
+            current = _trace.get()
+            if current is not None:
+                current.add(self.trace.format(**labels), value)
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, "") for n in self.labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _labels_text(self.labels, key), value) for key, value in items]
+
+
+class Histogram:
+    """
+    Гистограмма длительностей. trace — под каким именем учитывать время в текущей трассе
+    (шаблон str.format по меткам, например "{stage}").
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=BUCKETS, trace=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.trace = trace
+        self._values = {}   # метки -> [счетчики по корзинам, сумма, число]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+        if self.trace:
+            current = _trace.get()
+            if current is not None:
+                current.span(self.trace.format(**labels), value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        entry = self._values.get(tuple(labels.get(n, "") for n in self.labels))
+        return entry[2] if entry else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()]
+        result = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                result.append((f"{self.name}_bucket", _labels_text(self.labels + ("le",), key + (bound,)), cumulative))
+            result.append((f"{self.name}_bucket", _labels_text(self.labels + ("le",), key + ("+Inf",)), count))
+            result.append((f"{self.name}_sum", _labels_text(self.labels, key), total))
+            result.append((f"{self.name}_count", _labels_text(self.labels, key), count))
+        return result
+
+
+# --- Метрики бота ---
+
+REQUEST_SECONDS = Histogram("hrbot_request_seconds", "Обработка обновления Telegram или фоновой задачи",
+                            ("kind", "name"))
+REQUESTS = Counter("hrbot_requests_total", "Обработанные обновления и задачи", ("kind", "name", "status"))
+STAGE_SECONDS = Histogram("hrbot_stage_seconds", "Длительность этапов обработки", ("stage",), trace="{stage}")
+STAGE_ERRORS = Counter("hrbot_stage_errors_total", "Этапы, завершившиеся ошибкой", ("stage",))
+PIPELINE_SECONDS = Histogram("hrbot_pipeline_stage_seconds", "Обработка элемента (пачки) этапом конвейера пакета",
+                             ("stage",))
+DB_SECONDS = Histogram("hrbot_db_seconds", "Вызовы SQLite через db.run, с ожиданием потока пула", ("op",), trace="db")
+LLM_SECONDS = Histogram("hrbot_llm_seconds", "Запросы к LLM с повторами (без ожидания в очереди шлюза)",
+                        ("model", "mode"), trace="llm")
+LLM_QUEUE_SECONDS = Histogram("hrbot_llm_queue_seconds", "Ожидание места в очереди шлюза LLM", trace="llm_queue")
+LLM_TOKENS = Counter("hrbot_llm_tokens_total", "Токены по response.usage", ("model", "type"), trace="tokens_{type}")
+LLM_ERRORS = Counter("hrbot_llm_errors_total", "Запросы к LLM, завершившиеся ошибкой", ("model", "error"))
+DOWNLOAD_BYTES = Counter("hrbot_download_bytes_total", "Скачано файлов из Telegram, байт", trace="download_bytes")
+PDF_PAGES = Counter("hrbot_pdf_pages_total", "Страницы PDF: с текстовым слоем и распознанные OCR", ("kind",),
+                    trace="pdf_pages_{kind}")
+
+
+# --- Трасса ---
+
+class Trace:
+    def __init__(self, kind, name, fields):
+        self.kind = kind
+        self.name = name
+        self.fields = fields
+        self.spans = {}     # этап -> [число, секунды]
+        self.counts = {}
+        self.started = time.perf_counter()
+
+    def span(self, stage, seconds):
+        entry = self.spans.setdefault(stage, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def add(self, name, value):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def summary(self, status, elapsed):
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            **self.fields,
+            "status": status,
+            "ms": round(elapsed * 1000, 1),
+            "spans": {stage: {"n": n, "ms": round(s * 1000, 1)} for stage, (n, s) in self.spans.items()},
+            **({"counts": self.counts} if self.counts else {}),
+        }
+
+@contextmanager
+def trace(kind, name=None, **fields):
+    """Трасса обновления (kind="update") или задачи (kind="job"); имя можно задать позже через annotate."""
+    current = Trace(kind, name, fields)
+    token = _trace.set(current)
+    status = "ok"
+    try:
+        yield current
+    except BaseException as e:
+        status = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+        current.fields.setdefault("error", f"{type(e).__name__}: {e}"[:200])
+        raise
+    finally:
+        _trace.reset(token)
+        elapsed = time.perf_counter() - current.started
+        name = current.name or "unknown"
+        REQUEST_SECONDS.observe(elapsed, kind=kind, name=name)
+        REQUESTS.inc(kind=kind, name=name, status=status)
+        if elapsed * 1000 >= TRACE_LOG_MIN_MS:
+            trace_log.info(json.dumps(current.summary(status, elapsed), ensure_ascii=False, default=str))
+
+def annotate(name=None, **fields):
+    """Дополняет текущую трассу (например, именем хендлера, которое известно не сразу)."""
+    current = _trace.get()
+    if current is None:
+        return
+    if name:
+        current.name = name
+    current.fields.update(fields)
+
+@contextmanager
+def stage(name):
+    """Замер этапа: гистограмма hrbot_stage_seconds и время этапа в трассе."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+def timed(name):
+    """Декоратор: вызов функции (обычной или async) — этап name."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- Формат Prometheus ---
+
+def register_collector(func):
+    """
+    func() -> [(имя, тип, описание, [(метки dict, значение), ...]), ...] — значения, которые
+    модули уже считают сами (кэши, очередь LLM); читаются в момент запроса /metrics.
+    """
+    _collectors.append(func)
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(f"{name}{labels} {_number(value)}" for name, labels, value in metric.samples())
+    for collector in _collectors:
+        try:
+            families = collector()
+        except Exception as e:
+            logging.warning("Metrics collector %s failed: %s", getattr(collector, "__name__", collector), e)
+            continue
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                lines.append(f"{name}{_labels_text(tuple(labels), tuple(labels.values()))} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+def merge(texts):
+    """
+    Объединяет выводы render() нескольких процессов: к каждому значению добавляется метка
+    worker, значения одной метрики идут одной группой, как требует формат.
+    texts — {номер процесса: текст}.
+    """
+    families = {}
+    for worker, text in texts.items():
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# "):
+                family = line.split()[2]
+                headers, _ = families.setdefault(family, ([], []))
+                if len(headers) < 2 and line not in headers:
+                    headers.append(line)
+                continue
+            if not line or family is None:
+                continue
+            name, value = line.rsplit(" ", 1)
+            label = f'worker="{worker}"'
+            name = name.replace("{", "{" + label + ",", 1) if "{" in name else f"{name}{{{label}}}"
+            families[family][1].append(f"{name} {value}")
+    return "\n".join(line for headers, samples in families.values() for line in headers + samples) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+async def serve(host=METRICS_HOST, port=METRICS_PORT):
+    """HTTP-сервер с /metrics (режим polling). Возвращает aiohttp AppRunner для остановки."""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(body=render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info("Metrics on http://%s:%d/metrics", host, port)
+    return runner
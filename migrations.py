@@ -0,0 +1,309 @@
+import logging
+
+# Версионные миграции схемы hr_assistant.db.
+# Текущая версия хранится в PRAGMA user_version; каждая миграция выполняется
+# один раз, в своей транзакции. Новые миграции добавляются только в конец списка.
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+def m001_baseline(conn):
+    """Исходная схема + колонки, которые add_candidate пишет, а init_db не создавал."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vacancies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE,
+            description TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS candidates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT,
+            phone TEXT,
+            vacancy_name TEXT,
+            score TEXT,
+            analysis_text TEXT,
+            resume_url TEXT,
+            FOREIGN KEY (vacancy_name) REFERENCES vacancies (name)
+        )
+    ''')
+    columns = _columns(conn, 'candidates')
+    if 'total_experience' not in columns:
+        conn.execute('ALTER TABLE candidates ADD COLUMN total_experience TEXT')
+    if 'score_quality' not in columns:
+        conn.execute('ALTER TABLE candidates ADD COLUMN score_quality TEXT')
+
+def m002_vacancy_id(conn):
+    """
+    Связь кандидатов с вакансией по целочисленному vacancy_id вместо текстового имени.
+    SQLite не умеет менять внешние ключи, поэтому таблица пересоздается.
+    vacancy_name остается для отображения и выгрузки.
+    """
+    conn.execute('''
+        CREATE TABLE candidates_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            vacancy_id INTEGER REFERENCES vacancies (id) ON DELETE CASCADE,
+            full_name TEXT,
+            phone TEXT,
+            vacancy_name TEXT,
+            score TEXT,
+            score_quality TEXT,
+            total_experience TEXT,
+            analysis_text TEXT,
+            resume_url TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Точное совпадение имени, иначе — как раньше искали кнопки: по первым 20 символам
+    conn.execute('''
+        INSERT INTO candidates_new (id, vacancy_id, full_name, phone, vacancy_name, score,
+                                    score_quality, total_experience, analysis_text, resume_url, created_at)
+        SELECT c.id,
+               COALESCE(
+                   (SELECT v.id FROM vacancies v WHERE v.name = c.vacancy_name),
+                   (SELECT v.id FROM vacancies v
+                    WHERE substr(v.name, 1, 20) = substr(c.vacancy_name, 1, 20)
+                    ORDER BY v.id LIMIT 1)
+               ),
+               c.full_name, c.phone, c.vacancy_name, c.score,
+               c.score_quality, c.total_experience, c.analysis_text, c.resume_url, NULL
+        FROM candidates c
+    ''')
+    conn.execute('DROP TABLE candidates')
+    conn.execute('ALTER TABLE candidates_new RENAME TO candidates')
+    conn.execute('CREATE INDEX idx_candidates_vacancy ON candidates (vacancy_id, id)')
+
+def m003_score_value(conn):
+    """Числовая оценка для сортировки и keyset-пагинации списка кандидатов."""
+    conn.execute('ALTER TABLE candidates ADD COLUMN score_value INTEGER NOT NULL DEFAULT 0')
+    # score хранится как "7/10"
+    conn.execute('''
+        UPDATE candidates
+        SET score_value = COALESCE(CAST(substr(score, 1, instr(score, '/') - 1) AS INTEGER), 0)
+        WHERE instr(score, '/') > 1
+    ''')
+    conn.execute('CREATE INDEX idx_candidates_vacancy_score ON candidates (vacancy_id, score_value, id)')
+
+def m004_crawl(conn):
+    """Контрольные точки обхода выдачи HH: задание обхода и найденные в нем резюме."""
+    conn.execute('''
+        CREATE TABLE crawl_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            start_url TEXT NOT NULL,
+            next_url TEXT,
+            vacancy_name TEXT,
+            job_text TEXT,
+            chat_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'running',
+            pages_done INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Ключ (job_id, resume_id) — одно резюме обрабатывается в задании один раз
+    conn.execute('''
+        CREATE TABLE crawl_items (
+            job_id INTEGER NOT NULL REFERENCES crawl_jobs (id) ON DELETE CASCADE,
+            resume_id TEXT NOT NULL,
+            url TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            candidate_id INTEGER,
+            error TEXT,
+            PRIMARY KEY (job_id, resume_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX idx_crawl_items_resume ON crawl_items (resume_id, status)')
+    conn.execute('CREATE INDEX idx_crawl_jobs_status ON crawl_jobs (status)')
+
+def m005_embeddings(conn):
+    """Текст резюме у кандидата и векторы для предварительного отбора (prescreen.py)."""
+    conn.execute('ALTER TABLE candidates ADD COLUMN resume_text TEXT')
+    # model — имя векторизатора: векторы другого векторизатора не смешиваются с текущими
+    conn.execute('''
+        CREATE TABLE embeddings (
+            kind TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            PRIMARY KEY (kind, item_id)
+        )
+    ''')
+    # Векторы удаленных записей удаляются вместе с ними (в том числе каскадом)
+    conn.execute('''
+        CREATE TRIGGER trg_candidates_embedding_delete AFTER DELETE ON candidates BEGIN
+            DELETE FROM embeddings WHERE kind = 'candidate' AND item_id = old.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER trg_vacancies_embedding_delete AFTER DELETE ON vacancies BEGIN
+            DELETE FROM embeddings WHERE kind = 'vacancy' AND item_id = old.id;
+        END
+    ''')
+
+def m006_candidates_fts(conn):
+    """
+    Полнотекстовый индекс FTS5 по ФИО, тексту резюме и анализу кандидатов.
+    Таблица с внешним содержимым (content=candidates): текст не дублируется,
+    индекс поддерживают триггеры.
+    """
+    conn.execute('''
+        CREATE VIRTUAL TABLE candidates_fts USING fts5(
+            full_name, resume_text, analysis_text,
+            content='candidates', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER trg_candidates_fts_insert AFTER INSERT ON candidates BEGIN
+            INSERT INTO candidates_fts (rowid, full_name, resume_text, analysis_text)
+            VALUES (new.id, new.full_name, new.resume_text, new.analysis_text);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER trg_candidates_fts_delete AFTER DELETE ON candidates BEGIN
+            INSERT INTO candidates_fts (candidates_fts, rowid, full_name, resume_text, analysis_text)
+            VALUES ('delete', old.id, old.full_name, old.resume_text, old.analysis_text);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER trg_candidates_fts_update AFTER UPDATE OF full_name, resume_text, analysis_text ON candidates BEGIN
+            INSERT INTO candidates_fts (candidates_fts, rowid, full_name, resume_text, analysis_text)
+            VALUES ('delete', old.id, old.full_name, old.resume_text, old.analysis_text);
+            INSERT INTO candidates_fts (rowid, full_name, resume_text, analysis_text)
+            VALUES (new.id, new.full_name, new.resume_text, new.analysis_text);
+        END
+    ''')
+    # Ранжирование по умолчанию (ORDER BY rank): совпадение в ФИО весит больше, чем в анализе и резюме
+    conn.execute("INSERT INTO candidates_fts (candidates_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 2.0)')")
+    # Индекс по уже сохраненным кандидатам
+    conn.execute("INSERT INTO candidates_fts (candidates_fts) VALUES ('rebuild')")
+
+def m007_fsm_storage(conn):
+    """Состояния FSM пользователей (fsm_storage.py) и их длинные тексты, сжатые и по ссылке."""
+    conn.execute('''
+        CREATE TABLE fsm_states (
+            key TEXT PRIMARY KEY,
+            user_id INTEGER,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            size INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_fsm_states_user ON fsm_states (user_id)')
+    conn.execute('CREATE INDEX idx_fsm_states_updated ON fsm_states (updated_at)')
+    conn.execute('''
+        CREATE TABLE fsm_blobs (
+            hash TEXT PRIMARY KEY,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL
+        )
+    ''')
+    # Какие тексты нужны какой записи: по ним удаляются тексты без ссылок
+    conn.execute('''
+        CREATE TABLE fsm_refs (
+            key TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            PRIMARY KEY (key, hash)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX idx_fsm_refs_hash ON fsm_refs (hash)')
+
+def m008_jobs(conn):
+    """Очередь фоновых задач (jobs.py)."""
+    conn.execute('''
+        CREATE TABLE jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            priority INTEGER NOT NULL,
+            user_id INTEGER,
+            chat_id INTEGER,
+            message_id INTEGER,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            error TEXT,
+            owner TEXT,
+            available_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            heartbeat_at REAL,
+            finished_at REAL
+        )
+    ''')
+    # Выбор следующей задачи и подсчет выполняющихся задач пользователя
+    conn.execute('CREATE INDEX idx_jobs_queue ON jobs (status, priority, id)')
+    conn.execute('CREATE INDEX idx_jobs_user ON jobs (user_id, status)')
+
+def m009_candidate_vacancies(conn):
+    """
+    Кандидаты несохраненных вакансий записывались с vacancy_id = NULL: создаем такие вакансии
+    (без текста — его не сохраняли) и привязываем к ним кандидатов.
+    """
+    conn.execute('''
+        INSERT INTO vacancies (name)
+        SELECT DISTINCT vacancy_name FROM candidates
+        WHERE vacancy_id IS NULL AND vacancy_name IS NOT NULL AND vacancy_name != ''
+        ON CONFLICT (name) DO NOTHING
+    ''')
+    conn.execute('''
+        UPDATE candidates SET vacancy_id = (SELECT v.id FROM vacancies v WHERE v.name = candidates.vacancy_name)
+        WHERE vacancy_id IS NULL
+    ''')
+
+def m010_crawl_lease(conn):
+    """
+    Аренда заданий обхода, как у jobs: процесс-владелец и время последнего продления.
+    Приостановленный обход (страница выдачи не загрузилась) получает статус 'paused'.
+    """
+    conn.execute('ALTER TABLE crawl_jobs ADD COLUMN owner TEXT')
+    conn.execute('ALTER TABLE crawl_jobs ADD COLUMN heartbeat_at REAL')
+
+def m011_crawl_item_attempts(conn):
+    """Число неудачных попыток резюме обхода: резюме с ошибкой повторяются, пока попытки не кончатся."""
+    conn.execute('ALTER TABLE crawl_items ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+    conn.execute("UPDATE crawl_items SET attempts = 1 WHERE status = 'failed'")
+
+MIGRATIONS = [
+    (1, "baseline", m001_baseline),
+    (2, "vacancy_id", m002_vacancy_id),
+    (3, "score_value", m003_score_value),
+    (4, "crawl", m004_crawl),
+    (5, "embeddings", m005_embeddings),
+    (6, "candidates_fts", m006_candidates_fts),
+    (7, "fsm_storage", m007_fsm_storage),
+    (8, "jobs", m008_jobs),
+    (9, "candidate_vacancies", m009_candidate_vacancies),
+    (10, "crawl_lease", m010_crawl_lease),
+    (11, "crawl_item_attempts", m011_crawl_item_attempts),
+]
+
+def migrate(conn):
+    """Применяет недостающие миграции. Возвращает итоговую версию схемы."""
+    old_isolation = conn.isolation_level
+    # Транзакциями управляем вручную; внешние ключи на время пересоздания таблиц выключены
+    conn.isolation_level = None
+    conn.execute('PRAGMA foreign_keys=OFF')
+    try:
+        for number, name, func in MIGRATIONS:
+            # BEGIN IMMEDIATE берет блокировку записи: если бот запущен в нескольких
+            # процессах, миграцию выполнит только первый, остальные увидят новую версию
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                version = conn.execute('PRAGMA user_version').fetchone()[0]
+                if version >= number:
+                    conn.execute('COMMIT')
+                    continue
+                func(conn)
+                conn.execute(f'PRAGMA user_version = {number}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            logging.info("DB migration %03d_%s applied", number, name)
+    finally:
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.isolation_level = old_isolation
+    return conn.execute('PRAGMA user_version').fetchone()[0]
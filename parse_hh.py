@@ -1,52 +1,47 @@
-import json
-import requests
+import re
+import asyncio
+from urllib.parse import urljoin
 from bs4 import BeautifulSoup
+from hh_client import get_client
+import http_cache
+import hh_extract
+import compaction
+import metrics
+from hh_extract import Target
 
-# Заголовки для имитации реального браузера
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
-    "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
-}
+# Узлы страниц HH, которые нужны для вакансии и резюме
+VACANCY_TARGETS = [
+    Target("title", ["h1"], data_qa="vacancy-title"),
+    Target("title_span", ["span"], data_qa="vacancy-title", required=False),
+    Target("h1", ["h1"], required=False),
+    Target("company", ["a"], data_qa="vacancy-company-name"),
+    Target("description", ["div"], data_qa="vacancy-description"),
+]
+RESUME_TARGETS = [
+    Target("name", ["h2"], data_qa="resume-personal-name"),
+    Target("name_span", ["span"], data_qa="resume-personal-name", required=False),
+    Target("phone", ["span"], data_qa="resume-contacts-phone"),
+    Target("main", ["div"], element_id="resume-main-content"),
+]
+RESUME_ACCESS_ERROR = "Ошибка доступа к резюме. Проверьте cookies.json."
+RESUME_LINK_RE = re.compile(r'/resume/([0-9a-f]{8,})')
 
-def load_cookies_to_session(session, cookies_path='cookies.json'):
+async def get_html(url, use_auth=False, force_refresh=False):
     """
-    Загружает куки работодателя из JSON-файла в сессию requests.
+    Получает HTML-код страницы через общий клиент hh_client (пул соединений, лимит частоты)
+    и дисковый кэш http_cache. Если use_auth=True, запрос идет с куками работодателя из cookies.json.
+    force_refresh=True — загрузить страницу заново, минуя кэш.
     """
     try:
-        with open(cookies_path, 'r', encoding='utf-8') as f:
-            cookies_list = json.load(f)
-            for cookie in cookies_list:
-                session.cookies.set(
-                    cookie['name'], 
-                    cookie['value'], 
-                    domain=cookie.get('domain', '.hh.ru')
-                )
-        return True
-    except FileNotFoundError:
-        print(f"Файл {cookies_path} не найден.")
-        return False
-    except Exception as e:
-        print(f"Ошибка загрузки куки: {e}")
-        return False
-
-def get_html(url, use_auth=False):
-    """
-    Получает HTML-код страницы. Если use_auth=True, использует куки из cookies.json.
-    """
-    session = requests.Session()
-    session.headers.update(HEADERS)
-    
-    if use_auth:
-        load_cookies_to_session(session)
-        
-    try:
-        response = session.get(url, timeout=15)
-        response.raise_for_status()
-        return response.text
+        status, text = await http_cache.fetch_cached(get_client().fetch, url, use_auth, force_refresh)
+        if status >= 400:
+            raise Exception(f"HTTP {status}")
+        return text
     except Exception as e:
         print(f"Ошибка при запросе к HH.ru: {e}")
         return None
 
+@metrics.timed("hh_parse")
 def extract_vacancy_data(html):
     """
     Парсит публичные данные вакансии.
@@ -55,6 +50,26 @@ def extract_vacancy_data(html):
     if not html:
         return "Не найдено"
 
+    if hh_extract.available():
+        title, company_text, desc_text = _vacancy_fields(html)
+    else:
+        title, company_text, desc_text = _vacancy_fields_bs4(html)
+
+    # Формируем текст (первая строка — заголовок для БД)
+    return f"# {title}\n\n**Компания:** {company_text}\n\n## Описание\n{desc_text}"
+
+def _vacancy_fields(html):
+    nodes = hh_extract.extract(html, VACANCY_TARGETS)
+
+    # Поиск заголовка (название вакансии)
+    title_key = next((key for key in ("title", "title_span", "h1") if key in nodes), None)
+    title = "".join(nodes[title_key]).strip() if title_key else "Название не определено"
+    company_text = "".join(nodes["company"]).strip() if "company" in nodes else "Компания не указана"
+    desc_text = "\n".join(nodes["description"]).strip() if "description" in nodes else "Описание не найдено"
+    return title, company_text, desc_text
+
+def _vacancy_fields_bs4(html):
+    """Разбор через BeautifulSoup — если lxml не установлен."""
     soup = BeautifulSoup(html, 'html.parser')
     
     # Поиск заголовка (название вакансии)
@@ -72,18 +87,75 @@ def extract_vacancy_data(html):
     # Поиск описания
     description = soup.find('div', {'data-qa': 'vacancy-description'})
     desc_text = description.get_text(separator="\n").strip() if description else "Описание не найдено"
+    return title, company_text, desc_text
 
-    # Формируем текст (первая строка — заголовок для БД)
-    return f"# {title}\n\n**Компания:** {company_text}\n\n## Описание\n{desc_text}"
-
-def extract_resume_data(url):
+async def extract_resume_data(url, force_refresh=False):
     """
     Парсит данные резюме через аккаунт работодателя.
     """
-    html = get_html(url, use_auth=True)
+    html = await get_html(url, use_auth=True, force_refresh=force_refresh)
     if not html:
-        return "Ошибка доступа к резюме. Проверьте cookies.json."
+        return RESUME_ACCESS_ERROR
 
+    # Разбор HTML — работа для CPU, выносим из event loop
+    return await asyncio.to_thread(parse_resume_html, html)
+
+def resume_id(url):
+    """ID резюме из ссылки HH или None."""
+    match = RESUME_LINK_RE.search(url)
+    return match.group(1) if match else None
+
+def parse_search_page(html, page_url):
+    """
+    Разбирает страницу поиска резюме или откликов работодателя.
+    Возвращает (ссылки на резюме без повторов, ссылка на следующую страницу или None).
+    """
+    if hh_extract.available():
+        links = hh_extract.anchors(html)
+    else:
+        soup = BeautifulSoup(html, 'html.parser')
+        links = [(a['href'], a.get('data-qa')) for a in soup.find_all('a', href=True)]
+
+    resumes, seen, next_url = [], set(), None
+    for href, data_qa in links:
+        if data_qa == "pager-next":
+            next_url = urljoin(page_url, href)
+            continue
+        rid = resume_id(href)
+        if rid and rid not in seen:
+            seen.add(rid)
+            resumes.append(urljoin(page_url, href))
+    return resumes, next_url
+
+@metrics.timed("hh_parse")
+def parse_resume_html(html):
+    """Достает из HTML страницы резюме ФИО, телефон и текст для анализа."""
+    if hh_extract.available():
+        name, phone, resume_body = _resume_fields(html)
+    else:
+        name, phone, resume_body = _resume_fields_bs4(html)
+
+    # Ужимаем текст до бюджета токенов (опыт и навыки — в первую очередь), чтобы не переплачивать
+    markdown = f"# ФИО: {name}\n"
+    markdown += f"**Телефон:** {phone}\n\n"
+    markdown += f"## Данные для анализа\n{compaction.compact(resume_body, 'resume')}"
+    
+    return markdown
+
+def _resume_fields(html):
+    nodes = hh_extract.extract(html, RESUME_TARGETS)
+    name_key = next((key for key in ("name", "name_span") if key in nodes), None)
+    name = "".join(nodes[name_key]).strip() if name_key else "ФИО скрыто"
+    phone = "".join(nodes["phone"]).strip() if "phone" in nodes else "Телефон не найден"
+    if "main" in nodes:
+        resume_body = "\n".join(nodes["main"]).strip()
+    else:
+        # Нет основного блока — видимый текст страницы без скриптов и стилей
+        resume_body = hh_extract.page_text(html)
+    return name, phone, resume_body
+
+def _resume_fields_bs4(html):
+    """Разбор через BeautifulSoup — если lxml не установлен."""
     soup = BeautifulSoup(html, 'html.parser')
     
     # 1. Извлекаем ФИО (доступно только при наличии кук работодателя)
@@ -100,11 +172,5 @@ def extract_resume_data(url):
     # 3. Извлекаем основной текст резюме для ИИ-анализа
     # Собираем опыт и навыки
     main_content = soup.find('div', {'id': 'resume-main-content'})
-    resume_body = main_content.get_text(separator=" ").strip() if main_content else soup.get_text()
-
-    # Ограничиваем длину для GPT, чтобы не переплачивать за токены
-    markdown = f"# ФИО: {name}\n"
-    markdown += f"**Телефон:** {phone}\n\n"
-    markdown += f"## Данные для анализа\n{resume_body[:4000]}"
-    
-    return markdown
\ No newline at end of file
+    resume_body = main_content.get_text(separator="\n").strip() if main_content else soup.get_text(separator="\n")
+    return name, phone, resume_body
\ No newline at end of file
@@ -2,58 +2,152 @@ import pdfplumber
 import pytesseract
 from PIL import Image
 import io
+import os
+import asyncio
 import re
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from itertools import islice
+import compaction
+import metrics
 
-def extract_resume_data_from_pdf(
-    pdf_bytes,  # streamlit uploaded_file или путь к файлу
+# Настройки OCR
+OCR_DPI = 300
+OCR_LANG = "rus+eng"
+OCR_CONFIG = "--psm 6"
+# Страница, на которой текста меньше этого порога и есть картинки, считается сканом
+OCR_MIN_CHARS = 30
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+
+_ocr_pool = None
+
+def _get_ocr_pool():
+    """Общий ограниченный пул процессов для OCR (создается при первом скане)."""
+    global _ocr_pool
+    if _ocr_pool is None:
+        _ocr_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS)
+    return _ocr_pool
+
+def _ocr_page(pdf_path, page_number):
+    """Рендерит и распознает одну страницу. Выполняется в процессе пула."""
+    from pdf2image import convert_from_path
+    images = convert_from_path(pdf_path, dpi=OCR_DPI, first_page=page_number, last_page=page_number)
+    texts = []
+    for img in images:
+        texts.append(pytesseract.image_to_string(img, lang=OCR_LANG, config=OCR_CONFIG))
+        img.close()
+    return "\n".join(texts)
+
+def _page_needs_ocr(page, text):
+    # Скан — это картинка почти без текстового слоя; пустые страницы не распознаем
+    return len(text.strip()) < OCR_MIN_CHARS and bool(page.images)
+
+def ocr_pages(pdf_bytes, page_numbers):
+    """
+    Распознает указанные страницы в пуле процессов.
+    В работе одновременно не больше OCR_WORKERS страниц, результаты отдаются
+    по порядку страниц: генератор (номер страницы, текст).
+    """
+    if not page_numbers:
+        return
+
+    # pdftoppm все равно читает файл с диска: пишем PDF один раз,
+    # а не передаем байты в каждый процесс
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(pdf_bytes)
+        pdf_path = tmp.name
+
+    pool = _get_ocr_pool()
+    pending = deque()
+    numbers = iter(page_numbers)
+    try:
+        for number in islice(numbers, OCR_WORKERS):
+            pending.append((number, pool.submit(_ocr_page, pdf_path, number)))
+        while pending:
+            number, future = pending.popleft()
+            # Держим окно заполненным, пока ждем текущую страницу
+            next_number = next(numbers, None)
+            if next_number is not None:
+                pending.append((next_number, pool.submit(_ocr_page, pdf_path, next_number)))
+            yield number, future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
+        # Дожидаемся уже запущенных страниц, прежде чем удалить файл
+        wait([future for _, future in pending])
+        os.unlink(pdf_path)
+
+def extract_pdf_text(pdf_bytes) -> str:
+    """
+    Извлекает сырой текст из PDF: текстовые страницы через pdfplumber,
+    сканированные страницы — через OCR (только они, в пуле процессов).
+    Функция синхронная и тяжелая по CPU: из async-кода вызывать через asyncio.to_thread.
+    """
+    page_texts = {}
+    scanned = []
+
+    # 1. Постранично определяем, где есть текстовый слой, а где нужен OCR
+    with metrics.stage("pdf_text"), pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        for number, page in enumerate(pdf.pages, start=1):
+            text = page.extract_text() or ""
+            if _page_needs_ocr(page, text):
+                scanned.append(number)
+            page_texts[number] = text
+            # Не копим разобранные объекты страниц в памяти
+            page.close()
+        total_pages = len(pdf.pages)
+
+    # Текстового слоя нет нигде (например, скан из векторной графики) → OCR всех страниц
+    if not scanned and not any(t.strip() for t in page_texts.values()):
+        scanned = list(range(1, total_pages + 1))
+    metrics.PDF_PAGES.inc(total_pages - len(scanned), kind="text")
+
+    # 2. Рендерим и распознаем только сканированные страницы
+    if scanned:
+        with metrics.stage("ocr"):
+            for number, text in ocr_pages(pdf_bytes, scanned):
+                if text.strip():
+                    page_texts[number] = text
+        metrics.PDF_PAGES.inc(len(scanned), kind="ocr")
+
+    # 3. Собираем текст в порядке страниц
+    full_text = [page_texts[n] for n in range(1, total_pages + 1) if page_texts.get(n)]
+    raw_text = "\n".join(full_text)
+    return re.sub(r'\n{3,}', '\n\n', raw_text).strip()
+
+async def extract_resume_data_from_pdf(
+    pdf_bytes,  # содержимое PDF-файла
     client,
     system_prompt: str,
-    model: str = "gpt-4o-mini"
+    model: str = "gpt-4o-mini",
+    user_id=None
 ) -> str:
     """
     Извлекает резюме из PDF через pdfplumber (текст) и прогоняет через GPT для структуры.
 
-    :param pdf_file: файл PDF (Streamlit uploaded_file или путь к файлу)
-    :param client: openai.OpenAI client
+    :param pdf_bytes: содержимое PDF-файла
+    :param client: LLMGateway (llm.py)
     :param system_prompt: system prompt для GPT
     :param model: модель GPT
+    :param user_id: id пользователя Telegram для лимита запросов
     :return: структурированное резюме в markdown
     """
-    full_text = []
-
-    # Открываем PDF через pdfplumber
-    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text()
-            if text:
-                full_text.append(text)
-                
-    # Если текст не найден на страницах → можно пробовать OCR
-    if not full_text:
-        # конвертируем PDF в изображения через PIL (pytesseract работает с изображениями)
-        from pdf2image import convert_from_bytes
-        images = convert_from_bytes(pdf_bytes, dpi=300)
-        for img in images:
-            text = pytesseract.image_to_string(
-                img,
-                lang="rus+eng",
-                config="--psm 6"
-            )
-            if text:
-                full_text.append(text)
-
-    raw_text = "\n".join(full_text)
-    raw_text = re.sub(r'\n{3,}', '\n\n', raw_text).strip()
+    # Разбор PDF и OCR не должны блокировать event loop
+    raw_text = await asyncio.to_thread(extract_pdf_text, pdf_bytes)
+    # Без колонтитулов, повторов и лишнего — в пределах бюджета токенов
+    raw_text = await asyncio.to_thread(compaction.compact, raw_text, "raw", model)
 
     # Прогоняем через GPT для структурирования и markdown
-    response = client.chat.completions.create(
+    content = await client.complete(
         model=model,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": f"Текст резюме:\n\n{raw_text}"}
         ],
+        user_id=user_id,
         temperature=0,
         max_tokens=1200
     )
 
-    return response.choices[0].message.content.strip()
\ No newline at end of file
+    return content.strip()
\ No newline at end of file
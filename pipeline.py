@@ -0,0 +1,172 @@
+import time
+import asyncio
+import logging
+import metrics
+
+_DONE = object()
+
+
+class Stage:
+    """
+    Этап конвейера: асинхронная функция над одним элементом и число параллельных воркеров.
+    Функция возвращает результат для следующего этапа, список или асинхронный генератор
+    (один элемент превращается в несколько, например ZIP-архив) или None (элемент отброшен).
+    Генератор читается по мере того, как следующий этап забирает элементы.
+
+    batch_size > 1 — пакетный этап: функция получает список до batch_size элементов
+    (сколько накопилось в очереди, ожидание добора — не дольше batch_wait секунд)
+    и возвращает список результатов той же длины; None в списке — элемент отброшен.
+    """
+
+    def __init__(self, name, func, concurrency=1, batch_size=1, batch_wait=0.5):
+        self.name = name
+        self.func = func
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+
+
+class PipelineResult:
+    def __init__(self, stages):
+        self.results = []   # выход последнего этапа
+        self.errors = []    # (имя этапа, элемент, исключение)
+        self.stats = {s.name: {"done": 0, "failed": 0, "active": 0} for s in stages}
+
+
+async def run_pipeline(items, stages, queue_size=50, on_progress=None):
+    """
+    Прогоняет элементы через этапы, связанные ограниченными очередями.
+    Каждый этап работает со своей степенью параллелизма; заполненная очередь
+    притормаживает предыдущий этап, поэтому в памяти одновременно не больше
+    queue_size элементов между этапами.
+
+    :param items: итерируемый (или асинхронно итерируемый) набор входных элементов
+    :param stages: список Stage
+    :param queue_size: размер очереди перед каждым этапом
+    :param on_progress: async-функция(stats), вызывается после каждого элемента
+    :return: PipelineResult
+    """
+    result = PipelineResult(stages)
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+
+    async def notify():
+        if on_progress:
+            try:
+                await on_progress(result.stats)
+            except Exception as e:
+                logging.warning("Pipeline progress callback failed: %s", e)
+
+    async def feed():
+        if hasattr(items, "__aiter__"):
+            async for item in items:
+                await queues[0].put(item)
+        else:
+            for item in items:
+                await queues[0].put(item)
+        for _ in range(stages[0].concurrency):
+            await queues[0].put(_DONE)
+
+    async def run_stage(index, stage):
+        stats = result.stats[stage.name]
+        out = queues[index + 1] if index + 1 < len(stages) else None
+
+        async def put(value):
+            if out is not None:
+                await out.put(value)
+            else:
+                result.results.append(value)
+
+        async def emit(item, output):
+            if output is None:
+                return
+            if hasattr(output, "__aiter__"):
+                # Заполненная очередь следующего этапа приостанавливает генератор
+                try:
+                    async for value in output:
+                        await put(value)
+                except Exception as e:
+                    logging.warning("Pipeline stage '%s' failed: %s", stage.name, e)
+                    stats["failed"] += 1
+                    result.errors.append((stage.name, item, e))
+                return
+            for value in (output if isinstance(output, list) else [output]):
+                await put(value)
+
+        async def process(item):
+            stats["active"] += 1
+            started = time.perf_counter()
+            try:
+                output = await stage.func(item)
+            except Exception as e:
+                logging.warning("Pipeline stage '%s' failed: %s", stage.name, e)
+                stats["failed"] += 1
+                result.errors.append((stage.name, item, e))
+                output = None
+            else:
+                stats["done"] += 1
+            finally:
+                stats["active"] -= 1
+                metrics.PIPELINE_SECONDS.observe(time.perf_counter() - started, stage=stage.name)
+            await emit(item, output)
+            await notify()
+
+        async def process_batch(batch):
+            stats["active"] += len(batch)
+            started = time.perf_counter()
+            try:
+                outputs = await stage.func(batch)
+            except Exception as e:
+                logging.warning("Pipeline stage '%s' failed for %d items: %s", stage.name, len(batch), e)
+                stats["failed"] += len(batch)
+                result.errors.extend((stage.name, item, e) for item in batch)
+                outputs = []
+            else:
+                stats["done"] += len(batch)
+            finally:
+                stats["active"] -= len(batch)
+                metrics.PIPELINE_SECONDS.observe(time.perf_counter() - started, stage=stage.name)
+            for item, output in zip(batch, outputs):
+                await emit(item, output)
+            await notify()
+
+        async def next_item(wait):
+            try:
+                return queues[index].get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+            try:
+                return await asyncio.wait_for(queues[index].get(), wait)
+            except asyncio.TimeoutError:
+                return None
+
+        async def worker():
+            while True:
+                item = await queues[index].get()
+                if item is _DONE:
+                    return
+                if stage.batch_size == 1:
+                    await process(item)
+                    continue
+
+                # Добираем пачку из того, что уже есть или вот-вот придет в очередь
+                batch, finished = [item], False
+                while len(batch) < stage.batch_size:
+                    extra = await next_item(stage.batch_wait)
+                    if extra is None:
+                        break
+                    if extra is _DONE:
+                        finished = True
+                        break
+                    batch.append(extra)
+                await process_batch(batch)
+                if finished:
+                    return
+
+        await asyncio.gather(*(worker() for _ in range(stage.concurrency)))
+        # Этап завершен: сигнализируем всем воркерам следующего
+        if out is not None:
+            for _ in range(stages[index + 1].concurrency):
+                await out.put(_DONE)
+
+    await asyncio.gather(feed(), *(run_stage(i, s) for i, s in enumerate(stages)))
+    return result
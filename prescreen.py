@@ -0,0 +1,259 @@
+import os
+import re
+import zlib
+import time
+import logging
+import threading
+import numpy as np
+import metrics
+
+# Предварительный отбор без GPT: векторы вакансий и кандидатов хранятся в таблице embeddings
+# той же базы (hr_assistant.db), а в памяти держится матрица NumPy на каждый вид записей.
+# Сходство — косинус (векторы нормированы, поэтому это одно умножение матрицы на вектор).
+# Векторизатор подключаемый (set_embedder); по умолчанию — хэширование слов и их n-грамм, без сети.
+
+PRESCREEN_DIM = int(os.getenv("PRESCREEN_DIM", "1024"))
+# Сколько резюме пакета идет в GPT; 0 — все (по умолчанию отбор выключен: он меняет результат пакета)
+PRESCREEN_TOP_K = int(os.getenv("PRESCREEN_TOP_K", "0"))
+# Секунды, после которых загруженный индекс сверяется с базой: записи могли добавить
+# или удалить другие процессы бота (режим webhook)
+PRESCREEN_REFRESH = float(os.getenv("PRESCREEN_REFRESH", "10"))
+
+KINDS = ("vacancy", "candidate")
+
+STOP_WORDS = {
+    "для", "что", "как", "это", "или", "при", "так", "все", "его", "она", "они", "уже", "без",
+    "над", "под", "про", "где", "чем", "том", "также", "and", "the", "for", "with",
+}
+_WORD_RE = re.compile(r'[^\W\d_]{2,}|\d+[^\W\d_]+', re.U)
+
+
+class HashingEmbedder:
+    """
+    Вектор текста: слова и символьные триграммы слов (окончания русских слов различаются,
+    а триграммы у «разработчик» и «разработка» общие) хэшируются в dim корзин со знаком.
+    Веса — log(1 + частота), вектор нормируется. Не требует обучения, поэтому векторы
+    добавляются по одному и не пересчитываются при росте базы.
+    """
+
+    def __init__(self, dim=PRESCREEN_DIM):
+        self.dim = dim
+        self.name = f"hash-{dim}-v1"   # хранится вместе с вектором; другой векторизатор — пересчет
+
+    def _features(self, text):
+        for word in _WORD_RE.findall(text.lower()):
+            if word in STOP_WORDS:
+                continue
+            yield word
+            padded = f"<{word}>"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3]
+
+    def embed(self, texts):
+        """Список текстов -> матрица (len(texts), dim) float32 с нормированными строками."""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            # crc32, а не hash(): встроенный хэш строк меняется от запуска к запуску
+            hashes = np.fromiter((zlib.crc32(f.encode()) for f in self._features(text or "")), dtype=np.uint32)
+            if not hashes.size:
+                continue
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+            counts = np.bincount((hashes % self.dim).astype(np.intp), weights=signs, minlength=self.dim)
+            matrix[row] = np.sign(counts) * np.log1p(np.abs(counts))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-9)
+
+
+class VectorIndex:
+    """Матрица векторов с id строк; добавление по одному с запасом емкости, поиск top-K."""
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.size = 0
+        self._positions = {}
+        self._lock = threading.Lock()
+        self.last_rowid = 0                 # последняя прочитанная строка embeddings (get_index)
+        self.checked = time.monotonic()     # когда индекс последний раз сверялся с базой
+
+    def add(self, item_id, vector):
+        with self._lock:
+            position = self._positions.get(item_id)
+            if position is None:
+                if self.size == len(self.ids):
+                    # Емкость растет вдвое — добавление в среднем без копирования матрицы
+                    capacity = max(64, self.size * 2)
+                    self.ids = np.resize(self.ids, capacity)
+                    matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+                    matrix[:self.size] = self.matrix[:self.size]
+                    self.matrix = matrix
+                position = self.size
+                self.size += 1
+                self._positions[item_id] = position
+                self.ids[position] = item_id
+            self.matrix[position] = vector
+
+    def remove(self, item_id):
+        with self._lock:
+            position = self._positions.pop(item_id, None)
+            if position is None:
+                return
+            # На место удаленной строки переносим последнюю
+            last = self.size - 1
+            if position != last:
+                self.ids[position] = self.ids[last]
+                self.matrix[position] = self.matrix[last]
+                self._positions[int(self.ids[position])] = position
+            self.size = last
+
+    def id_total(self):
+        with self._lock:
+            return int(self.ids[:self.size].sum())
+
+    def search(self, vector, k=10, ids=None):
+        """[(id, сходство)] по убыванию сходства; ids — искать только среди этих записей."""
+        with self._lock:
+            scores = self.matrix[:self.size] @ vector
+            candidates = self.ids[:self.size]
+        if ids is not None:
+            mask = np.isin(candidates, np.fromiter(ids, dtype=np.int64))
+            scores, candidates = scores[mask], candidates[mask]
+        return [(int(candidates[i]), float(scores[i])) for i in top_k(scores, k)]
+
+
+def top_k(scores, k):
+    """Индексы k наибольших значений по убыванию (argpartition вместо полной сортировки)."""
+    if k <= 0 or not len(scores):
+        return []
+    if k < len(scores):
+        best = np.argpartition(-scores, k - 1)[:k]
+    else:
+        best = np.arange(len(scores))
+    return best[np.argsort(-scores[best], kind="stable")].tolist()
+
+
+_embedder = HashingEmbedder()
+_indexes = {}
+_indexes_lock = threading.Lock()
+_pending = {}   # соединение -> [(вид, id, вектор)]: записи транзакции, которые ждут commit
+
+def set_embedder(embedder):
+    """
+    Подключает другой векторизатор: объект с атрибутами name, dim и методом embed(texts)
+    -> матрица с нормированными строками. Векторы в базе пересчитываются при следующей загрузке индекса.
+    """
+    global _embedder
+    with _indexes_lock:
+        _embedder = embedder
+        _indexes.clear()
+
+def embed(texts):
+    return _embedder.embed(list(texts))
+
+# Тексты для (пере)расчета векторов: записи без вектора текущего векторизатора
+_MISSING_QUERIES = {
+    "vacancy": '''
+        SELECT v.id, v.name || char(10) || COALESCE(v.description, '') FROM vacancies v
+        LEFT JOIN embeddings e ON e.kind = 'vacancy' AND e.item_id = v.id AND e.model = ?
+        WHERE e.item_id IS NULL''',
+    "candidate": '''
+        SELECT c.id, c.resume_text FROM candidates c
+        LEFT JOIN embeddings e ON e.kind = 'candidate' AND e.item_id = c.id AND e.model = ?
+        WHERE e.item_id IS NULL AND c.resume_text IS NOT NULL''',
+}
+
+def _save_vectors(conn, kind, item_ids, vectors):
+    conn.executemany(
+        'INSERT OR REPLACE INTO embeddings (kind, item_id, model, vector) VALUES (?, ?, ?, ?)',
+        [(kind, item_id, _embedder.name, vector.tobytes()) for item_id, vector in zip(item_ids, vectors)]
+    )
+
+def _load(conn, kind, index, model):
+    """Добавляет в индекс строки embeddings, записанные после index.last_rowid (REPLACE дает строке новый rowid)."""
+    for rowid, item_id, blob in conn.execute(
+        'SELECT rowid, item_id, vector FROM embeddings WHERE kind = ? AND model = ? AND rowid > ? ORDER BY rowid',
+        (kind, model, index.last_rowid)
+    ):
+        index.add(item_id, np.frombuffer(blob, dtype=np.float32))
+        index.last_rowid = rowid
+
+def _refresh(conn, kind, index, model):
+    """Догружает векторы из базы. False — записи удалялись, и индекс нужно прочитать заново."""
+    index.checked = time.monotonic()
+    count, last_rowid, id_total = conn.execute(
+        'SELECT COUNT(*), COALESCE(MAX(rowid), 0), TOTAL(item_id) FROM embeddings WHERE kind = ? AND model = ?',
+        (kind, model)
+    ).fetchone()
+    if last_rowid > index.last_rowid:
+        _load(conn, kind, index, model)
+    return index.size == count and index.id_total() == int(id_total)
+
+def get_index(conn, kind):
+    """
+    Индекс вида записей; при первом обращении читается из базы, недостающие векторы досчитываются.
+    Не чаще раза в PRESCREEN_REFRESH секунд индекс сверяется с базой.
+    """
+    with _indexes_lock:
+        embedder = _embedder
+        index = _indexes.get(kind)
+        if index is not None:
+            if time.monotonic() - index.checked < PRESCREEN_REFRESH or _refresh(conn, kind, index, embedder.name):
+                return index
+            logging.info("Prescreen: %s index changed in another process, reloading", kind)
+        index = VectorIndex(embedder.dim)
+        missing = conn.execute(_MISSING_QUERIES[kind], (embedder.name,)).fetchall()
+        if missing:
+            with conn:
+                _save_vectors(conn, kind, [row[0] for row in missing], embedder.embed([row[1] for row in missing]))
+            logging.info("Prescreen: embedded %d %s records", len(missing), kind)
+        _load(conn, kind, index, embedder.name)
+        _indexes[kind] = index
+        return index
+
+def index_record(conn, kind, item_id, text):
+    """
+    Вектор новой или измененной записи пишется в базу в транзакции вызывающего.
+    В загруженный индекс он попадает только после commit(conn): откат не оставит в индексе лишних id.
+    """
+    if not text:
+        return
+    vector = embed([text])[0]
+    _save_vectors(conn, kind, [item_id], [vector])
+    _pending.setdefault(conn, []).append((kind, item_id, vector))
+
+def commit(conn):
+    """Транзакция conn зафиксирована: ее векторы добавляются в загруженные индексы."""
+    records = _pending.pop(conn, ())
+    with _indexes_lock:
+        for kind, item_id, vector in records:
+            index = _indexes.get(kind)
+            if index is not None:
+                index.add(item_id, vector)
+
+def rollback(conn):
+    """Транзакция conn откатилась: ее векторы отбрасываются."""
+    _pending.pop(conn, None)
+
+def forget(kind, item_ids):
+    with _indexes_lock:
+        index = _indexes.get(kind)
+        if index is not None:
+            for item_id in item_ids:
+                index.remove(item_id)
+
+def similar(conn, kind, text, k=10, ids=None):
+    """Записи вида kind, ближайшие к тексту: [(id, сходство)]."""
+    return get_index(conn, kind).search(embed([text])[0], k, ids)
+
+@metrics.timed("prescreen")
+def shortlist(job, resumes, k=PRESCREEN_TOP_K):
+    """
+    Отбор резюме пакета до записи в базу: индексы k самых похожих на вакансию резюме
+    и сходство каждого резюме. k <= 0 — отбор выключен.
+    """
+    vectors = embed([job] + list(resumes))
+    scores = vectors[1:] @ vectors[0]
+    if k <= 0 or k >= len(resumes):
+        return list(range(len(resumes))), scores.tolist()
+    return top_k(scores, k), scores.tolist()
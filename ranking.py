@@ -0,0 +1,129 @@
+import os
+import json
+import asyncio
+import logging
+import datetime
+import compaction
+
+# Пакетная оценка: несколько резюме против одной вакансии в одном запросе к GPT.
+# Порядок сообщений — постоянный системный промпт, затем вакансия, затем список резюме:
+# общий префикс одинаков во всех запросах по вакансии (OpenAI кэширует такой префикс),
+# а промпт и вакансия передаются один раз на пачку, а не на каждого кандидата.
+
+RANK_PROMPT_VERSION = 1   # входит в ключ кэша анализов; увеличить при изменении промпта
+RANK_CONTEXT_TOKENS = int(os.getenv("RANK_CONTEXT_TOKENS", "16000"))   # вход одного запроса
+RANK_RESUME_TOKENS = int(os.getenv("RANK_RESUME_TOKENS", "1200"))      # на одно резюме
+RANK_OUTPUT_TOKENS = int(os.getenv("RANK_OUTPUT_TOKENS", "350"))       # ответ на одного кандидата
+RANK_MAX_BATCH = int(os.getenv("RANK_MAX_BATCH", "8"))
+
+RANK_SYSTEM_PROMPT = """
+Ты — эксперт HR. Тебе передана вакансия и несколько резюме кандидатов, у каждого свой номер.
+Оцени каждого кандидата независимо от остальных:
+- quality: насколько понятно и структурно описаны задачи и достижения (0-10);
+- fit: насколько кандидат подходит под требования вакансии (0-10);
+- experience_years: общий стаж в годах (целое число);
+- analysis: 2-4 предложения, поясняющие оценку, с опорой на опыт за последние годы.
+
+Верни строго JSON без пояснений:
+{"candidates": [{"id": 1, "quality": 7, "fit": 8, "experience_years": 5, "analysis": "..."}]}
+В ответе должны быть все кандидаты из запроса.
+""".strip()
+
+
+def _prefix(job):
+    return f"Сегодня {datetime.datetime.now().year} год.\n\nВАКАНСИЯ:\n{job}\n\nРЕЗЮМЕ КАНДИДАТОВ:\n"
+
+def _resume_block(number, resume):
+    return f"\n### Кандидат {number}\n{resume}\n"
+
+def plan_batches(job, resumes, model=compaction.DEFAULT_MODEL):
+    """
+    Делит резюме на пачки так, чтобы каждая влезла в RANK_CONTEXT_TOKENS вместе с промптом и вакансией,
+    а ответ — в RANK_OUTPUT_TOKENS на кандидата. Возвращает список списков индексов резюме.
+    """
+    fixed = compaction.count_tokens(RANK_SYSTEM_PROMPT + _prefix(job), model)
+    available = max(RANK_CONTEXT_TOKENS - fixed, RANK_RESUME_TOKENS)
+    batches, current, used = [], [], 0
+    for index, resume in enumerate(resumes):
+        cost = compaction.count_tokens(_resume_block(0, resume), model)
+        if current and (used + cost > available or len(current) >= RANK_MAX_BATCH):
+            batches.append(current)
+            current, used = [], 0
+        current.append(index)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def _score(value):
+    return max(0, min(10, round(float(value))))
+
+def to_analysis_text(entry):
+    """Оценка кандидата из JSON -> текст в формате, который разбирает extract_analysis_data."""
+    quality = _score(entry.get("quality", 0))
+    fit = _score(entry.get("fit", 0))
+    lines = [f"АНАЛИЗ: {str(entry.get('analysis', '')).strip()}"]
+    if entry.get("experience_years") is not None:
+        lines.append(f"ОБЩИЙ_СТАЖ: {round(float(entry['experience_years']))}")
+    lines.append(f"Качество_резюме: {quality}/10")
+    lines.append(f"Итоговый_результат: {fit}/10")
+    return "\n".join(lines)
+
+async def rank_batch(llm, job, resumes, model=compaction.DEFAULT_MODEL):
+    """Один запрос на пачку резюме. Возвращает список текстов анализа (None — кандидата нет в ответе)."""
+    content = _prefix(job) + "".join(_resume_block(i, r) for i, r in enumerate(resumes, 1))
+    answer = await llm.complete(
+        model=model,
+        messages=[
+            {"role": "system", "content": RANK_SYSTEM_PROMPT},
+            {"role": "user", "content": content}
+        ],
+        response_format={"type": "json_object"},
+        temperature=0,
+        max_tokens=RANK_OUTPUT_TOKENS * len(resumes) + 100
+    )
+    try:
+        entries = json.loads(answer).get("candidates", [])
+    except (ValueError, AttributeError) as e:
+        logging.warning("Ranking: bad JSON for batch of %d: %s", len(resumes), e)
+        return [None] * len(resumes)
+
+    results = [None] * len(resumes)
+    for entry in entries:
+        try:
+            number = int(entry["id"])
+            if 1 <= number <= len(resumes):
+                results[number - 1] = to_analysis_text(entry)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return results
+
+async def rank_resumes(llm, job, resumes, model=compaction.DEFAULT_MODEL):
+    """
+    Оценивает список резюме по одной вакансии пачками (пачки идут параллельно в пределах лимитов шлюза).
+    Возвращает тексты анализа в порядке резюме; None — кандидата нужно оценить отдельно.
+    """
+    job = await asyncio.to_thread(compaction.compact, job, "job", model)
+    resumes = [
+        await asyncio.to_thread(compaction.compact, r, "resume", model, RANK_RESUME_TOKENS)
+        for r in resumes
+    ]
+    batches = plan_batches(job, resumes, model)
+    outputs = await asyncio.gather(
+        *(rank_batch(llm, job, [resumes[i] for i in batch], model) for batch in batches),
+        return_exceptions=True
+    )
+
+    results = [None] * len(resumes)
+    for batch, output in zip(batches, outputs):
+        if isinstance(output, Exception):
+            logging.warning("Ranking batch of %d failed: %s", len(batch), output)
+            continue
+        for index, analysis in zip(batch, output):
+            results[index] = analysis
+
+    # Сколько токенов ушло бы на тот же промпт и вакансию при отдельных запросах
+    shared = compaction.count_tokens(RANK_SYSTEM_PROMPT + _prefix(job), model)
+    logging.info("Ranking: %d resumes in %d requests, shared prefix %d tokens (saved ~%d)",
+                 len(resumes), len(batches), shared, shared * (len(resumes) - len(batches)))
+    return results
@@ -0,0 +1,137 @@
+import os
+import time
+import asyncio
+import logging
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+# Потоковый вывод ответа GPT: одно сообщение Telegram редактируется по мере генерации,
+# не чаще раза в STREAM_EDIT_INTERVAL секунд (лимит Telegram ~1 правка в секунду на чат).
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+MESSAGE_LIMIT = 4096   # лимит сообщения Telegram — для текста уже с разметкой и экранированием
+CURSOR = " ▌"
+
+
+def _cut(text, limit):
+    """Место разреза текста длиннее limit, по возможности по переносу строки."""
+    cut = text.rfind("\n", 0, limit)
+    return cut if cut >= limit // 2 else limit
+
+
+class MessageStreamer:
+    """
+    Показывает текст по мере генерации, редактируя одно сообщение.
+
+    :param target: сообщение, в чат которого отвечаем (message.answer)
+    :param header: готовая разметка перед текстом (только в первом сообщении)
+    :param wrap: (открытие, закрытие) разметки вокруг текста каждого сообщения, например ("`", "`")
+    :param escape: функция экранирования сгенерированного текста под parse_mode
+    """
+
+    def __init__(self, target, header="", parse_mode=None, escape=None, wrap=("", ""),
+                 placeholder="⌛ Генерирую...", interval=STREAM_EDIT_INTERVAL):
+        self.target = target
+        self.header = header
+        self.parse_mode = parse_mode
+        self.escape = escape
+        self.wrap = wrap
+        self.placeholder = placeholder
+        self.interval = interval
+        self.text = ""
+        self._message = None
+        self._shown = None
+        self._next_edit = 0.0   # первая правка — сразу с первым фрагментом
+
+    def _render(self, text, first=True, cursor=""):
+        body = self.escape(text) if self.escape else text
+        return (self.header if first else "") + self.wrap[0] + body + cursor + self.wrap[1]
+
+    def _chunks(self, text, cursor=""):
+        """
+        Части текста для отдельных сообщений: лимит проверяется на отрисованной части
+        (заголовок, разметка, экранирование), а не на исходном тексте.
+        """
+        chunks, first = [], True
+        while True:
+            limit = max(1, MESSAGE_LIMIT - len(self._render("", first, cursor)))
+            while True:
+                cut = _cut(text, limit) if len(text) > limit else len(text)
+                overflow = len(self._render(text[:cut], first, cursor)) - MESSAGE_LIMIT
+                if overflow <= 0 or limit <= 1:
+                    break
+                limit = max(1, min(limit, cut) - overflow)
+            chunks.append(text[:cut])
+            text = text[cut:].lstrip("\n")
+            if not text:
+                return chunks
+            first = False
+
+    async def start(self, message=None):
+        """Отправляет заглушку; message — продолжить в уже отправленном сообщении (например, «в очереди»)."""
+        self._message = message or await self.target.answer(self.placeholder)
+
+    async def feed(self, delta):
+        """Добавляет фрагмент; сообщение правится, только если прошел интервал."""
+        self.text += delta
+        if time.monotonic() < self._next_edit or not self.text.strip():
+            return
+        # Пока идет генерация, показывается только то, что влезает в первое сообщение
+        preview = self._chunks(self.text, cursor=" …" + CURSOR)[0]
+        await self._edit(self._render(preview + (" …" if preview != self.text else ""), cursor=CURSOR))
+
+    async def _edit(self, rendered, reply_markup=None, final=False, plain=None):
+        if rendered == self._shown and reply_markup is None:
+            return
+        for _ in range(3 if final else 1):
+            try:
+                await self._message.edit_text(rendered, parse_mode=self.parse_mode, reply_markup=reply_markup)
+                self._shown = rendered
+                break
+            except TelegramRetryAfter as e:
+                # Превысили лимит правок: промежуточные пропускаем, финальную ждем
+                self._next_edit = time.monotonic() + e.retry_after
+                if not final:
+                    return
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest as e:
+                if "not modified" in str(e):
+                    break
+                if not final:
+                    logging.warning("Stream edit failed: %s", e)
+                    break
+                # Разметка не разобралась — показываем как есть
+                try:
+                    await self._message.edit_text(self.header + (plain if plain is not None else self.text),
+                                                  reply_markup=reply_markup)
+                except (TelegramBadRequest, TelegramRetryAfter) as e:
+                    logging.warning("Stream final edit failed: %s", e)
+                break
+        self._next_edit = time.monotonic() + self.interval
+
+    async def _send(self, chunk, reply_markup=None):
+        """Продолжение длинного ответа отдельным сообщением, с теми же повторами и запасным вариантом."""
+        for _ in range(3):
+            try:
+                await self.target.answer(self._render(chunk, first=False), parse_mode=self.parse_mode,
+                                         reply_markup=reply_markup)
+                return
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest as e:
+                logging.warning("Stream message failed, sending plain text: %s", e)
+                try:
+                    await self.target.answer(chunk, reply_markup=reply_markup)
+                except (TelegramBadRequest, TelegramRetryAfter) as e:
+                    logging.warning("Stream plain message failed: %s", e)
+                return
+
+    async def finish(self, text=None, reply_markup=None):
+        """Финальный текст целиком; длинный ответ продолжается отдельными сообщениями."""
+        if text is not None:
+            self.text = text
+        if self._message is None:
+            await self.start()
+        chunks = self._chunks(self.text)
+        last = len(chunks) - 1
+        await self._edit(self._render(chunks[0]), reply_markup if last == 0 else None, final=True, plain=chunks[0])
+        for i, chunk in enumerate(chunks[1:], 1):
+            await self._send(chunk, reply_markup if i == last else None)
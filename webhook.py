@@ -0,0 +1,231 @@
+import os
+import json
+import zlib
+import asyncio
+import logging
+import multiprocessing
+import aiohttp
+from aiohttp import web
+import metrics
+
+# Режим webhook: python webhook.py
+# Принимающий процесс (aiohttp) получает обновления Telegram и пересылает их в один из
+# WEBHOOK_WORKERS процессов бота. Номер процесса считается по id пользователя, поэтому
+# все обновления пользователя попадают в один процесс (там его замки и лимиты LLM).
+# Процессы делят базу hr_assistant.db и хранилище FSM в ней (fsm_storage.py).
+# Очередь задач и обходы HH общие: их выполняет процесс, взявший задание в аренду.
+# Очистку FSM выполняет только процесс 0. Лимиты запросов к HH и OpenAI делятся между процессами
+# (share_limits), индекс prescreen каждый процесс сверяет с базой (PRESCREEN_REFRESH).
+# GET /metrics принимающего процесса — метрики всех процессов бота с меткой worker.
+
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")          # внешний адрес, например https://bot.example.com; без него webhook не регистрируется
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")    # сверяется с заголовком X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", str(os.cpu_count() or 1)))
+WEBHOOK_WORKER_PORT = int(os.getenv("WEBHOOK_WORKER_PORT", "8100"))   # процесс i слушает порт +i на 127.0.0.1
+FORWARD_RETRY_TIME = 30.0   # секунды ожидания процесса, который (пере)запускается
+FORWARD_TIMEOUT = 30.0      # секунды на одну пересылку обновления в процесс бота
+# Процесс бота подтверждает обновление после обработки, но ждет ее не дольше WORKER_ACK_TIME
+# (меньше FORWARD_TIMEOUT, иначе пересылка сочтется неудачной и обновление обработается дважды).
+# Окно потерь: обновление, которое обрабатывается дольше, подтверждается до конца обработки,
+# и если процесс упадет после подтверждения, Telegram его не пришлет повторно.
+WORKER_ACK_TIME = 20.0
+
+
+def update_user_id(update):
+    """id пользователя из обновления любого типа (message, callback_query, ...), иначе id чата."""
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if isinstance(user, dict) and "id" in user:
+            return user["id"]
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return update.get("update_id", 0)
+
+def worker_for(user_id, workers=WEBHOOK_WORKERS):
+    return zlib.crc32(str(user_id).encode()) % workers
+
+def share_limits(workers):
+    """
+    Лимиты HH и LLM заданы на весь бот, а ограничители у каждого процесса свои: процессы получают
+    доли через окружение (оно наследуется при запуске). Лимит LLM на пользователя не делится —
+    пользователь всегда попадает в один процесс. Возвращает {переменная: доля}.
+    """
+    import llm
+    import hh_client
+    shares = {
+        "HH_RATE": str(hh_client.HH_RATE / workers),
+        "HH_BURST": str(max(1, hh_client.HH_BURST // workers)),
+        "HH_CONCURRENCY": str(max(1, hh_client.HH_CONCURRENCY // workers)),
+        "LLM_MAX_CONCURRENCY": str(max(1, llm.LLM_MAX_CONCURRENCY // workers)),
+    }
+    os.environ.update(shares)
+    return shares
+
+
+# --- Процесс бота ---
+
+def run_worker(index):
+    """Процесс бота: принимает пересланные обновления на 127.0.0.1:WEBHOOK_WORKER_PORT + index."""
+    logging.basicConfig(level=logging.INFO, format=f"[worker {index}] %(levelname)s %(message)s")
+    import bot
+
+    tasks = set()
+
+    async def handle_update(request):
+        update = await request.json()
+        task = asyncio.create_task(bot.dp.feed_raw_update(bot.bot, update))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        # Отвечаем после обработки: если процесс упадет раньше, обновление перешлют заново.
+        # Долгую обработку (LLM может отвечать десятки секунд) подтверждаем, не дожидаясь, — она идет в фоне
+        done, _ = await asyncio.wait({task}, timeout=WORKER_ACK_TIME)
+        if not done:
+            logging.info("Update %s is still being processed, acknowledging", update.get("update_id"))
+        elif task.exception():
+            logging.error("Update %s failed", update.get("update_id"), exc_info=task.exception())
+        return web.Response(text="ok")
+
+    async def on_startup(app):
+        app["background"] = await bot.startup(primary=index == 0)
+
+    async def on_shutdown(app):
+        if tasks:
+            await asyncio.wait(tasks, timeout=30)
+        await bot.shutdown(app["background"])
+
+    async def handle_health(request):
+        return web.json_response({"worker": index, "in_progress": len(tasks)})
+
+    async def handle_metrics(request):
+        return web.Response(body=metrics.render().encode("utf-8"), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_post("/update", handle_update)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    web.run_app(app, host="127.0.0.1", port=WEBHOOK_WORKER_PORT + index, print=None, access_log=None)
+
+
+# --- Принимающий процесс ---
+
+def start_worker(index):
+    process = multiprocessing.get_context("spawn").Process(target=run_worker, args=(index,), name=f"bot-worker-{index}")
+    process.start()
+    return process
+
+async def supervise(workers):
+    """Перезапускает упавшие процессы бота."""
+    while True:
+        await asyncio.sleep(1)
+        for index, process in enumerate(workers):
+            if not process.is_alive():
+                logging.warning("Worker %d exited with code %s, restarting", index, process.exitcode)
+                workers[index] = start_worker(index)
+
+def make_router_app(workers_count=WEBHOOK_WORKERS):
+    app = web.Application()
+    app["stats"] = {"forwarded": [0] * workers_count, "failed": 0}
+
+    async def handle_webhook(request):
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            raise web.HTTPForbidden()
+        body = await request.read()
+        index = worker_for(update_user_id(json.loads(body)), workers_count)
+        url = f"http://127.0.0.1:{WEBHOOK_WORKER_PORT + index}/update"
+
+        deadline = asyncio.get_running_loop().time() + FORWARD_RETRY_TIME
+        while True:
+            try:
+                async with app["session"].post(url, data=body, headers={"Content-Type": "application/json"}) as response:
+                    if response.status == 200:
+                        app["stats"]["forwarded"][index] += 1
+                        return web.Response(text="ok")
+            except aiohttp.ClientError:
+                pass
+            if asyncio.get_running_loop().time() > deadline:
+                app["stats"]["failed"] += 1
+                # Не 200 — Telegram пришлет обновление повторно
+                raise web.HTTPServiceUnavailable()
+            await asyncio.sleep(0.2)
+
+    async def handle_health(request):
+        return web.json_response({"workers": workers_count, **app["stats"]})
+
+    async def handle_metrics(request):
+        """Метрики всех процессов бота с меткой worker (процесс, который не ответил, пропускается)."""
+        async def fetch(index):
+            try:
+                async with app["session"].get(f"http://127.0.0.1:{WEBHOOK_WORKER_PORT + index}/metrics",
+                                              timeout=aiohttp.ClientTimeout(total=5)) as response:
+                    return index, await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return index, None
+
+        texts = dict(await asyncio.gather(*(fetch(i) for i in range(workers_count))))
+        return web.Response(body=metrics.merge({i: t for i, t in texts.items() if t}).encode("utf-8"),
+                            headers={"Content-Type": metrics.CONTENT_TYPE})
+
+    async def on_startup(app):
+        app["session"] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0, limit_per_host=256),
+            timeout=aiohttp.ClientTimeout(total=FORWARD_TIMEOUT)
+        )
+        if WEBHOOK_URL:
+            await register_webhook()
+
+    async def on_cleanup(app):
+        await app["session"].close()
+
+    app.router.add_post(WEBHOOK_PATH, handle_webhook)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+async def register_webhook():
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    api_url = os.getenv("TELEGRAM_API_URL")
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None
+    webhook_bot = Bot(token=os.getenv("TELEGRAM_BOT_TOKEN"), session=session)
+    try:
+        await webhook_bot.set_webhook(WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                                      drop_pending_updates=False)
+        logging.info("Webhook set to %s%s", WEBHOOK_URL, WEBHOOK_PATH)
+    finally:
+        await webhook_bot.session.close()
+
+def serve():
+    logging.basicConfig(level=logging.INFO)
+    logging.info("Limits per worker: %s", share_limits(WEBHOOK_WORKERS))
+    workers = [start_worker(i) for i in range(WEBHOOK_WORKERS)]
+    app = make_router_app(len(workers))
+
+    async def start_supervisor(app):
+        app["supervisor"] = asyncio.create_task(supervise(workers))
+
+    async def stop_workers(app):
+        app["supervisor"].cancel()
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join(timeout=30)
+
+    app.on_startup.append(start_supervisor)
+    app.on_cleanup.append(stop_workers)
+    logging.info("Webhook router on %s:%d%s, %d workers", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, len(workers))
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    serve()